@@ -3,6 +3,7 @@ import inputs
 import numpy as np
 import plotly.graph_objects as go
 import pandas as pd
+import datetime
 from plotly.subplots import make_subplots
 
 st.header("Model Inputs")
@@ -22,25 +23,62 @@ The method responsible for pulling the weather data is located in the `inputs.py
 in the latitude and longitude of the location, the year, the interval, attributes to be pulled, and a resampling frequency. The method
 sends a GET request to the NREL API. The csv formatted data returned is then cleaned and saved as a parquet file in the `Outputs` folder.
 Below is a years worth of GHI, clearksy GHI, and outside air temperature data plotted.
+The full year is stored as a pyramid of 5-min, hourly and daily (min/mean/max) data next to the weather file. Only the
+level that fits the selected window is plotted, zoom in with the slider below to load finer data.
 '''
-weather_df = pd.read_parquet('Outputs/weather_data.parquet')
+weather_start = datetime.datetime(2022, 1, 1)
+weather_end = datetime.datetime(2022, 12, 31, 23, 55)
+window = st.slider(
+    "Time Window",
+    min_value=weather_start,
+    max_value=weather_end,
+    value=(weather_start, weather_end),
+    step=datetime.timedelta(hours=1),
+    format="MMM DD",
+)
 
-@st.cache_data  
-def plot_weather(df):
+@st.cache_data
+def plot_weather(start, end):
+    level = inputs.select_weather_level(start, end)
+    weather_df = inputs.load_weather_level(level, start, end)
     fig = make_subplots(specs=[[{"secondary_y": True}]])
 
+    if level == "5min":
+        ghi, clearsky_ghi, temperature = weather_df['GHI'], weather_df['Clearsky GHI'], weather_df['Temperature']
+    else:
+        ghi, clearsky_ghi, temperature = weather_df['GHI mean'], weather_df['Clearsky GHI mean'], weather_df['Temperature mean']
+        # Min/max band so the aggregated levels still show the daily extremes
+        fig.add_trace(
+            go.Scatter(x=weather_df.index, y=weather_df['GHI max'], line=dict(width=0), showlegend=False, hoverinfo='skip'),
+            secondary_y=False,
+        )
+        fig.add_trace(
+            go.Scatter(x=weather_df.index, y=weather_df['GHI min'], name="GHI min/max", fill='tonexty',
+                       fillcolor='rgba(218,165,32,0.25)', line=dict(width=0)),
+            secondary_y=False,
+        )
+        fig.add_trace(
+            go.Scatter(x=weather_df.index, y=weather_df['Temperature max'], line=dict(width=0), showlegend=False, hoverinfo='skip'),
+            secondary_y=True,
+        )
+        fig.add_trace(
+            go.Scatter(x=weather_df.index, y=weather_df['Temperature min'], name="Temperature min/max", fill='tonexty',
+                       fillcolor='rgba(0,128,0,0.15)', line=dict(width=0)),
+            secondary_y=True,
+        )
+
     fig.add_trace(
-        go.Scatter(x=weather_df.index, y=weather_df['GHI'], name="GHI", line=dict(color="goldenrod")),
+        go.Scatter(x=weather_df.index, y=ghi, name="GHI", line=dict(color="goldenrod")),
         secondary_y=False,
     )
 
     fig.add_trace(
-        go.Scatter(x=weather_df.index, y=weather_df['Clearsky GHI'], name="Clearsky GHI", visible='legendonly'),
+        go.Scatter(x=weather_df.index, y=clearsky_ghi, name="Clearsky GHI", visible='legendonly'),
         secondary_y=False,
     )
 
     fig.add_trace(
-        go.Scatter(x=weather_df.index, y=weather_df['Temperature'], name="Temperature", line=dict(color="green", dash="dash")),
+        go.Scatter(x=weather_df.index, y=temperature, name="Temperature", line=dict(color="green", dash="dash")),
         secondary_y=True,
     )
 
@@ -51,10 +89,12 @@ def plot_weather(df):
     
     fig.update_yaxes(title_text="Irradiance (W/m^2)", secondary_y=False, title_font=dict(color="goldenrod"), tickfont=dict(color="goldenrod"))
     fig.update_yaxes(title_text="Temperature (°C)", secondary_y=True, title_font=dict(color="green"), tickfont=dict(color="green"))
-    return fig
+    return fig, level
     
 with st.spinner("Plotting weather data..."):
-    st.plotly_chart(plot_weather(weather_df), use_container_width=True)
+    weather_fig, weather_level = plot_weather(*window)
+    st.plotly_chart(weather_fig, use_container_width=True)
+    st.caption(f"Showing {weather_level} weather data.")
 
 st.subheader("Geometry")
 '''
@@ -1,7 +1,10 @@
 import streamlit as st
-import pandas as pd
-import main
+import plotting
+import jobs
 import datetime
+import inspect
+import textwrap
+import main
 
 st.header("The Simulation")
 '''
@@ -15,79 +18,11 @@ The simulation takes place within a single for loop. Other than storing the time
 show_code = st.toggle("Show Sim Code")
 
 if show_code:
-    sim_code = '''
-    # ---------------------------------------------- Simulation ------------------------------------------------
-    # Simulation loop in seconds
-    print(f"Starting simulation at {sim_step} intervals...")
-    for i in range(sim_length):
-        # Update sun energy
-        if clouds == 1:
-            sun.irradiance = weather_df.iloc[i]['GHI']
-        elif clouds == -1:
-            sun.irradiance = weather_df.iloc[i]['Clearsky GHI']
-        else:
-            sun.irradiance = 0
-
-        # Add solar energy into the panel
-        energy_to_panel = sun.energy(sim_step_seconds, panel.solar_area())*panel.efficiency
-        panel.fluid.add_energy(energy_to_panel)
-
-        # Pump control
-        if pump_control == 0:
-            pump.flow_rate = 0
-        elif pump_control == 1:
-            pump.flow_rate = flow_rate_max
-        elif pump_control == 2:
-            if supply_pipe.fluid.temperature < tank.fluid.temperature:
-                pump.flow_rate = 0
-            else:
-                pump.flow_rate = flow_rate_max
-
-        # Move and mix the fluids - This updates all fluid temps
-        panel.fluid.mix_with(return_pipe.fluid, pump.flow_rate, sim_step_seconds)
-        supply_pipe.fluid.mix_with(panel.fluid, pump.flow_rate, sim_step_seconds)
-        tank.fluid.mix_with(supply_pipe.fluid, pump.flow_rate, sim_step_seconds)
-        return_pipe.fluid.mix_with(tank.fluid, pump.flow_rate, sim_step_seconds)
-      
-        # Heat loss
-        outside_air.temperature = weather_df.iloc[i]['Temperature']
-        zone_air.temperature = zone_temp + random.uniform(-0.5, 0.5)        
-        if heat_loss:
-            panel_heat_loss = panel.heat_loss(sim_step_seconds)
-            supply_pipe_heat_loss = supply_pipe.heat_loss(sim_step_seconds)
-            tank_heat_loss = tank.heat_loss(sim_step_seconds)
-            return_pipe_heat_loss = return_pipe.heat_loss(sim_step_seconds)
-
-            panel.fluid.lose_energy(panel_heat_loss)    
-            supply_pipe.fluid.lose_energy(supply_pipe_heat_loss)
-            tank.fluid.lose_energy(tank_heat_loss)
-            return_pipe.fluid.lose_energy(return_pipe_heat_loss)
-        else:
-            panel_heat_loss = 0
-            supply_pipe_heat_loss = 0
-            tank_heat_loss = 0
-            return_pipe_heat_loss = 0
-
-        
-        # store temperatures and energies and flows
-        heat_transferred_to_air = (panel_heat_loss + supply_pipe_heat_loss +
-                                    tank_heat_loss + return_pipe_heat_loss)
-        sim_output_data['Time'].append(weather_df.index[i])
-        sim_output_data['Solar Energy'].append(sun.irradiance)
-        sim_output_data['Panel Temperatures'].append(panel.fluid.temperature)
-        sim_output_data['Supply Pipe Temperatures'].append(supply_pipe.fluid.temperature)
-        sim_output_data['Tank Temperatures'].append(tank.fluid.temperature)
-        sim_output_data['Return Pipe Temperatures'].append(return_pipe.fluid.temperature)
-        sim_output_data['Zone Air Temperatures'].append(zone_air.temperature)
-        sim_output_data['Outside Air Temperatures'].append(outside_air.temperature)
-        sim_output_data['Panel Heat Losses'].append(panel_heat_loss)
-        sim_output_data['Supply Pipe Heat Losses'].append(supply_pipe_heat_loss)
-        sim_output_data['Tank Heat Losses'].append(tank_heat_loss)
-        sim_output_data['Return Pipe Heat Losses'].append(return_pipe_heat_loss)
-        sim_output_data['Total Heat Losses'].append(heat_transferred_to_air)
-        sim_output_data['Flow Rates'].append(pump.flow_rate)
-    print("Simulation complete!")
-        '''
+    # The loop is read from main.run_sim so the code shown is always the code that runs
+    source = inspect.getsource(main.run_sim)
+    loop_start = source.index("    # ---------------------------------------------- Simulation")
+    sim_code = textwrap.dedent(source[loop_start:source.index("    # ------------------------------------------------ Outputs")])
+    st.caption("Pump control goes through the pump policies in `policies.py` (or the model predictive controller in `mpc.py` for pump_control 3), built from the system parameters in `system.py`.")
     st.code(sim_code, language='python')
 st.subheader("Inputs")
 '''
@@ -147,29 +82,72 @@ if start <= end:
     end_str = end.strftime("%Y-%m-%d 23:55:00")
 
     sim_step = "5min"
-    DEV = False
 
-    with st.spinner("Running simulation..."):
-        main.run_sim(
-            start=start_str,
-            end=end_str,
-            sim_step=sim_step,
-            clouds=clouds,
-            heat_loss=heat_loss,
-            pump_control=pump_control,
-            flow_rate_max=flow_rate_max,
-            DEV=DEV,
-        )
-
-    results_df = pd.read_parquet("Outputs/thermal-simulation.parquet")
-    fig = main.sim_output_plot(results_df)
+    # Runs in the background so long periods can be followed and cancelled, changing an input cancels the stale run
+    job = jobs.submit_simulation(
+        previous=st.session_state.get("simulation_job"),
+        start=start_str,
+        end=end_str,
+        sim_step=sim_step,
+        clouds=clouds,
+        heat_loss=heat_loss,
+        pump_control=pump_control,
+        flow_rate_max=flow_rate_max,
+    )
+    st.session_state["simulation_job"] = job
+    job.wait(0.5) # short and cached runs show up without a progress bar
+
+    @st.fragment(run_every=0.5)
+    def simulation_progress():
+        if job.state in ("running", "cancelling"):
+            eta = job.eta_seconds
+            text = f"Running simulation... {job.fraction:.0%}" + (f", about {eta:.0f} s left" if eta is not None else "")
+            st.progress(job.fraction, text=text)
+            if st.button("Cancel", disabled=job.state == "cancelling"):
+                job.cancel()
+            # Blocks that arrived since the last refresh are appended to the chart instead of replotting the run
+            stream = st.session_state.get("simulation_stream")
+            if (stream is None or stream[0] is not job) and job.total_steps:
+                stream = (job, plotting.StreamingPlot(start_str, end_str, job.total_steps), [0])
+                st.session_state["simulation_stream"] = stream
+            if stream is not None:
+                _, plot, appended = stream
+                blocks = job.blocks[appended[0]:]
+                for block in blocks:
+                    plot.append(block)
+                appended[0] += len(blocks)
+                if plot.figure is not None:
+                    st.plotly_chart(plot.figure, use_container_width=True)
+        else:
+            st.session_state.pop("simulation_stream", None)
+            st.rerun()
+
+    if job.state in ("running", "cancelling"):
+        simulation_progress()
+        st.stop()
+    if job.state == "cancelled":
+        st.warning("Simulation cancelled.")
+        if st.button("Run again"):
+            del st.session_state["simulation_job"]
+            st.rerun()
+        st.stop()
+    results_df = job.result()
+    with st.spinner("Plotting results..."):
+        fig = plotting.sim_output_plot(results_df)
     st.subheader("Outputs")
     '''
     For more information about output specific simulation outputs and DEV mode refer to the [**README.md** ](https://github.com/aklavo/thermal-simulation).
     '''
     st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"Long runs are plotted with at most {plotting.MAX_POINTS} points per trace. The full resolution results are below and available for download.")
+    st.download_button(
+        "Download full resolution results",
+        results_df.to_csv(index=False),
+        file_name="thermal-simulation.csv",
+        mime="text/csv",
+    )
 else:
     st.error("Start date must be before or equal to end date.")
-
+    st.stop()
 
 st.dataframe(results_df, hide_index=True)
@@ -1,7 +1,10 @@
 import streamlit as st
-import main
+import plotting
+import sim_cache
 import datetime
+import os
 import pandas as pd
+import plotly.express as px
 
 
 
@@ -51,16 +54,15 @@ def simulation_display(disabled_clouds, disabled_pumps, widget_id, cloud_start,
 
         @st.cache_data
         def run_sim_get_plot(clouds, heat_loss, pump_control, flow_rate_max):
-            main.run_sim(
+            results_df = sim_cache.run_sim(
                 clouds=clouds,
                 heat_loss=heat_loss,
                 pump_control=pump_control,
                 flow_rate_max=flow_rate_max,
             )
 
-            results_df = pd.read_parquet("Outputs/thermal-simulation.parquet")
-
-            fig = main.sim_output_plot(results_df)
+            with st.spinner("Plotting results..."):
+                fig = plotting.sim_output_plot(results_df)
             return results_df, fig
         with st.spinner("Running simulation..."):
             results_df, fig = run_sim_get_plot(clouds, heat_loss, pump_control, flow_rate_max)
@@ -127,7 +129,24 @@ The final simulation is that of a controlled flow. Controlled flow in this case
     - If the supply pipe temperature is less than the tank temperature, turn the pump off.
 
 This sequence ensures that the tank only ever losses heat to its surroundings and not due to mixing with colder temperature fluids. Under this control
-the tank temperature can increase day over day despite its losses the the surrounding indoor air. Given more time a multi-objective
-optimization would be considered to determine the optimal flow rate for maximizing tank temperature while minimizing pump runtime. 
+the tank temperature can increase day over day despite its losses the the surrounding indoor air.
+'''
+simulation_display(disabled_clouds=False, disabled_pumps=False, widget_id=4, cloud_start=1, flow_start=2, heat_loss_start=True)
+
+st.subheader("Optimizing the Controlled Flow")
+'''
+Maximizing tank temperature and minimizing pump runtime are competing objectives. `optimize.py` searches the max flow rate and the
+temperature difference the supply pipe needs over the tank before the pump turns on, and traces the Pareto front between the mean tank
+temperature and the pump runtime over the full year of 2022. Every setting on the front is optimal in the sense that neither objective
+can be improved without giving up some of the other.
 '''
-simulation_display(disabled_clouds=False, disabled_pumps=False, widget_id=4, cloud_start=1, flow_start=2, heat_loss_start=True)
\ No newline at end of file
+pareto_path = "Outputs/pareto-front.csv"
+if os.path.exists(pareto_path):
+    front = pd.read_csv(pareto_path)
+    fig = px.scatter(front, x="pump runtime [hrs]", y="tank mean [°C]", color="pump_delta",
+                     hover_data=["flow_rate_max", "pump_delta"], labels={"pump_delta": "Pump ΔT [°C]"})
+    fig.update_traces(mode="lines+markers")
+    st.plotly_chart(fig, use_container_width=True)
+else:
+    st.info(f"""`{pareto_path}` not found. Create it with  
+    `python cli.py --start "2022-01-01 00:00:00" --end "2022-12-31 23:55:00" --optimize`""")
\ No newline at end of file
@@ -1,11 +1,11 @@
 import streamlit as st
-import main
+import results_access
+import rollups
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import os
-from scipy import stats
 
 st.header("Data Analysis")
 '''
@@ -18,19 +18,26 @@ The follow analysis is performed on the full year of 2022, using the default sim
 The purpose of this section is to analyze only the results and deduce insight on tank temperature.
 '''
 
-results_df = pd.read_parquet("Outputs/thermal-simulation-full-year.parquet")
-# Convert to hourly to speed things up
-results_df['Time'] = pd.to_datetime(results_df['Time'])
-results_df.set_index('Time', inplace=True)
-results_df = results_df.resample('h').mean()
-results_df.reset_index(inplace=True)
+results_path = "Outputs/thermal-simulation-full-year.parquet"
+if not os.path.exists(results_path):
+    st.error(f"""`{results_path}` not found. Create it with  
+    `python cli.py --start "2022-01-01 00:00:00" --end "2022-12-31 23:55:00" --output {results_path} --rollups`""")
+    st.stop()
+
+@st.cache_data
+def get_rollups(results_key):
+    # Aggregates, statistics and regressions are precomputed once per result file
+    return rollups.load_rollups(results_path)
+
+summary = get_rollups(results_access.file_key(results_path)) # stat based, the file is only read when it changed
+results_df = summary["hourly"]
 st.subheader("Basic Analysis")
 
-simple_stats = results_df.describe()
-tank_start_temp = results_df["Tank Temperatures"].iloc[0]
-max_tank_start_temp = simple_stats["Tank Temperatures"]["max"]
+simple_stats = summary["describe"]
+tank_start_temp = summary["tank_start"]
+max_tank_start_temp = summary["tank_max"]
 
-time_of_max_tank_start_temp = results_df.loc[results_df["Tank Temperatures"].idxmax(), "Time"]
+time_of_max_tank_start_temp = summary["time_of_tank_max"]
 formatted_time = time_of_max_tank_start_temp.strftime("%B %d at %I:%M %p")
 st.write(f'''The Tank temperature starts at {tank_start_temp:.2f}°C and reaches its maximum 
             at {max_tank_start_temp:.2f}°C on {formatted_time}.''')
@@ -39,16 +46,11 @@ with st.container():
     col1, col2 = st.columns([1, 3], )
     
     with col1:
-        st.dataframe(simple_stats["Tank Temperatures"].transpose())
+        st.dataframe(simple_stats)
     
     with col2:
-        # Add seasonal max tank temperatures
-        results_df['Season'] = pd.to_datetime(results_df['Time']).dt.month.map({12:'Winter', 1:'Winter', 2:'Winter',
-                                                                                3:'Spring', 4:'Spring', 5:'Spring',
-                                                                                6:'Summer', 7:'Summer', 8:'Summer',
-                                                                                9:'Fall', 10:'Fall', 11:'Fall'})
-        
-        seasonal_max = results_df.groupby('Season')['Tank Temperatures'].max()
+        # Seasonal max tank temperatures
+        seasonal_max = summary["seasonal_extrema"]["max"]
         
         metric_col1, metric_col2 = st.columns(2)
         metric_col3, metric_col4 = st.columns(2)
@@ -104,8 +106,7 @@ st.subheader("Parameter Correlation")
 To see how other parameters interact with tank temperature a Pearson's Correlation analysis was performed. 
 '''
 st.latex(r'PCC = \frac{Cov(X,Y)}{\sigma_X \sigma_Y}')
-results_df.drop(columns=["Season"], inplace=True)
-corr = results_df.corr()
+corr = summary["corr"]
 
 corr_plot = px.imshow(corr, labels={'color':'Correlation Coefficient'}, text_auto='.2f', aspect="auto")
 st.plotly_chart(corr_plot, use_container_width=True)
@@ -128,21 +129,14 @@ with st.container():
     This is because when outside air temperatures are the lowest, heat loss dominates the system. This leaves the tank temperature to hover around the indoor zone temperature.
     Since the indoor temperature randomly fluctuates, the tank temperature and tank heat fluctuate around 21.11 °C and 0.0 Joules.
     '''
-    @st.cache_data
-    def get_seasons(results_df):
-        summer = results_df.loc[results_df["Time"].dt.month.isin([6,7,8])]
-        winter = results_df.loc[results_df["Time"].dt.month.isin([12,1,2])]
-        fall = results_df.loc[results_df["Time"].dt.month.isin([9,10,11])]
-        spring = results_df.loc[results_df["Time"].dt.month.isin([3,4,5])]
-        return {"Winter": winter, "Spring": spring, "Summer": summer, "Fall": fall}
-    seasons = get_seasons(results_df)
+    seasons = {season: results_df.loc[results_df["Season"] == season] for season in ["Winter", "Spring", "Summer", "Fall"]}
 
 
     selected_y_axis = st.radio("",options=["Tank Heat Losses", "Supply Pipe Temperatures", "Outside Air Temperatures"], horizontal=True)
  
 with st.spinner("Calculating Regressions..."):
     @st.cache_data
-    def regression_plots(seasons, selected_y_axis):
+    def regression_plots(seasons, regressions, selected_y_axis):
         regression_fig = make_subplots(rows=2, cols=2, subplot_titles=list(seasons.keys()))
 
         colors = {'Winter': 'blue', 'Spring': 'green', 'Summer': 'red', 'Fall': 'orange'}
@@ -160,7 +154,7 @@ with st.spinner("Calculating Regressions..."):
                 row=row, col=col
             )
 
-            slope, intercept, r_value, p_value, std_err = stats.linregress(x, y)
+            slope, intercept, r_value = regressions.loc[(season, selected_y_axis), ["slope", "intercept", "r_value"]]
             line = slope * x + intercept
             r_squared = r_value**2
             equation = f'y = {slope:.2f}x + {intercept:.2f}, R² = {r_squared:.2f}'
@@ -180,4 +174,4 @@ with st.spinner("Calculating Regressions..."):
         return regression_fig
 
 
-    st.plotly_chart(regression_plots(seasons, selected_y_axis), use_container_width=True)
\ No newline at end of file
+    st.plotly_chart(regression_plots(seasons, summary["regressions"], selected_y_axis), use_container_width=True)
\ No newline at end of file
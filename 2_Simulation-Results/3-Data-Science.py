@@ -1,13 +1,15 @@
 import streamlit as st
-from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 import statsmodels.api as sm
-from sklearn.ensemble import RandomForestRegressor
 import pickle
+import os
+import pipeline
+import results_access
+
+results_path = "Outputs/thermal-simulation-full-year.parquet"
+PLOT_POINTS = 20000 # residual plots only draw a subsample of the out-of-fold rows
 
 with st.container():
     st.header("Black Box Modeling")
@@ -27,44 +29,46 @@ with st.container():
     - Solar Energy
     - Outside Air Temperatures
     - Zone Air Temperatures
+
+    Lagged weather is added as well: solar energy and outside air temperature 1, 3, 6 and 24 hours earlier and their
+    6 and 24 hour rolling means. The features are built once per result file and stored in `Outputs/features/`.
     '''
-    results_df = pd.read_parquet("Outputs/thermal-simulation-full-year.parquet")
-    results_df = results_df[
-        [
-            "Time",
-            "Tank Temperatures",
-            "Outside Air Temperatures",
-            "Zone Air Temperatures",
-            "Solar Energy",
-        ]
-    ]
-    # parse the datetime column and add month, day, hour, and minute columns
-    results_df["Time"] = pd.to_datetime(results_df["Time"])
-    results_df["Month"] = results_df["Time"].dt.month
-    results_df["Day"] = results_df["Time"].dt.day
-    results_df["Hour"] = results_df["Time"].dt.hour
-    results_df["Minute"] = results_df["Time"].dt.minute
-    results_df.drop(columns=["Time"], inplace=True)
-    st.dataframe(results_df, hide_index=True)
+    @st.cache_data
+    def preview_features(results_key):
+        # results_key (size and modification time of the results file) reruns this only when the file changes
+        return pipeline.load_features(results_path, rows=1000)
+
+    if os.path.exists(results_path):
+        st.dataframe(preview_features(results_access.file_key(results_path)), hide_index=True)
+    else:
+        st.info(f"""`{results_path}` not found. Create it and train the models with
+        `python cli.py --start "2022-01-01 00:00:00" --end "2022-12-31 23:55:00" --output {results_path} --rollups --models`""")
 with st.container():
     @st.cache_data
-    def display_model_results(predictions, y_test):
+    def load_model_results(name, results_key):
+        # Metrics come from json and only a subsample of the memory-mapped out-of-fold rows is read.
+        # Falls back to the original train_test_split pickles if the pipeline hasn't been run.
+        summary = pipeline.load_metrics(name, results_path) if results_key else None
+        if summary is not None:
+            out_of_fold = pipeline.load_residuals(name)
+            rows = np.asarray(out_of_fold[::max(len(out_of_fold)//PLOT_POINTS, 1)])
+            return summary["overall"], rows[:, 1], rows[:, 0], summary
+        y_test = pickle.load(open("Outputs/y_test.pkl", "rb")).to_numpy()
+        predictions = pickle.load(open("Outputs/predictions.pkl" if name == "linear" else "Outputs/predictions_rf.pkl", "rb"))
+        return pipeline.metrics(y_test, predictions), predictions, y_test, None
+
+    @st.cache_data
+    def display_model_results(model_metrics, predictions, y_test):
         with st.spinner("Displaying Results..."):
             results = st.container()
-            col1, col2 = results.columns([1,5])    
+            col1, col2 = results.columns([1,5])
             residuals = y_test - predictions
 
-            # model performance metrics r2, mse, mae
-            mse = mean_squared_error(y_test, predictions)
-            rmse = np.sqrt(mse)
-            mae = mean_absolute_error(y_test, predictions)
-            r2 = r2_score(y_test, predictions)
-        
             # display metrics as st.metrics
-            col1.metric("MSE:", f"{mse:.2f}")
-            col1.metric("RMSE:", f"{rmse:.2f}")
-            col1.metric("MAE:", f"{mae:.2f}")
-            col1.metric("R2:", f"{r2:.2f}")
+            col1.metric("MSE:", f"{model_metrics['mse']:.2f}")
+            col1.metric("RMSE:", f"{model_metrics['rmse']:.2f}")
+            col1.metric("MAE:", f"{model_metrics['mae']:.2f}")
+            col1.metric("R2:", f"{model_metrics['r2']:.2f}")
 
             # Create a figure with subplots
             fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(6, 2))
@@ -97,65 +101,62 @@ with st.container():
             plt.tight_layout()
 
             results.pyplot(fig)
+
+    def show_folds(summary):
+        if summary is None:
+            st.caption("Pipeline results not found, showing the original random train/test split.")
+            return
+        folds = pd.DataFrame(summary["folds"])
+        folds.index.name = "Fold"
+        st.caption(f"{summary['scheme'].capitalize()} cross-validation, {len(folds)} folds with a {summary['gap']} step gap between train and test rows.")
+        st.dataframe(folds.style.format("{:.2f}"))
+
+    results_key = results_access.file_key(results_path) if os.path.exists(results_path) else None
     st.subheader("Linear Regression")
     '''
     We'll start by using a linear regression model to predict the tank temperature based on the model inputs.
+    A random train/test split over 5-minute rows puts neighbouring time-steps in both sets and overstates accuracy, so the
+    models are evaluated with blocked cross-validation: every test fold is a contiguous part of the year and training rows
+    within a day of it are left out. Folds are fit in parallel by `pipeline.py`.
     '''
     lin_reg_code = '''
-    X = results_df.drop(columns=["Tank Temperatures"])
-    y = results_df["Tank Temperatures"]
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
- 
-    model = LinearRegression().fit(X_train, y_train)
+    features = pipeline.load_features(results_path)
+    X = features[pipeline.feature_columns(features)].to_numpy()
+    y = features["Tank Temperatures"].to_numpy()
 
-    predictions = model.predict(X_test)
-    
+    for train, test in pipeline.blocked_folds(len(y), n_folds=5, gap=288):
+        model = LinearRegression().fit(X[train], y[train])
+        predictions = model.predict(X[test])
     '''
     st.code(lin_reg_code, language="python")
-    # We'll use a linear regression model to predict the tank temperature based on the model inputs
-    # Ran once to get pickle file
-    # X = results_df.drop(columns=["Tank Temperatures"])
-    # y = results_df["Tank Temperatures"]
-    # X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
 
-    y_test = pickle.load(open("Outputs/y_test.pkl", "rb"))
     with st.spinner("Plotting Results..."):
-        # ran once to get pickle file
-        # model = LinearRegression().fit(X_train, y_train)
-        # predictions = model.predict(X_test)
-        # pickle.dump(y_test, open("Outputs/y_test.pkl", "wb"))
-        # pickle.dump(predictions, open("Outputs/predictions.pkl", "wb"))
-
-        predictions = pickle.load(open("Outputs/predictions.pkl", "rb"))
-        display_model_results(predictions, y_test)
+        model_metrics, predictions, y_test, summary = load_model_results("linear", results_key)
+        display_model_results(model_metrics, predictions, y_test)
+        show_folds(summary)
     '''
-    The performance of the linear regression model leaves room for improvement. The R2 of 70% indicates that the model struggles 
-    to explain the variance of 30% of the tank temperatures. It's clear from the plots that this is primarily happening at lower temperatures, 
+    The performance of the linear regression model leaves room for improvement. The R2 indicates that the model struggles 
+    to explain a large part of the variance of the tank temperatures. It's clear from the plots that this is primarily happening at lower temperatures, 
     when tank temperature is no longer strongly correlated with the any model inputs. This aligns with what we know to be true from
     earlier regression analysis. 
 
     '''
     st.subheader("Random Forest")
     forest_code = '''
-    model_rf = RandomForestRegressor().fit(X_train, y_train)
-    predictions_rf = model_rf.predict(X_test) 
+    model_rf = RandomForestRegressor(min_samples_leaf=5, max_samples=0.5).fit(X[train], y[train])
+    predictions_rf = model_rf.predict(X[test])
     '''
     st.code(forest_code, language="python")
 
     with st.spinner("Plotting Results..."):
-        # ran once to get pickle file
-        # model_rf = RandomForestRegressor().fit(X_train, y_train)
-        # predictions_rf = model_rf.predict(X_test)   
-
-        # pickle.dump(predictions_rf, open("Outputs/predictions_rf.pkl", "wb"))
-        predictions_rf = pickle.load(open("Outputs/predictions_rf.pkl", "rb"))
-        
-        display_model_results(predictions_rf, y_test)
+        model_metrics, predictions_rf, y_test, summary = load_model_results("random_forest", results_key)
+        display_model_results(model_metrics, predictions_rf, y_test)
+        show_folds(summary)
     '''
     The random forest model produces more accurate predictions. All error metrics are significantly lower than the linear
-    regression and the R2 is 99%. The residual plot has also greatly improved, showing less clear patterns and a fairly even spread about the
-    zero line. The Q-Q plot shows a significant deviation from the 45 degree line. This indicates that the residuals are not normally distributed. This could be
+    regression. The residual plot has also greatly improved, showing less clear patterns and a fairly even spread about the
+    zero line. The fold table shows the folds at the start and end of the year score much worse: winter tank temperatures barely
+    vary, and a forest can't predict values outside of what it was trained on. The Q-Q plot shows a significant deviation from the 45 degree line. This indicates that the residuals are not normally distributed. This could be
     due to outliers or a sign of unmodeled complexity. Given more time, a deeper residual analysis and additional modeling 
     would be warranted. 
-    '''
\ No newline at end of file
+    '''
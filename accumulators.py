@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+File: accumulators.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Online statistics that are updated every simulation step so summary
+questions can be answered without keeping the raw time-series. Memory is
+O(channels^2) no matter how long the run is.
+- Welford mean/variance and the pairwise covariance matrix
+- Running min/max and the time they happened
+- First/last values, pump-on time and energy totals
+Values can have leading batch dimensions (e.g. one row per ensemble member) and
+partial results from separate runs can be combined with merge().
+"""
+import numpy as np
+import pandas as pd
+
+class StreamingStats:
+  def __init__(self, channels, flow_channel="Flow Rates", loss_suffix="Heat Losses"):
+    self.channels = list(channels)
+    self.flow_index = self.channels.index(flow_channel) if flow_channel in self.channels else None
+    self.loss_indices = [i for i, name in enumerate(self.channels) if name.endswith(loss_suffix)]
+    self.count = 0
+    self.mean = None
+    self.comoment = None # sum of (x - mean_x)(y - mean_y), the diagonal is Welford's M2
+    self.min = None
+    self.max = None
+    self.time_of_min = None
+    self.time_of_max = None
+    self.first = None
+    self.last = None
+    self.first_time = None
+    self.last_time = None
+    self.pump_on_seconds = None
+    self.solar_energy_in = None # [J]
+
+  def _initialize(self, x: np.ndarray):
+    self.mean = np.zeros_like(x)
+    self.comoment = np.zeros(x.shape + (x.shape[-1],))
+    self.min = np.full_like(x, np.inf)
+    self.max = np.full_like(x, -np.inf)
+    self.time_of_min = np.full(x.shape, np.datetime64("NaT"), dtype="datetime64[ns]")
+    self.time_of_max = np.full(x.shape, np.datetime64("NaT"), dtype="datetime64[ns]")
+    self.first = x.copy()
+    self.pump_on_seconds = np.zeros(x.shape[:-1])
+    self.solar_energy_in = np.zeros(x.shape[:-1])
+
+  def update(self, values, time=None, solar_energy_in=0.0, step_seconds=0.0):
+    x = np.asarray(values, dtype=float)
+    if self.mean is None:
+      self._initialize(x)
+      self.first_time = time
+
+    # Welford update of the mean and co-moments
+    self.count += 1
+    delta = x - self.mean
+    self.mean += delta/self.count
+    self.comoment += delta[..., :, None]*(x - self.mean)[..., None, :]
+
+    # Extremes and when they happened
+    time = np.datetime64(time, "ns") if time is not None else np.datetime64("NaT")
+    new_min = x < self.min
+    new_max = x > self.max
+    self.min = np.where(new_min, x, self.min)
+    self.max = np.where(new_max, x, self.max)
+    self.time_of_min[new_min] = time
+    self.time_of_max[new_max] = time
+
+    self.last = x.copy()
+    self.last_time = time
+    if self.flow_index is not None:
+      self.pump_on_seconds += (x[..., self.flow_index] > 0)*step_seconds
+    self.solar_energy_in += solar_energy_in
+
+  def merge(self, other: "StreamingStats"):
+    # Chan et al. parallel combination, other is assumed to follow self in time
+    if other.count == 0:
+      return self
+    if self.count == 0:
+      self.__dict__.update({k: (v.copy() if isinstance(v, np.ndarray) else v) for k, v in other.__dict__.items()})
+      return self
+    count = self.count + other.count
+    delta = other.mean - self.mean
+    self.comoment = (self.comoment + other.comoment +
+                     delta[..., :, None]*delta[..., None, :]*self.count*other.count/count)
+    self.mean = self.mean + delta*other.count/count
+    self.count = count
+
+    new_min = other.min < self.min
+    new_max = other.max > self.max
+    self.min = np.where(new_min, other.min, self.min)
+    self.max = np.where(new_max, other.max, self.max)
+    self.time_of_min = np.where(new_min, other.time_of_min, self.time_of_min)
+    self.time_of_max = np.where(new_max, other.time_of_max, self.time_of_max)
+    self.last = other.last
+    self.last_time = other.last_time
+    self.pump_on_seconds = self.pump_on_seconds + other.pump_on_seconds
+    self.solar_energy_in = self.solar_energy_in + other.solar_energy_in
+    return self
+
+  def variance(self) -> np.ndarray:
+    return np.diagonal(self.covariance(), axis1=-2, axis2=-1)
+
+  def std(self) -> np.ndarray:
+    return np.sqrt(self.variance())
+
+  def covariance(self) -> np.ndarray:
+    return self.comoment/max(self.count - 1, 1)
+
+  def correlation(self) -> np.ndarray:
+    std = self.std()
+    with np.errstate(divide="ignore", invalid="ignore"):
+      return self.covariance()/(std[..., :, None]*std[..., None, :])
+
+  def totals(self) -> np.ndarray:
+    return self.mean*self.count
+
+  def energy_totals(self) -> dict:
+    # [J] solar energy into the panel fluid and heat lost by each component
+    totals = self.totals()
+    energy = {"Solar Energy In": self.solar_energy_in}
+    for i in self.loss_indices:
+      energy[self.channels[i]] = totals[..., i]
+    return energy
+
+  def summary(self) -> pd.DataFrame:
+    # Per channel table for a single (unbatched) run
+    if self.mean.ndim != 1:
+      raise ValueError("summary() is only available for unbatched statistics.")
+    return pd.DataFrame({
+      "first": self.first,
+      "last": self.last,
+      "mean": self.mean,
+      "std": self.std(),
+      "min": self.min,
+      "time of min": self.time_of_min,
+      "max": self.max,
+      "time of max": self.time_of_max,
+    }, index=self.channels)
+
+  def covariance_frame(self) -> pd.DataFrame:
+    return pd.DataFrame(self.covariance(), index=self.channels, columns=self.channels)
+
+  def correlation_frame(self) -> pd.DataFrame:
+    return pd.DataFrame(self.correlation(), index=self.channels, columns=self.channels)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+"""
+File: calibration.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Calibration of the system parameters against measured temperatures
+from an installed system. Heat transfer coefficients, panel efficiency and
+insulation thickness (or any differentiable parameter) are fit to measured tank,
+panel and pipe temperatures by nonlinear least squares.
+- Parameters are fit in log space, so they stay positive and steps are relative
+- Pump switching makes the cost surface bumpy, so a Sobol set of candidate
+  parameters is screened in one batch engine run and least squares is started
+  from the best few on parallel workers
+- Every least squares evaluation is one forward-mode run of the engine
+  (gradients.TangentEngine) that returns the residuals and their Jacobian
+  together, instead of one extra run per parameter
+- Weather is read once and shared by every evaluation; several installed
+  systems are calibrated on parallel workers
+- Robust losses (soft_l1, huber, cauchy, arctan) down-weight sensor glitches
+- Fitted values come with standard errors, 95% intervals, the parameter
+  correlation matrix and residual diagnostics. The covariance is built from the
+  unscaled residuals, with IRLS weights (approximate) for the robust losses, and
+  parameters along directions the data can't resolve are flagged unidentifiable
+"""
+import numpy as np
+import pandas as pd
+import engine
+import gradients
+import inputs
+import system
+
+PARAMETERS = [
+    "air_heat_transfer_coeff_inside", "air_heat_transfer_coeff_outside", "water_in_pipe_heat_transfer_coeff",
+    "efficiency", "insulation_thickness",
+]
+LOSSES = ["linear", "soft_l1", "huber", "cauchy", "arctan"]
+
+def load_measurements(path) -> pd.DataFrame:
+    # csv or parquet with a Time column (or index) and any of the temperature columns of run_sim
+    measured = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+    if "Time" in measured.columns:
+        measured = measured.set_index(pd.to_datetime(measured["Time"])).drop(columns="Time")
+    columns = [column for column in measured.columns if column in engine.TEMPERATURE_COLUMNS]
+    if not columns:
+        raise ValueError(f"No measured temperatures found, expected some of {engine.TEMPERATURE_COLUMNS}")
+    return measured[columns].sort_index()
+
+def align(measured: pd.DataFrame, weather_df: pd.DataFrame) -> pd.DataFrame:
+    # Measurements on the simulation time-steps, readings further than half a step from any step are dropped
+    step = weather_df.index[1] - weather_df.index[0]
+    return measured.reindex(weather_df.index, method="nearest", tolerance=step/2)
+
+class Objective:
+    # Residuals (simulated - measured) and their Jacobian in log parameter space from one tangent run
+    def __init__(self, weather_df, measured, params, parameters, initial="measured", seed=0, smoothing=0.0):
+        self.weather_df = weather_df
+        self.ghi, self.clear_ghi, self.oa_temp = engine.weather_arrays(weather_df)
+        self.hours = weather_df.index.hour.to_numpy()
+        self.step_seconds = (weather_df.index[1] - weather_df.index[0]).total_seconds()
+        self.measured = align(measured, weather_df)
+        self.rows = [engine.FLUIDS[engine.TEMPERATURE_COLUMNS.index(column)] for column in self.measured.columns]
+        self.rows = [engine.FLUIDS.index(row) for row in self.rows]
+        self.values = self.measured.to_numpy(dtype=float)
+        self.mask = ~np.isnan(self.values)
+        self.params = params
+        self.parameters = list(parameters)
+        self.initial = initial
+        self.seed = seed
+        self.smoothing = smoothing
+        self.evaluations = 0
+        self._last = (None, None, None)
+
+    def scenario(self, theta) -> dict:
+        return dict(self.params, **dict(zip(self.parameters, np.exp(theta))))
+
+    def initial_temperatures(self, temperatures) -> np.ndarray:
+        # Start from the first reading of every measured container
+        first = self.measured.bfill().iloc[0]
+        temperatures = temperatures.copy()
+        for row, column in zip(self.rows, self.measured.columns):
+            if not np.isnan(first[column]):
+                temperatures[row] = first[column]
+        return temperatures
+
+    def simulate(self, theta):
+        sim = gradients.TangentEngine([self.scenario(theta)], self.step_seconds, self.parameters, self.seed, self.smoothing)
+        if self.initial == "measured":
+            sim.set_temperatures(self.initial_temperatures(sim.temperatures[:, 0]))
+
+        simulated = np.full(self.values.shape, np.nan)
+        tangents = np.zeros(self.values.shape + (len(self.parameters),))
+        for i in range(len(self.weather_df)):
+            sim.step(self.ghi[i], self.clear_ghi[i], self.oa_temp[i], hour=self.hours[i])
+            if self.mask[i].any():
+                simulated[i] = sim.temperatures[self.rows, 0]
+                tangents[i] = sim.d_temperatures[:, self.rows, 0].T
+        self.evaluations += 1
+        return simulated, tangents
+
+    def _evaluate(self, theta):
+        if self._last[0] is None or not np.array_equal(self._last[0], theta):
+            simulated, tangents = self.simulate(theta)
+            residuals = (simulated - self.values)[self.mask]
+            # d/dlog(p) = p*d/dp
+            jacobian = tangents[self.mask]*np.exp(theta)
+            self._last = (theta.copy(), residuals, jacobian)
+        return self._last[1], self._last[2]
+
+    def residuals(self, theta) -> np.ndarray:
+        return self._evaluate(theta)[0]
+
+    def jacobian(self, theta) -> np.ndarray:
+        return self._evaluate(theta)[1]
+
+def robust_cost(residuals, loss="linear", f_scale=1.0, axis=0):
+    # Same cost as scipy's least_squares: 0.5*f_scale^2*sum(rho((r/f_scale)^2))
+    z = (residuals/f_scale)**2
+    rho = {
+        "linear": lambda z: z,
+        "soft_l1": lambda z: 2*(np.sqrt(1 + z) - 1),
+        "huber": lambda z: np.where(z <= 1, z, 2*np.sqrt(z) - 1),
+        "cauchy": np.log1p,
+        "arctan": np.arctan,
+    }[loss]
+    return 0.5*f_scale**2*np.nansum(rho(z), axis=axis)
+
+def robust_weights(residuals, loss="linear", f_scale=1.0) -> np.ndarray:
+    # rho'(z) of robust_cost, the weight a robust loss gives every residual
+    z = (residuals/f_scale)**2
+    return {
+        "linear": lambda z: np.ones_like(z),
+        "soft_l1": lambda z: 1/np.sqrt(1 + z),
+        "huber": lambda z: np.where(z <= 1, 1.0, 1/np.sqrt(np.maximum(z, 1))),
+        "cauchy": lambda z: 1/(1 + z),
+        "arctan": lambda z: 1/(1 + z**2),
+    }[loss](z)
+
+def screen(objective: Objective, thetas, loss="linear", f_scale=1.0) -> np.ndarray:
+    # Robust cost of many parameter sets from one batch engine run
+    sim = engine.BatchEngine([objective.scenario(theta) for theta in thetas], objective.step_seconds, objective.seed)
+    if objective.initial == "measured":
+        sim.set_temperatures(objective.initial_temperatures(sim.temperatures[:, 0]))
+    cost = np.zeros(sim.n)
+    for i in range(len(objective.weather_df)):
+        sim.step(objective.ghi[i], objective.clear_ghi[i], objective.oa_temp[i], hour=objective.hours[i])
+        if objective.mask[i].any():
+            cost += robust_cost(sim.temperatures[objective.rows] - objective.values[i][:, None], loss, f_scale)
+    return cost
+
+def diagnostics(residuals: pd.DataFrame) -> pd.DataFrame:
+    rows = {}
+    for column in residuals.columns:
+        r = residuals[column].dropna().to_numpy()
+        rows[column] = {
+            "rmse": np.sqrt(np.mean(r**2)),
+            "mae": np.mean(np.abs(r)),
+            "bias": np.mean(r),
+            "max": np.max(np.abs(r)),
+            "lag-1 autocorrelation": np.corrcoef(r[1:], r[:-1])[0, 1] if len(r) > 2 and np.var(r) > 0 else np.nan,
+            "durbin-watson": np.sum(np.diff(r)**2)/np.sum(r**2) if np.sum(r**2) > 0 else np.nan,
+            "n": len(r),
+        }
+    return pd.DataFrame(rows).T
+
+class CalibrationResult:
+    def __init__(self, fitted, correlation, residuals, diagnostics, params, summary):
+        self.fitted = fitted # initial and fitted value, standard error and 95% interval of every parameter,
+                             # parameters the measurements can't resolve get an infinite error and no interval
+        self.correlation = correlation # correlation of the fitted parameters
+        self.residuals = residuals # simulated - measured on the simulation time-steps
+        self.diagnostics = diagnostics # residual statistics per measured column
+        self.params = params # full system parameters with the fitted values
+        self.summary = summary # cost, evaluations, convergence
+
+def _refine(objective, theta, low, high, loss, f_scale, max_evaluations):
+    # Returns the fit and the simulations it took, the objective may be shared with other starts (n_jobs=1)
+    from scipy.optimize import least_squares
+    before = objective.evaluations
+    fit = least_squares(objective.residuals, theta, jac=objective.jacobian, bounds=(low, high), loss=loss,
+                        f_scale=f_scale, x_scale="jac", max_nfev=max_evaluations)
+    return fit, objective.evaluations - before
+
+def calibrate(measured: pd.DataFrame, weather_df=None, params=None, parameters=PARAMETERS, bounds=None, loss="soft_l1",
+              f_scale=1.0, initial="measured", n_candidates=256, n_starts=4, max_evaluations=50, n_jobs=-1,
+              seed=0) -> CalibrationResult:
+    # f_scale is the residual [°C] beyond which a robust loss starts to down-weight.
+    # Pump switching makes the cost surface bumpy, so n_candidates parameter sets are screened in one batch run
+    # and least squares is started from the n_starts best of them on parallel workers.
+    from joblib import Parallel, delayed
+    from scipy.stats import qmc
+
+    if loss not in LOSSES:
+        raise ValueError(f"loss must be one of {LOSSES}")
+    if weather_df is None:
+        weather_df = inputs.load_weather(start=measured.index[0], end=measured.index[-1])
+    # Zone temperature noise would make the objective random
+    params = system.make_params(dict({"zone_temp_noise": 0.0}, **(params or {})))
+    start = np.array([params[name] for name in parameters], dtype=float)
+    bounds = bounds or {name: (value/10, min(value*10, 1.0) if name == "efficiency" else value*10)
+                        for name, value in zip(parameters, start)}
+    low = np.log([bounds[name][0] for name in parameters])
+    high = np.log([bounds[name][1] for name in parameters])
+
+    objective = Objective(weather_df, measured, params, parameters, initial, seed)
+    candidates = np.vstack([np.clip(np.log(start), low, high),
+                            low + qmc.Sobol(len(parameters), seed=seed).random(n_candidates)*(high - low)])
+    costs = screen(objective, candidates, loss, f_scale)
+    starts = candidates[np.argsort(costs)[:n_starts]]
+    fits = Parallel(n_jobs=min(n_jobs, len(starts)) if n_jobs > 0 else n_jobs)(
+        delayed(_refine)(objective, theta, low, high, loss, f_scale, max_evaluations) for theta in starts)
+    fit = min((fit for fit, _ in fits), key=lambda fit: fit.cost)
+
+    # Gauss-Newton covariance in log space from the unscaled residuals and Jacobian at the fit (least_squares
+    # returns them rescaled by the robust loss). Robust losses weight every residual by rho'(z) of the fit (IRLS),
+    # so their intervals are approximate.
+    residual = objective.residuals(fit.x)
+    jacobian = objective.jacobian(fit.x)
+    weights = robust_weights(residual, loss, f_scale)
+    dof = max(len(residual) - len(parameters), 1)
+    variance = np.sum(weights*residual**2)/dof
+    eigenvalues, eigenvectors = np.linalg.eigh(jacobian.T @ (weights[:, None]*jacobian))
+    # Directions the measurements don't resolve have no information, parameters along them get no interval
+    null = eigenvalues <= max(eigenvalues[-1], 0.0)*1e-10
+    identifiable = ~np.any(np.abs(eigenvectors[:, null]) > 0.1, axis=1)
+    covariance = (eigenvectors[:, ~null]/eigenvalues[~null]) @ eigenvectors[:, ~null].T*variance
+    standard_error = np.where(identifiable, np.sqrt(np.clip(np.diag(covariance), 0, None)), np.inf)
+    values = np.exp(fit.x)
+    fitted = pd.DataFrame({
+        "initial": start,
+        "fitted": values,
+        "std error": values*standard_error,
+        "low": np.where(identifiable, np.exp(fit.x - 1.96*standard_error), np.nan),
+        "high": np.where(identifiable, np.exp(fit.x + 1.96*standard_error), np.nan),
+        "at bound": (np.isclose(fit.x, low) | np.isclose(fit.x, high)),
+        "identifiable": identifiable,
+    }, index=pd.Index(parameters, name="Parameter"))
+    scale = np.where(standard_error > 0, standard_error, 1.0)
+    correlation = pd.DataFrame(covariance/np.outer(scale, scale), index=parameters, columns=parameters)
+    correlation.loc[~identifiable, :] = np.nan
+    correlation.loc[:, ~identifiable] = np.nan
+
+    simulated, _ = objective.simulate(fit.x)
+    residuals = pd.DataFrame(simulated - objective.values, index=weather_df.index, columns=objective.measured.columns)
+    residuals[~objective.mask] = np.nan
+    summary = {"cost": float(fit.cost), "rmse": float(np.sqrt(np.mean(residual**2))), "screened": len(candidates),
+               "evaluations": sum(evaluations for _, evaluations in fits), "start costs": sorted(float(f.cost) for f, _ in fits),
+               "success": bool(fit.success), "message": fit.message, "loss": loss,
+               "covariance": "gauss-newton" if loss == "linear" else f"approximate, {loss} IRLS weights"}
+    return CalibrationResult(fitted, correlation, residuals, diagnostics(residuals), objective.scenario(fit.x), summary)
+
+def calibrate_systems(systems, n_jobs=-1, **kwargs) -> list:
+    # systems: list of dicts with the calibrate() arguments of each installed system (measured, params, weather_df...)
+    from joblib import Parallel, delayed
+    return Parallel(n_jobs=n_jobs)(delayed(calibrate)(**dict(kwargs, **settings)) for settings in systems)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+"""
+File: cli.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Command line entry point for headless simulation runs. Only the
+simulation core is imported, the Streamlit app and plotting libraries are never
+loaded unless a plot is requested.
+"""
+import time
+_START = time.perf_counter() # before any other import, fallback when the interpreter start is unavailable
+
+import argparse
+import json
+import os
+from main import run_sim, OUTPUT_COLUMNS
+
+def process_start_time() -> float:
+    # Interpreter start on the perf_counter clock, /proc gives it in clock ticks since boot on Linux
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        since_start = time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks/os.sysconf("SC_CLK_TCK")
+        return min(time.perf_counter() - since_start, _START)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return _START
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Solar hot water panel and storage tank simulation.")
+    parser.add_argument("--start", default="2022-07-01 00:00:00", help="simulation start time")
+    parser.add_argument("--end", default="2022-07-03 23:55:00", help="simulation end time")
+    parser.add_argument("--sim-step", default="5min", help="simulation time-step")
+    parser.add_argument("--clouds", type=int, choices=[1, -1, 0], default=1,
+                        help="1 = GHI, -1 = Clearsky GHI, 0 = no sun")
+    parser.add_argument("--no-heat-loss", action="store_true", help="disable heat loss to the surroundings")
+    parser.add_argument("--pump-control", type=int, choices=[0, 1, 2, 3], default=2,
+                        help="0 = no pump, 1 = constant pump, 2 = variable pump, 3 = model predictive control")
+    parser.add_argument("--flow-rate-max", type=float, default=0.00063, help="max flow rate [m^3/s]")
+    parser.add_argument("--pump-policy", type=json.loads, default=None,
+                        help='pump policy as json, overrides --pump-control, e.g. \'{"kind": "differential", "on_delta": 4, "off_delta": 1}\'')
+    parser.add_argument("--output", default="Outputs/thermal-simulation.parquet",
+                        help="results file, .parquet (zstd) or .feather/.arrow (Arrow IPC)")
+    parser.add_argument("--output-schema", choices=["full", "compact"], default="full",
+                        help="full = float64 columns and a Time column, compact = float32 values, pump state codes and "
+                             "the time range as metadata")
+    parser.add_argument("--partitions", default=None, metavar="DIR",
+                        help="also write every week of results to its own file in DIR while the run goes on, "
+                             "works with --no-series")
+    parser.add_argument("--rollups", action="store_true",
+                        help="precompute the Data Analysis tables for the results file")
+    parser.add_argument("--models", nargs="?", const="blocked", choices=["blocked", "rolling"], default=None,
+                        help="cross-validate and save the Data Science models for the results file (default: %(const)s folds)")
+    parser.add_argument("--plot", nargs="?", const="Outputs/thermal-simulation.png", default=None,
+                        help="save a png of the results (default path: %(const)s)")
+    parser.add_argument("--dev", action="store_true", help="show the plot instead of saving results")
+    parser.add_argument("--stats", action="store_true", help="print summary statistics accumulated during the run")
+    parser.add_argument("--no-series", action="store_true",
+                        help="don't keep or save the time-series, only the online statistics")
+    parser.add_argument("--optimize", nargs="?", const="Outputs/pareto-front.csv", default=None, metavar="PATH",
+                        help="trace the tank temperature vs pump runtime Pareto front of the variable pump settings "
+                             "over --start/--end and save it as csv (default path: %(const)s)")
+    parser.add_argument("--ensemble", type=int, default=None, metavar="MEMBERS",
+                        help="run a Monte Carlo ensemble of the scenario and save hourly P5/P50/P95 bands next to --output")
+    parser.add_argument("--sensitivity", type=int, nargs="?", const=256, default=None, metavar="N",
+                        help="rank the system parameters by their Sobol indices on tank temperature and total heat loss, "
+                             "N*(parameters + 2) runs (default N: %(const)s)")
+    parser.add_argument("--gradients", action="store_true",
+                        help="print the gradients of final tank temperature, pump runtime and total heat loss with respect to "
+                             "the physical parameters from one forward-mode run")
+    parser.add_argument("--calibrate", default=None, metavar="MEASUREMENTS",
+                        help="fit the heat transfer coefficients, panel efficiency and insulation thickness to measured "
+                             "temperatures (csv or parquet with Time and e.g. 'Tank Temperatures', 'Panel Temperatures' columns)")
+    parser.add_argument("--typical-days", type=int, default=None, metavar="K",
+                        help="estimate the annual metrics of the scenario from K representative days of the weather over "
+                             "--start/--end and report their error and speedup against a full run")
+    parser.add_argument("--warm-up-days", type=int, default=7,
+                        help="real days simulated before every typical day to reach its start state, 0 chains the "
+                             "typical days instead")
+    parser.add_argument("--fleet", default=None, metavar="TABLE",
+                        help="simulate every installation of a csv or parquet table (optional id and weather file columns "
+                             "plus any system parameter) in one batch pass and save per installation summaries next to --output")
+    parser.add_argument("--fleet-record", nargs="+", default=None, metavar="COLUMN",
+                        help="also save these output columns of every installation, hourly, in the --output-schema")
+    parser.add_argument("--twin", default=None, metavar="SOURCE",
+                        help="shadow a live system: follow a growing csv of weather ticks (and measured temperatures) or "
+                             "read json ticks from HOST:PORT, printing one json line of outputs per tick")
+    parser.add_argument("--nudging", type=float, default=0.5,
+                        help="fraction of the gap to measured temperatures the twin closes every tick")
+    parser.add_argument("--serve", type=int, nargs="?", const=8765, default=None, metavar="PORT",
+                        help="run the local HTTP simulation service on 127.0.0.1 (default port: %(const)s)")
+    parser.add_argument("--surrogate", action="store_true",
+                        help="answer with the trained tank temperature surrogate instead of running the simulation")
+    parser.add_argument("--validate-surrogate", type=int, nargs="?", const=8, default=None, metavar="N",
+                        help="compare the surrogate against N fresh simulator runs (default: %(const)s)")
+    args = parser.parse_args(argv)
+    # Model predictive control only runs in run_sim, the batch engine modes use the pump policies
+    batch_modes = {"--ensemble": args.ensemble, "--sensitivity": args.sensitivity, "--gradients": args.gradients,
+                   "--calibrate": args.calibrate, "--typical-days": args.typical_days, "--twin": args.twin,
+                   "--surrogate": args.surrogate, "--validate-surrogate": args.validate_surrogate}
+    used = [option for option, value in batch_modes.items() if value]
+    if args.pump_control == 3 and args.pump_policy is None and used:
+        parser.error(f"--pump-control 3 (model predictive control) isn't supported by {', '.join(used)}, "
+                     "use --pump-control 0, 1 or 2 or a --pump-policy")
+    return args
+
+def run_surrogate(args):
+    import inputs
+    import surrogate
+    model = surrogate.load_or_train()
+    weather_df = inputs.load_weather(start=args.start, end=args.end)
+    if args.validate_surrogate:
+        report, summary = model.validate(weather_df, n=args.validate_surrogate)
+        print(report.to_string())
+        for name, value in summary.items():
+            print(f"{name}: {value}")
+    if args.surrogate:
+        start = time.time()
+        tank = model.predict(weather_df, args.clouds, not args.no_heat_loss, args.pump_control, args.flow_rate_max,
+                             params={"pump_policy": args.pump_policy} if args.pump_policy else None)
+        print(tank.describe().to_string())
+        print(f"Surrogate time: {time.time() - start:.3f} s")
+        return tank
+
+def run_optimizer(args):
+    import inputs
+    import optimize
+    start = time.time()
+    weather_df = inputs.load_weather(start=args.start, end=args.end)
+    result = optimize.optimize(weather_df, base_params=dict(clouds=args.clouds, heat_loss=not args.no_heat_loss))
+    result.front.to_csv(args.optimize, index=False)
+    print(result.front.to_string())
+    print(f"{len(result.front)} Pareto optimal settings after {len(result.history)} generations, saved to {args.optimize}")
+    print(f"Optimization time: {time.time() - start:.2f} s")
+    return result
+
+def run_ensemble(args):
+    import os
+    import ensemble
+    import schema
+    start = time.time()
+    result = ensemble.run_ensemble(start=args.start, end=args.end, n_members=args.ensemble, clouds=args.clouds,
+                                   heat_loss=not args.no_heat_loss, pump_control=args.pump_control,
+                                   flow_rate_max=args.flow_rate_max,
+                                   params={"pump_policy": args.pump_policy} if args.pump_policy else None)
+    root, extension = os.path.splitext(args.output)
+    path = schema.write_results(result.bands, f"{root}.ensemble{extension}", args.output_schema)
+    print(result.final.describe().to_string())
+    print(f"Quantile bands saved to {path}")
+    print(f"Ensemble time: {time.time() - start:.2f} s")
+    return result
+
+def run_sensitivity(args):
+    import sensitivity
+    start = time.time()
+    results = sensitivity.run_sensitivity(start=args.start, end=args.end, n=args.sensitivity,
+                                          params=dict(clouds=args.clouds, heat_loss=not args.no_heat_loss,
+                                                      pump_control=args.pump_control, flow_rate_max=args.flow_rate_max,
+                                                      pump_policy=args.pump_policy))
+    for output, indices in results.items():
+        print(output)
+        print(indices.round(3).to_string())
+    print(f"Sensitivity time: {time.time() - start:.2f} s")
+    return results
+
+def run_gradients(args):
+    import inputs
+    import gradients
+    start = time.time()
+    weather_df = inputs.load_weather(start=args.start, end=args.end)
+    result = gradients.gradients(weather_df, [dict(clouds=args.clouds, heat_loss=not args.no_heat_loss, pump_control=args.pump_control,
+                                                   flow_rate_max=args.flow_rate_max, pump_policy=args.pump_policy)])
+    print("Model values")
+    print(result.values.to_string())
+    if result.smoothed_values is not result.values:
+        print("Values of the smoothed pump run the gradients are taken at")
+        print(result.smoothed_values.to_string())
+    for output, gradient in result.gradients.items():
+        print(f"d {output}")
+        print(gradient.T.to_string())
+    print(f"Gradient time: {time.time() - start:.2f} s")
+    return result
+
+def run_calibration(args):
+    import calibration
+    start = time.time()
+    measured = calibration.load_measurements(args.calibrate)
+    result = calibration.calibrate(measured, params=dict(clouds=args.clouds, heat_loss=not args.no_heat_loss,
+                                                         pump_control=args.pump_control, flow_rate_max=args.flow_rate_max,
+                                                         pump_policy=args.pump_policy))
+    print(result.fitted.to_string())
+    print(result.correlation.round(2).to_string())
+    print(result.diagnostics.to_string())
+    for name, value in result.summary.items():
+        print(f"{name}: {value}")
+    print(f"Calibration time: {time.time() - start:.2f} s")
+    return result
+
+def run_fleet(args):
+    import os
+    import fleet
+    import schema
+    start = time.time()
+    result = fleet.run_fleet(args.fleet, start=args.start, end=args.end, record=args.fleet_record, every=12)
+    root, extension = os.path.splitext(args.output)
+    result.summary.to_csv(f"{root}.fleet.csv")
+    print(result.summary.describe().T.to_string())
+    print(f"{len(result.summary)} installation summaries saved to {root}.fleet.csv")
+    if result.series is not None:
+        print(f"Series saved to {schema.write_results(result.series, f'{root}.fleet{extension}', args.output_schema)}")
+    print(f"Fleet time: {time.time() - start:.2f} s")
+    return result
+
+def run_typical_days(args):
+    import typical_days
+    params = dict(clouds=args.clouds, heat_loss=not args.no_heat_loss, pump_control=args.pump_control,
+                  flow_rate_max=args.flow_rate_max, pump_policy=args.pump_policy)
+    result = typical_days.compare(args.typical_days, [params], start=args.start, end=args.end,
+                                  warm_up_days=args.warm_up_days)
+    print(result["report"].round(3).to_string())
+    print("Typical days: " + ", ".join(f"{day.date()} x{weight}" for day, weight in
+                                      zip(result["typical days"].dates, result["typical days"].weights)))
+    print(f"{result['simulated days']} simulated days ({result['passes']} pass{'es' if result['passes'] > 1 else ''}) instead of {result['days']}, "
+          f"{result['typical days [s]']:.2f} s vs {result['full run [s]']:.2f} s for the full run, {result['speedup']:.1f}x")
+    if not result["converged"]:
+        print("Warning: the typical day start states didn't converge, the estimate depends on the number of passes")
+    return result
+
+def run_twin(args):
+    import os
+    import twin
+    if os.path.exists(args.twin):
+        ticks = twin.tail_csv(args.twin)
+    else:
+        host, port = args.twin.rsplit(":", 1)
+        ticks = twin.socket_lines(host, int(port))
+    model = twin.DigitalTwin(dict(clouds=args.clouds, heat_loss=not args.no_heat_loss, pump_control=args.pump_control,
+                                  flow_rate_max=args.flow_rate_max, pump_policy=args.pump_policy), nudging=args.nudging)
+    for outputs in model.run(ticks):
+        print(json.dumps(dict(outputs, Time=str(outputs["Time"]))), flush=True)
+    return model
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serve:
+        import service
+        return service.serve(port=args.serve)
+    if args.ensemble:
+        return run_ensemble(args)
+    if args.optimize:
+        return run_optimizer(args)
+    if args.sensitivity:
+        return run_sensitivity(args)
+    if args.gradients:
+        return run_gradients(args)
+    if args.calibrate:
+        return run_calibration(args)
+    if args.typical_days:
+        return run_typical_days(args)
+    if args.fleet:
+        return run_fleet(args)
+    if args.twin:
+        return run_twin(args)
+    if args.surrogate or args.validate_surrogate:
+        return run_surrogate(args)
+    timings = {}
+    stats = None
+    if args.stats or args.no_series:
+        from accumulators import StreamingStats
+        stats = StreamingStats(OUTPUT_COLUMNS)
+    # Results, partitions and the png are written in the background while the run and the analysis go on
+    import itertools
+    import os
+    from writer import ResultWriter, partition_path
+    output = ResultWriter()
+    on_block = None
+    if args.partitions:
+        partitions = itertools.count()
+        extension = os.path.splitext(args.output)[1]
+        on_block = lambda block: output.write_results(block, partition_path(args.partitions, next(partitions), extension),
+                                                      args.output_schema)
+    sim_df = run_sim(
+        start=args.start,
+        end=args.end,
+        sim_step=args.sim_step,
+        clouds=args.clouds,
+        heat_loss=not args.no_heat_loss,
+        pump_control=args.pump_control,
+        flow_rate_max=args.flow_rate_max,
+        DEV=args.dev,
+        timings=timings,
+        output_path=args.output,
+        output_schema=args.output_schema,
+        writer=output,
+        on_block=on_block,
+        stats=stats,
+        keep_series=not args.no_series,
+        params={"pump_policy": args.pump_policy} if args.pump_policy else None,
+    )
+    if stats is not None:
+        print(stats.summary().to_string())
+        print(f"Pump runtime: {stats.pump_on_seconds/60/60:.2f} hrs")
+        for name, energy in stats.energy_totals().items():
+            print(f"{name}: {energy/1e6:.2f} MJ")
+    if sim_df is not None and not args.dev:
+        if args.plot:
+            output.write_png(sim_df, args.plot)
+        if args.rollups or args.models:
+            output.flush() # they read the results file
+        if args.rollups:
+            import rollups
+            print(f"Rollups written to {rollups.write_rollups(args.output)}")
+        if args.models:
+            import pipeline
+            for name, summary in pipeline.run_pipeline(args.output, scheme=args.models).items():
+                print(f"{name}: " + ", ".join(f"{key} {value:.3f}" for key, value in summary["overall"].items()))
+    output.close()
+    written = output.stats()
+    if written["files"]:
+        print(f"Output written: {written['files']} files, {written['bytes']/2**20:.1f} MB at {written['MB/s']:.1f} MB/s, "
+              f"max backlog {written['max backlog']}, producer wait {written['producer wait [s]']:.2f} s")
+
+    if "mpc" in timings:
+        print("MPC decisions: " + ", ".join(f"{name} {value:.4g}" for name, value in timings["mpc"].items()))
+    process_start = process_start_time()
+    print(f"Time to first step: {timings['first_step'] - process_start:.2f} s")
+    print(f"Simulation time: {timings['sim_complete'] - timings['first_step']:.2f} s")
+    return sim_df
+
+if __name__ == "__main__":
+    main()
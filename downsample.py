@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+File: downsample.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Shape preserving decimation of time-series for plotting. Both
+methods return the indices of the points to keep so the same selection can be
+applied to any column.
+- lttb(): Largest-Triangle-Three-Buckets, best for smooth curves
+- minmax(): min/max envelope per bucket, keeps every peak and trough
+"""
+import numpy as np
+
+def _as_float(x) -> np.ndarray:
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype("datetime64[ns]").astype(np.int64)
+    return x.astype(float)
+
+def lttb(x, y, n_out: int) -> np.ndarray:
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = _as_float(x)
+    y = np.nan_to_num(_as_float(y))
+
+    # First and last points are always kept, the rest are split into n_out-2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third triangle vertex
+        if i < n_out - 3:
+            next_start, next_end = edges[i + 1], edges[i + 2]
+            x_c = x[next_start:next_end].mean()
+            y_c = y[next_start:next_end].mean()
+        else:
+            x_c, y_c = x[-1], y[-1]
+        areas = np.abs((x[a] - x_c)*(y[start:end] - y[a]) - (x[a] - x[start:end])*(y_c - y[a]))
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+def minmax(y, n_out: int) -> np.ndarray:
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    y = _as_float(y)
+
+    # Pad to a whole number of buckets and pick the min and max of each one
+    n_buckets = n_out // 2
+    size = -(-n // n_buckets)
+    padded = np.full(n_buckets*size, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(n_buckets, size)
+    valid = ~np.all(np.isnan(buckets), axis=1)
+    buckets = np.where(np.isnan(buckets[valid]), np.inf, buckets[valid])
+    offsets = np.flatnonzero(valid)*size
+    mins = offsets + np.argmin(buckets, axis=1)
+    maxs = offsets + np.argmax(np.where(np.isinf(buckets), -np.inf, buckets), axis=1)
+    return np.unique(np.concatenate(([0, n - 1], mins, maxs)))
+
+def decimate(x, y, max_points: int, method="lttb") -> np.ndarray:
+    if max_points is None or len(y) <= max_points:
+        return np.arange(len(y))
+    if method == "lttb":
+        return lttb(x, y, max_points)
+    elif method == "minmax":
+        return minmax(y, max_points)
+    raise ValueError(f"Unknown decimation method: {method}")
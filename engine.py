@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""
+File: engine.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Vectorized batch engine. Simulates many scenarios of the solar hot
+water system at once, one numpy operation per physics step for all of them.
+Every scenario is built from components.py through system.build_system() and
+reduced to a handful of coefficients (masses, UAs, solar gain) so the time loop
+only touches arrays. The physics and step order match main.run_sim().
+"""
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import policies
+import system
+from main import OUTPUT_COLUMNS
+
+FLUIDS = ["panel", "supply_pipe", "tank", "return_pipe"] # order of the state rows
+TEMPERATURE_COLUMNS = OUTPUT_COLUMNS[:4]
+LOSS_COLUMNS = ['Panel Heat Losses', 'Supply Pipe Heat Losses', 'Tank Heat Losses', 'Return Pipe Heat Losses']
+
+def model_hash() -> str:
+    # Changes whenever the physics or default parameters change
+    sha = hashlib.sha256(json.dumps(system.DEFAULTS, sort_keys=True).encode())
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ("components.py", "system.py", "engine.py"):
+        with open(os.path.join(here, name), "rb") as f:
+            sha.update(f.read())
+    return sha.hexdigest()[:16]
+
+def system_coefficients(scenarios) -> dict:
+    # Build every scenario from the model components and keep only what the time loop needs
+    rows = []
+    for params in scenarios:
+        parts = system.build_system(params)
+        surroundings = [parts["outside_air"], parts["outside_air"], parts["zone_air"], parts["outside_air"]]
+        containers = [parts[name] for name in FLUIDS]
+        rows.append({
+            "mass": [c.fluid.mass() for c in containers],
+            "specific_heat": [c.fluid.specific_heat for c in containers],
+            "density": [c.fluid.density for c in containers],
+            "ua": [c.overall_UA(air) for c, air in zip(containers, surroundings)],
+            "initial_temperature": [c.fluid.temperature for c in containers],
+            "solar_gain": parts["panel"].solar_area()*parts["panel"].efficiency,
+        })
+    coeffs = {key: np.array([row[key] for row in rows], dtype=float).T for key in rows[0]}
+    coeffs["heat_capacity"] = coeffs["mass"]*coeffs["specific_heat"]
+    for key in ("clouds", "heat_loss", "pump_control", "flow_rate_max", "pump_delta", "zone_temp", "zone_temp_noise"):
+        coeffs[key] = np.array([params[key] for params in scenarios], dtype=float)
+    return coeffs
+
+def step_factors(coeffs, step_seconds) -> dict:
+    # Per step factors so the time loop is only a few array operations
+    c = coeffs
+    dt = step_seconds
+    factors = {
+        "panel_gain": dt*c["solar_gain"]/c["heat_capacity"][0], # [°C per W/m^2]
+        "mass_ratio": c["density"][[3, 0, 1, 2]]*dt/c["mass"], # upstream fluid mass moved per unit flow over the container's
+        "loss_factor": c["ua"]*dt*c["heat_loss"], # [J/°C]
+    }
+    factors["loss_temperature"] = factors["loss_factor"]/c["heat_capacity"]
+    return factors
+
+def weather_arrays(weather_df: pd.DataFrame):
+    return (weather_df["GHI"].to_numpy(dtype=float),
+            weather_df["Clearsky GHI"].to_numpy(dtype=float),
+            weather_df["Temperature"].to_numpy(dtype=float))
+
+class BatchResult:
+    def __init__(self, time, data, scenarios, final_temperatures):
+        self.time = time # DatetimeIndex of the recorded steps
+        self.data = data # column -> (steps, scenarios) array
+        self.scenarios = scenarios
+        self.final_temperatures = final_temperatures # (fluids, scenarios)
+
+    def __len__(self):
+        return len(self.scenarios)
+
+    def frame(self, k: int) -> pd.DataFrame:
+        # Same layout as the dataframe returned by main.run_sim()
+        df = pd.DataFrame({column: values[:, k] for column, values in self.data.items()})
+        df.insert(0, "Time", self.time)
+        return df
+
+class BatchEngine:
+    def __init__(self, scenarios, step_seconds: float, seed=None, scenario_seeds=None):
+        # With one seed per scenario the zone noise of a scenario doesn't depend on the rest of the batch
+        if isinstance(scenarios, dict):
+            scenarios = [scenarios]
+        self.scenarios = [system.make_params(params) for params in scenarios]
+        self.n = len(self.scenarios)
+        self.step_seconds = step_seconds
+        self.coeffs = system_coefficients(self.scenarios)
+        self.reseed(seed, scenario_seeds)
+
+        self._ghi_weight = (self.coeffs["clouds"] == 1).astype(float)
+        self._clear_ghi_weight = (self.coeffs["clouds"] == -1).astype(float)
+        for name, value in step_factors(self.coeffs, step_seconds).items():
+            setattr(self, f"_{name}", value)
+        self.policy = policies.compile_policies(self.scenarios)
+        self.reset()
+
+    def reset(self):
+        self.temperatures = self.coeffs["initial_temperature"].copy()
+        self.policy.reset()
+
+    def reseed(self, seed=None, scenario_seeds=None):
+        # Restarts the zone noise, a rerun with the same seed sees the same noise
+        self.rng = np.random.default_rng(seed)
+        self._scenario_rngs = None if scenario_seeds is None else [np.random.default_rng(s) for s in scenario_seeds]
+        self._noise_block = np.empty((0, self.n))
+        self._noise_index = 0
+
+    def set_temperatures(self, temperatures):
+        # (fluids,) for every scenario or (fluids, scenarios)
+        temperatures = np.asarray(temperatures, dtype=float)
+        if temperatures.ndim == 1:
+            temperatures = temperatures[:, None]
+        self.temperatures = np.broadcast_to(temperatures, (4, self.n)).copy()
+
+    def pump_flow(self, hour=0) -> np.ndarray:
+        return self.policy.flow(self.temperatures[1], self.temperatures[2], hour)
+
+    def zone_temperature(self) -> np.ndarray:
+        # Inside temperature noise is drawn in blocks to keep the rng out of the step
+        if self._noise_index == len(self._noise_block):
+            if self._scenario_rngs is None:
+                self._noise_block = self.rng.uniform(-1.0, 1.0, (4096, self.n))
+            else:
+                self._noise_block = np.column_stack([rng.uniform(-1.0, 1.0, 4096) for rng in self._scenario_rngs])
+            self._noise_index = 0
+        noise = self._noise_block[self._noise_index]
+        self._noise_index += 1
+        return self.coeffs["zone_temp"] + noise*self.coeffs["zone_temp_noise"]
+
+    def step(self, ghi, clear_ghi, oa_temp, zone_temp=None, flow=None, hour=0) -> np.ndarray:
+        T = self.temperatures
+
+        # Add solar energy into the panel
+        irradiance = ghi*self._ghi_weight + clear_ghi*self._clear_ghi_weight
+        T[0] += irradiance*self._panel_gain
+
+        # Pump control
+        if flow is None:
+            flow = self.pump_flow(hour)
+
+        # Move and mix the fluids, each container mixes with the one upstream of it
+        # (m*T + m_in*T_up)/(m + m_in) = T + w*(T_up - T) with w = m_in/(m + m_in)
+        ratio = self._mass_ratio*flow
+        w = ratio/(1 + ratio)
+        T[0] += w[0]*(T[3] - T[0])
+        T[1] += w[1]*(T[0] - T[1])
+        T[2] += w[2]*(T[1] - T[2])
+        T[3] += w[3]*(T[2] - T[3])
+
+        # Heat loss, the tank loses heat to the zone and everything else to outside air
+        if zone_temp is None:
+            zone_temp = self.zone_temperature()
+        difference = T - oa_temp
+        difference[2] = T[2] - zone_temp
+        losses = difference*self._loss_factor
+        T -= difference*self._loss_temperature
+
+        outputs = np.empty((len(OUTPUT_COLUMNS), self.n))
+        outputs[0:4] = T
+        outputs[4] = zone_temp
+        outputs[5] = oa_temp
+        outputs[6] = irradiance
+        outputs[7:11] = losses
+        outputs[11] = losses.sum(axis=0)
+        outputs[12] = flow
+        return outputs
+
+    def run(self, weather_df: pd.DataFrame, record=OUTPUT_COLUMNS, stats=None, every=1, dtype=float) -> BatchResult:
+        ghi, clear_ghi, oa_temp = weather_arrays(weather_df)
+        return self.run_arrays(weather_df.index, ghi, clear_ghi, oa_temp, record, stats, every, dtype)
+
+    def run_arrays(self, index, ghi, clear_ghi, oa_temp, record=OUTPUT_COLUMNS, stats=None, every=1, dtype=float) -> BatchResult:
+        # Weather arrays are (steps,) for shared weather or (steps, scenarios) for per scenario weather
+        record = list(record or [])
+        rows = [OUTPUT_COLUMNS.index(column) for column in record]
+        rows = slice(None) if rows == list(range(len(OUTPUT_COLUMNS))) else rows
+        steps = len(index)
+        recorded = np.empty((-(-steps // every), len(record), self.n), dtype=dtype)
+        gain_per_irradiance = self.step_seconds*self.coeffs["solar_gain"]
+        hours = pd.DatetimeIndex(index).hour.to_numpy()
+
+        for i in range(steps):
+            outputs = self.step(ghi[i], clear_ghi[i], oa_temp[i], hour=hours[i])
+            if record and i % every == 0:
+                recorded[i // every] = outputs[rows]
+            if stats is not None:
+                stats.update(outputs.T, index[i], outputs[6]*gain_per_irradiance, self.step_seconds)
+
+        data = {column: recorded[:, j] for j, column in enumerate(record)}
+        return BatchResult(pd.DatetimeIndex(index[::every]), data, self.scenarios, self.temperatures.copy())
+
+def simulate(weather_df: pd.DataFrame, scenarios, record=OUTPUT_COLUMNS, stats=None, every=1, seed=None, dtype=float) -> BatchResult:
+    step_seconds = (weather_df.index[1] - weather_df.index[0]).total_seconds()
+    engine = BatchEngine(scenarios, step_seconds, seed)
+    return engine.run(weather_df, record, stats, every, dtype)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+File: ensemble.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Monte Carlo ensembles of a run_sim scenario. Every member gets its
+own heat transfer coefficients, material conductivities and thicknesses and
+panel efficiency (log-normal around the scenario values) and its own weather,
+GHI and outside air temperature with autocorrelated noise added. Only the
+P5/P50/P95 bands per recorded time-step and the last value of every member are
+kept, never the trajectories.
+Members are split into chunks that run on parallel workers and the year is run
+in blocks of time, so memory is bounded by block length x members no matter
+how long the run is.
+"""
+import numpy as np
+import pandas as pd
+import engine
+import inputs
+import system
+
+# Log-normal sigma of each sampled parameter (~ relative standard deviation)
+PERTURBATIONS = {
+    "air_heat_transfer_coeff_inside": 0.2,
+    "air_heat_transfer_coeff_outside": 0.2,
+    "water_in_pipe_heat_transfer_coeff": 0.2,
+    "k_stainless_steal": 0.1,
+    "k_glass": 0.1,
+    "k_cast_iron": 0.1,
+    "k_fiberglass": 0.15,
+    "tank_wall_thickness": 0.05,
+    "glass_thickness": 0.05,
+    "pipe_wall_thickness": 0.05,
+    "insulation_thickness": 0.1,
+    "efficiency": 0.05,
+}
+QUANTILES = [0.05, 0.5, 0.95]
+
+def sample_parameters(n_members, params=None, perturbations=PERTURBATIONS, seed=0) -> pd.DataFrame:
+    params = system.make_params(params)
+    rng = np.random.default_rng(seed)
+    samples = pd.DataFrame({name: params[name]*np.exp(sigma*rng.standard_normal(n_members))
+                            for name, sigma in perturbations.items()}, index=pd.RangeIndex(n_members, name="Member"))
+    if "efficiency" in samples:
+        samples["efficiency"] = samples["efficiency"].clip(upper=1.0)
+    return samples
+
+def _ar1(rng, previous, steps, correlation_steps):
+    # Unit variance AR(1) noise continuing from `previous`
+    from scipy.signal import lfilter
+    phi = np.exp(-1/max(correlation_steps, 1e-9))
+    eps = rng.standard_normal((steps, len(previous)))
+    return lfilter([np.sqrt(1 - phi**2)], [1, -phi], eps, axis=0, zi=phi*previous[None, :])[0]
+
+class EnsembleChunk:
+    # A group of members with their engine and weather noise state, carried from one time block to the next
+    def __init__(self, scenarios, step_seconds, seed, ghi_sigma, temp_sigma, correlation_steps):
+        self.engine = engine.BatchEngine(scenarios, step_seconds, seed)
+        self.rng = np.random.default_rng([seed, 1])
+        self.ghi_sigma = ghi_sigma
+        self.temp_sigma = temp_sigma
+        self.correlation_steps = correlation_steps
+        self.ghi_noise = np.zeros(self.engine.n)
+        self.temp_noise = np.zeros(self.engine.n)
+
+    def run_block(self, index, ghi, clear_ghi, oa_temp, record, every):
+        steps = len(index)
+        ghi_noise = _ar1(self.rng, self.ghi_noise, steps, self.correlation_steps)
+        temp_noise = _ar1(self.rng, self.temp_noise, steps, self.correlation_steps)
+        self.ghi_noise, self.temp_noise = ghi_noise[-1], temp_noise[-1]
+
+        sun_scale = np.maximum(1 + self.ghi_sigma*ghi_noise, 0.0)
+        result = self.engine.run_arrays(index, ghi[:, None]*sun_scale, clear_ghi[:, None]*sun_scale,
+                                        oa_temp[:, None] + self.temp_sigma*temp_noise, record, every=every, dtype=np.float32)
+        return np.stack([result.data[column] for column in record])
+
+def _run_block(chunk, *args):
+    # Runs in a worker, the chunk goes back to the parent with its updated state
+    values = chunk.run_block(*args)
+    return chunk, values
+
+class EnsembleResult:
+    def __init__(self, bands, final, parameters):
+        self.bands = bands # quantile bands per recorded time-step
+        self.final = final # (members, columns) values at the last recorded step
+        self.parameters = parameters # sampled parameters of every member
+
+def run_ensemble(start='2022-07-01 00:00:00', end='2022-07-03 23:55:00', n_members=1000, clouds=None, heat_loss=None,
+                 pump_control=None, flow_rate_max=None, params=None, perturbations=PERTURBATIONS, ghi_sigma=0.1,
+                 temp_sigma=1.0, correlation_hours=3, record=("Tank Temperatures",), quantiles=QUANTILES, every=12,
+                 block_days=7, chunk_size=250, n_jobs=-1, seed=0, weather_df=None) -> EnsembleResult:
+    from joblib import Parallel, delayed
+
+    if weather_df is None:
+        weather_df = inputs.load_weather(start=start, end=end)
+    record = list(record)
+    base = system.run_params(params, clouds=clouds, heat_loss=heat_loss, pump_control=pump_control, flow_rate_max=flow_rate_max)
+    samples = sample_parameters(n_members, base, perturbations, seed)
+    scenarios = [dict(base, **samples.loc[k].to_dict()) for k in samples.index]
+
+    step_seconds = (weather_df.index[1] - weather_df.index[0]).total_seconds()
+    correlation_steps = correlation_hours*3600/step_seconds
+    chunks = [EnsembleChunk(scenarios[i:i + chunk_size], step_seconds, seed + i, ghi_sigma, temp_sigma, correlation_steps)
+              for i in range(0, n_members, chunk_size)]
+    ghi, clear_ghi, oa_temp = engine.weather_arrays(weather_df)
+
+    # Blocks are a multiple of `every` so the recorded steps line up with a single run
+    block = max(int(block_days*86400/step_seconds)//every, 1)*every
+    bands = []
+    final = None
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for start_step in range(0, len(weather_df), block):
+            rows = slice(start_step, start_step + block)
+            outputs = parallel(delayed(_run_block)(chunk, weather_df.index[rows], ghi[rows], clear_ghi[rows], oa_temp[rows], record, every)
+                               for chunk in chunks)
+            chunks = [chunk for chunk, _ in outputs]
+            values = np.concatenate([values for _, values in outputs], axis=2) # (columns, recorded steps, members)
+            bands.append(np.quantile(values, quantiles, axis=2)) # (quantiles, columns, recorded steps)
+            final = values[:, -1]
+
+    bands = np.concatenate(bands, axis=2)
+    columns = {f"{column} P{round(q*100)}": bands[j, c] for c, column in enumerate(record) for j, q in enumerate(quantiles)}
+    bands_df = pd.DataFrame(columns, index=weather_df.index[::every])
+    bands_df.index.name = "Time"
+    final_df = pd.DataFrame(final.T, columns=record)
+    return EnsembleResult(bands_df, final_df, samples)
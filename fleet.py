@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+File: fleet.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Fleet simulation of many installations with their own geometry,
+materials, controls and weather. Every installation is one column of a batch
+engine, so the whole fleet is advanced together instead of once per site.
+- The fleet table has one row per installation: an optional "id", a "weather"
+  file (default inputs.WEATHER_PATH, e.g. saved from get_weather_data for the
+  site's location) and any system parameter, empty cells keep the default
+- Every weather file is loaded once; installations whose files share a time
+  index run in one pass, each step picks its site's weather by index
+- Per installation summaries (tank temperature, solar gain, heat loss, pump
+  hours and energy) are accumulated during the run, full series are optional
+"""
+import json
+import numpy as np
+import pandas as pd
+import engine
+import inputs
+import schema
+import system
+
+SUMMARY_COLUMNS = ["Weather", "Mean Tank Temperature", "Min Tank Temperature", "Max Tank Temperature",
+                   "Final Tank Temperature", "Solar Energy In [MJ]", "Total Heat Loss [MJ]", "Pump Hours",
+                   "Pump Energy [kWh]"]
+JSON_COLUMNS = ["pump_policy", "mpc"] # parameters given as json text in csv tables
+
+def load_fleet(path) -> pd.DataFrame:
+    return pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+
+def fleet_scenarios(fleet: pd.DataFrame, params=None):
+    # (installation ids, weather file of each installation, system parameters of each installation)
+    fleet = fleet.reset_index(drop=True)
+    ids = fleet["id"].astype(str).tolist() if "id" in fleet else [str(i) for i in fleet.index]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Installation ids must be unique")
+    weather = fleet["weather"].fillna(inputs.WEATHER_PATH).tolist() if "weather" in fleet else [inputs.WEATHER_PATH]*len(fleet)
+    columns = [column for column in fleet.columns if column not in ("id", "weather")]
+    scenarios = []
+    for row in fleet[columns].itertuples(index=False, name=None):
+        overrides = {}
+        for column, value in zip(columns, row):
+            if isinstance(value, str) and column in JSON_COLUMNS:
+                value = json.loads(value)
+            if value is None or (np.isscalar(value) and pd.isna(value)):
+                continue
+            overrides[column] = value.item() if isinstance(value, np.generic) else value
+        scenarios.append(system.make_params(params, **overrides))
+    return ids, weather, scenarios
+
+class FleetResult:
+    def __init__(self, summary, series):
+        self.summary = summary # one row per installation, indexed by id
+        self.series = series # long table of Time, Installation and the recorded columns, None if nothing was recorded
+
+def _run_group(weather_dfs, sites, scenarios, record, every, seed):
+    # One batch engine pass over installations whose weather files share a time index
+    index = weather_dfs[0].index
+    step_seconds = (index[1] - index[0]).total_seconds()
+    sim = engine.BatchEngine(scenarios, step_seconds, seed)
+    site_weather = [np.column_stack(arrays) for arrays in zip(*(engine.weather_arrays(df) for df in weather_dfs))]
+    ghi, clear_ghi, oa_temp = (values[:, sites] if len(weather_dfs) > 1 else values[:, 0] for values in site_weather)
+    hours = index.hour.to_numpy()
+
+    n = sim.n
+    tank_sum, tank_min, tank_max = np.zeros(n), np.full(n, np.inf), np.full(n, -np.inf)
+    solar, losses, pump_seconds, pump_joules = np.zeros(n), np.zeros(n), np.zeros(n), np.zeros(n)
+    gain_per_irradiance = step_seconds*sim.coeffs["solar_gain"]
+    flow_rate_max = np.where(sim.coeffs["flow_rate_max"] > 0, sim.coeffs["flow_rate_max"], 1.0)
+    pump_power = np.array([params["pump_power"] for params in sim.scenarios], dtype=float)
+    rows = [engine.OUTPUT_COLUMNS.index(column) for column in record]
+    recorded = np.empty((-(-len(index) // every), len(rows), n), dtype=np.float32) if rows else None
+
+    for i in range(len(index)):
+        outputs = sim.step(ghi[i], clear_ghi[i], oa_temp[i], hour=hours[i])
+        tank = outputs[2]
+        tank_sum += tank
+        np.minimum(tank_min, tank, out=tank_min)
+        np.maximum(tank_max, tank, out=tank_max)
+        solar += outputs[6]*gain_per_irradiance
+        losses += outputs[11]
+        flow = outputs[12]
+        pump_seconds += (flow > 0)*step_seconds
+        pump_joules += pump_power*(flow/flow_rate_max)**3*step_seconds # affinity laws, as in mpc.py
+        if rows and i % every == 0:
+            recorded[i // every] = outputs[rows]
+
+    summary = {
+        "Mean Tank Temperature": tank_sum/len(index),
+        "Min Tank Temperature": tank_min,
+        "Max Tank Temperature": tank_max,
+        "Final Tank Temperature": sim.temperatures[2].copy(),
+        "Solar Energy In [MJ]": solar/1e6,
+        "Total Heat Loss [MJ]": losses/1e6,
+        "Pump Hours": pump_seconds/3600,
+        "Pump Energy [kWh]": pump_joules/3.6e6,
+    }
+    series = None
+    if rows:
+        result = engine.BatchResult(index[::every], {column: recorded[:, j] for j, column in enumerate(record)},
+                                    sim.scenarios, sim.temperatures.copy())
+        series = schema.batch_frame(result)
+    return summary, series
+
+def run_fleet(fleet, start='2022-07-01 00:00:00', end='2022-07-03 23:55:00', params=None, record=None, every=1,
+              seed=None) -> FleetResult:
+    # fleet is a table (or path to a csv/parquet table) of installations, record lists output columns to keep as series
+    if isinstance(fleet, str):
+        fleet = load_fleet(fleet)
+    ids, weather, scenarios = fleet_scenarios(fleet, params)
+    record = list(record or [])
+
+    # Each weather file is read once, files with the same time index run in the same pass
+    files = list(dict.fromkeys(weather))
+    weather_dfs = {path: inputs.load_weather(path, start=start, end=end) for path in files}
+    groups = [] # lists of weather files with the same index
+    for path in files:
+        index = weather_dfs[path].index
+        if len(index) < 2:
+            raise ValueError(f"Weather file {path} has fewer than two steps between {start} and {end}")
+        group = next((paths for paths in groups if weather_dfs[paths[0]].index.equals(index)), None)
+        if group is None:
+            groups.append([path])
+        else:
+            group.append(path)
+
+    summaries, series = [], []
+    for paths in groups:
+        members = [k for k, path in enumerate(weather) if path in paths]
+        sites = np.array([paths.index(weather[k]) for k in members])
+        summary, frame = _run_group([weather_dfs[path] for path in paths], sites, [scenarios[k] for k in members],
+                                    record, every, seed)
+        summary = pd.DataFrame(summary, index=[ids[k] for k in members])
+        summary.insert(0, "Weather", [weather[k] for k in members])
+        summaries.append(summary)
+        if frame is not None:
+            frame.insert(1, "Installation", np.asarray(ids, dtype=object)[members][frame.pop("Scenario").to_numpy()])
+            series.append(frame)
+
+    summary = pd.concat(summaries).loc[ids]
+    summary.index.name = "id"
+    return FleetResult(summary[SUMMARY_COLUMNS], pd.concat(series, ignore_index=True) if series else None)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+File: gradients.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Parameter gradients from a single simulation run. The batch engine
+is run in forward mode: next to every state temperature it carries the tangent,
+the derivative with respect to each chosen parameter, through the solar gain,
+pump, mixing and heat loss steps. One augmented run gives the gradients of the
+final tank temperature, pump runtime and total heat loss for all parameters,
+instead of one extra run per parameter with finite differences.
+- Derivatives of the per step coefficients (masses, UAs, solar gain) are taken
+  by central differences of the component formulas, which is exact enough and
+  keeps components.py the single source of the physics
+- Pump on/off switches are relaxed into logistic steps `smoothing` °C wide so
+  the pump runtime has a gradient and the pump's feedback on the temperatures
+  stays differentiable. With smoothing=0 the run is exactly the batch engine's
+  and the gradients ignore the effect of shifting a switch by a time-step.
+- The smoothed pump runs part way below its switch point, so the smoothed run
+  is biased (on the default July run +2.7 pump hours and +0.4 °C final tank
+  temperature at smoothing=0.2) and its gradients are those of the smoothed
+  model. gradients() reports the values of the hard switching engine next to
+  the smoothed ones the gradients belong to.
+"""
+import numpy as np
+import pandas as pd
+import engine
+import system
+
+# Physical parameters the coefficients can be differentiated by
+PARAMETERS = [
+    "flow_rate_max", "efficiency", "insulation_thickness",
+    "air_heat_transfer_coeff_inside", "air_heat_transfer_coeff_outside", "water_in_pipe_heat_transfer_coeff",
+    "k_stainless_steal", "k_glass", "k_cast_iron", "k_fiberglass",
+    "tank_wall_thickness", "glass_thickness", "pipe_wall_thickness",
+]
+DIFFERENTIABLE = PARAMETERS + ["water_density", "water_specific_heat", "panel_length", "panel_width", "panel_height",
+                               "tank_radius", "tank_height", "pipe_radius", "pipe_length"]
+OUTPUTS = ["Final Tank Temperature", "Pump Runtime", "Total Heat Loss"]
+
+def factor_tangents(scenarios, parameters, step_seconds, relative_step=1e-6) -> dict:
+    # d factor/d parameter, (parameters, ...) arrays per step factor
+    tangents = {}
+    for j, name in enumerate(parameters):
+        h = np.array([relative_step*max(abs(params[name]), 1e-12) for params in scenarios])
+        sides = []
+        for sign in (1, -1):
+            coeffs = engine.system_coefficients([dict(params, **{name: params[name] + sign*h[k]}) for k, params in enumerate(scenarios)])
+            sides.append(dict(engine.step_factors(coeffs, step_seconds), flow_rate_max=coeffs["flow_rate_max"]))
+        for key, value in sides[0].items():
+            tangents.setdefault(key, np.zeros((len(parameters),) + value.shape))[j] = (value - sides[1][key])/(2*h)
+    return tangents
+
+class TangentEngine(engine.BatchEngine):
+    def __init__(self, scenarios, step_seconds: float, parameters=PARAMETERS, seed=None, smoothing=0.2):
+        self.parameters = list(parameters)
+        unknown = set(self.parameters) - set(DIFFERENTIABLE)
+        if unknown:
+            raise ValueError(f"Can't differentiate by {sorted(unknown)}, expected some of {DIFFERENTIABLE}")
+        self.smoothing = smoothing
+        super().__init__(scenarios, step_seconds, seed)
+        self._tangents = factor_tangents(self.scenarios, self.parameters, step_seconds)
+
+    def reset(self):
+        super().reset()
+        # Initial temperatures don't depend on any of the parameters
+        self.d_temperatures = np.zeros((len(self.parameters),) + self.temperatures.shape)
+        self.pump_seconds = np.zeros(self.n)
+        self.d_pump_seconds = np.zeros((len(self.parameters), self.n))
+        self.heat_loss = np.zeros(self.n)
+        self.d_heat_loss = np.zeros((len(self.parameters), self.n))
+
+    def step(self, ghi, clear_ghi, oa_temp, zone_temp=None, flow=None, hour=0) -> np.ndarray:
+        # Same step as BatchEngine.step(), every update of T is preceded by its tangent update of dT
+        T, dT, d = self.temperatures, self.d_temperatures, self._tangents
+
+        irradiance = ghi*self._ghi_weight + clear_ghi*self._clear_ghi_weight
+        dT[:, 0] += irradiance*d["panel_gain"]
+        T[0] += irradiance*self._panel_gain
+
+        if flow is None:
+            speed, speed_slope, on, on_slope = self.policy.smooth_speed(T[1], T[2], hour, self.smoothing)
+            flow = speed*self.policy.flow_rate_max
+            d_delta = dT[:, 1] - dT[:, 2]
+            d_flow = speed_slope*d_delta*self.policy.flow_rate_max + speed*d["flow_rate_max"]
+            self.pump_seconds += on*self.step_seconds
+            self.d_pump_seconds += on_slope*d_delta*self.step_seconds
+        else:
+            d_flow = np.zeros_like(dT[:, 0])
+            self.pump_seconds += (flow > 0)*self.step_seconds
+
+        ratio = self._mass_ratio*flow
+        d_ratio = d["mass_ratio"]*flow + self._mass_ratio*d_flow[:, None]
+        w = ratio/(1 + ratio)
+        dw = d_ratio/(1 + ratio)**2
+        for down, up in ((0, 3), (1, 0), (2, 1), (3, 2)):
+            dT[:, down] += dw[:, down]*(T[up] - T[down]) + w[down]*(dT[:, up] - dT[:, down])
+            T[down] += w[down]*(T[up] - T[down])
+
+        if zone_temp is None:
+            zone_temp = self.zone_temperature()
+        difference = T - oa_temp
+        difference[2] = T[2] - zone_temp
+        losses = difference*self._loss_factor
+        self.d_heat_loss += (dT*self._loss_factor + difference*d["loss_factor"]).sum(axis=1)
+        self.heat_loss += losses.sum(axis=0)
+        dT -= dT*self._loss_temperature + difference*d["loss_temperature"]
+        T -= difference*self._loss_temperature
+
+        outputs = np.empty((len(engine.OUTPUT_COLUMNS), self.n))
+        outputs[0:4] = T
+        outputs[4] = zone_temp
+        outputs[5] = oa_temp
+        outputs[6] = irradiance
+        outputs[7:11] = losses
+        outputs[11] = losses.sum(axis=0)
+        outputs[12] = flow
+        return outputs
+
+class GradientResult:
+    def __init__(self, values, gradients, parameters, smoothed_values=None):
+        self.values = values # (scenarios, outputs) of the hard switching engine
+        self.gradients = gradients # output -> (scenarios, parameters) derivatives per unit of each parameter
+        self.parameters = parameters # parameter values of every scenario
+        self.smoothed_values = values if smoothed_values is None else smoothed_values # outputs the gradients belong to
+
+    def elasticities(self, output) -> pd.DataFrame:
+        # % change of the output per % change of each parameter, relative to the smoothed run the gradients are of
+        return self.gradients[output]*self.parameters/self.smoothed_values[[output]].to_numpy()
+
+def gradients(weather_df: pd.DataFrame, scenarios=None, parameters=PARAMETERS, smoothing=0.2, seed=None) -> GradientResult:
+    # Pump runtime in hours and total heat loss in MJ
+    scenarios = [system.make_params()] if scenarios is None else scenarios
+    step_seconds = (weather_df.index[1] - weather_df.index[0]).total_seconds()
+    if seed is None:
+        seed = int(np.random.default_rng().integers(2**32)) # the smoothed and hard switching runs share the zone noise
+    sim = TangentEngine(scenarios, step_seconds, parameters, seed, smoothing)
+    sim.run(weather_df, record=None)
+
+    scale = np.array([1.0, 1/3600, 1/1e6])
+    def output_frame(tank, pump_seconds, heat_loss):
+        frame = pd.DataFrame(np.column_stack([tank, pump_seconds, heat_loss])*scale, columns=OUTPUTS)
+        frame.index.name = "Scenario"
+        return frame
+
+    smoothed = output_frame(sim.temperatures[2], sim.pump_seconds, sim.heat_loss)
+    values = smoothed
+    if smoothing > 0:
+        # The model's own values come from a hard switching run
+        model = engine.simulate(weather_df, sim.scenarios, record=["Flow Rates", "Total Heat Losses"], seed=seed)
+        values = output_frame(model.final_temperatures[2], (model.data["Flow Rates"] > 0).sum(axis=0)*step_seconds,
+                              model.data["Total Heat Losses"].sum(axis=0))
+    tangents = [sim.d_temperatures[:, 2], sim.d_pump_seconds, sim.d_heat_loss]
+    result = {output: pd.DataFrame(tangent.T*scale[j], columns=sim.parameters, index=values.index)
+              for j, (output, tangent) in enumerate(zip(OUTPUTS, tangents))}
+    parameter_values = pd.DataFrame([[params[name] for name in sim.parameters] for params in sim.scenarios],
+                                    columns=sim.parameters, index=values.index)
+    return GradientResult(values, result, parameter_values, smoothed)
@@ -2,30 +2,92 @@
 """
 File: inputs.py
 Author: Andrew Klavekoske
-Last Updated: 2024-07-22
+Last Updated: 2026-10-19
 
 Description: An inputs file to store functions needed as 
 inputs to the main simulation file main.py. get_weather_data() fetches local weather
-data from the NREL NSRDB API.
+data from the NREL NSRDB API and load_weather() reads the saved weather file.
+A multi-resolution pyramid of the weather (5-min, hourly and daily min/mean/max)
+is stored next to the weather file for plotting long time ranges.
+Only pandas is imported at module level so the simulation core stays light.
 """
-import requests
 import pandas as pd
 import urllib.parse
 import time
-from io import StringIO
-from dotenv import load_dotenv
 import os
-import streamlit as st
+import sys
+from functools import lru_cache
+from io import StringIO
+
+WEATHER_PATH = "Outputs/weather_data.parquet"
+PYRAMID_LEVELS = {"5min": None, "hourly": "h", "daily": "D"} # level -> resample rule
+_weather_cache = {} # path -> (modified time, weather dataframe)
+
+def get_secret(name, default=None):
+    # Streamlit secrets are only checked when running inside the app
+    if "streamlit" in sys.modules:
+        import streamlit as st
+        try:
+            return st.secrets[name]
+        except (KeyError, FileNotFoundError):
+            pass
+    return os.getenv(name, default)
+
+def _read_cached(path) -> pd.DataFrame:
+    # Files are read from disk once per process and reloaded only if they change
+    modified = os.path.getmtime(path)
+    cached = _weather_cache.get(path)
+    if cached is None or cached[0] != modified:
+        cached = (modified, pd.read_parquet(path))
+        _weather_cache[path] = cached
+    return cached[1]
+
+def load_weather(path=WEATHER_PATH, start=None, end=None) -> pd.DataFrame:
+    return _read_cached(path).loc[start:end]
 
-@st.cache_data
+# ----------------------------- Weather pyramid --------------------------------------
+def pyramid_path(level, path=WEATHER_PATH) -> str:
+    if PYRAMID_LEVELS[level] is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{level}{ext}"
+
+def build_weather_pyramid(path=WEATHER_PATH):
+    # Aggregated levels keep the min, mean and max of every column so peaks survive
+    weather_df = pd.read_parquet(path)
+    for level, rule in PYRAMID_LEVELS.items():
+        if rule is None:
+            continue
+        level_df = weather_df.resample(rule).agg(["min", "mean", "max"])
+        level_df.columns = [f"{column} {stat}" for column, stat in level_df.columns]
+        level_df.to_parquet(pyramid_path(level, path))
+
+def load_weather_level(level, start=None, end=None, path=WEATHER_PATH) -> pd.DataFrame:
+    level_path = pyramid_path(level, path)
+    if not os.path.exists(level_path) or os.path.getmtime(level_path) < os.path.getmtime(path):
+        build_weather_pyramid(path)
+    return _read_cached(level_path).loc[start:end]
+
+def select_weather_level(start, end, max_points=5000) -> str:
+    # Finest level that keeps the visible range under the point budget
+    span = pd.Timestamp(end) - pd.Timestamp(start)
+    for level, step in [("5min", "5min"), ("hourly", "1h"), ("daily", "1D")]:
+        if span/pd.Timedelta(step) <= max_points:
+            return level
+    return "daily"
+
+@lru_cache(maxsize=None)
 def get_weather_data(lat, lon, year, interval, attributes, resample="5min"):
+    import requests
+    from dotenv import load_dotenv
+
     print(f"Getting weather data for {year} at {lat}, {lon}...")
     # ----------------------------- Request data from API --------------------------------------
     load_dotenv()
-    API_KEY = st.secrets["API_KEY"] #os.getenv("API_KEY")
+    API_KEY = get_secret("API_KEY")
     BASE_URL = "https://developer.nrel.gov/api/nsrdb/v2/solar/psm3-5min-download.csv"
-    FULL_NAME = st.secrets["FULL_NAME"]#os.getenv("FULL_NAME")
-    EMAIL = st.secrets["EMAIL"] #os.getenv("EMAIL")
+    FULL_NAME = get_secret("FULL_NAME")
+    EMAIL = get_secret("EMAIL")
     url = f"{BASE_URL}?api_key={API_KEY}"
     payload = {
         "names": year,
@@ -77,7 +139,8 @@ def get_weather_data(lat, lon, year, interval, attributes, resample="5min"):
     # resample based on resample parameter
     df = df.resample(resample).interpolate()
     print(f"Done cleaning data. Weather is in {resample} intervals...")
-    df.to_parquet("Outputs/weather_data.parquet")
+    df.to_parquet(WEATHER_PATH)
+    build_weather_pyramid(WEATHER_PATH)
     
 # Weather parameters
 # year = '2022'
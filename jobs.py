@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+File: jobs.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Background simulation jobs for the dashboard. Runs are submitted to
+a thread pool so the Streamlit script thread never blocks on a long run; the
+page polls each job's progress (fraction of steps done and ETA) and can cancel
+it. Submitting a run with new parameters cancels the session's stale job
+instead of queueing behind it. Results go through sim_cache, so sessions still
+share identical runs. Results arrive in blocks while a job runs, so long runs
+can be plotted before they finish.
+"""
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from main import SimulationCancelled
+
+class Job:
+    def __init__(self, key):
+        self.key = key
+        self.done_steps = 0
+        self.total_steps = None
+        self.started = None
+        self.first_steps = 0 # steps already done at the first progress call, a job can join another session's run
+        self.finished = None
+        self.future = None
+        self.blocks = [] # columnar result blocks in the order they were simulated
+        self._cancel = threading.Event()
+
+    def progress(self, done, total) -> bool:
+        # Progress callback handed to run_sim, returns False once the job is cancelled
+        if self.started is None:
+            self.started = time.time()
+            self.first_steps = done
+        self.done_steps, self.total_steps = done, total
+        return not self._cancel.is_set()
+
+    def add_block(self, block):
+        # on_block callback handed to run_sim, list.append is atomic so readers never see a partial block
+        self.blocks.append(block)
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def state(self) -> str:
+        if not self.future.done():
+            return "cancelling" if self._cancel.is_set() else "running"
+        error = self.future.exception()
+        if isinstance(error, SimulationCancelled) or (self._cancel.is_set() and error is not None):
+            return "cancelled"
+        return "failed" if error is not None else "done"
+
+    @property
+    def fraction(self) -> float:
+        if self.future.done() and self.future.exception() is None:
+            return 1.0
+        return self.done_steps/self.total_steps if self.total_steps else 0.0
+
+    @property
+    def eta_seconds(self):
+        # Remaining time at the average speed since the job started following the run, None until there is a speed
+        if self.started is None or self.done_steps <= self.first_steps or not self.total_steps:
+            return None
+        elapsed = time.time() - self.started
+        return elapsed*(self.total_steps - self.done_steps)/(self.done_steps - self.first_steps)
+
+    def wait(self, timeout=None) -> bool:
+        try:
+            self.future.exception(timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    def result(self):
+        return self.future.result()
+
+class JobManager:
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="simulation")
+
+    def submit(self, key, function, previous: Job = None) -> Job:
+        # function(job) runs in the background and reports through job.progress and job.add_block. A previous job
+        # of the same key is reused unless it failed (a cancelled one stays cancelled until resubmitted without it),
+        # one with another key is cancelled.
+        if previous is not None:
+            if previous.key == key and previous.state != "failed":
+                return previous
+            previous.cancel()
+        job = Job(key)
+        job.future = self.executor.submit(self._run, job, function)
+        return job
+
+    @staticmethod
+    def _run(job, function):
+        try:
+            return function(job)
+        finally:
+            job.finished = time.time()
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def _new_manager() -> JobManager:
+    return JobManager()
+
+def get_manager() -> JobManager:
+    # One pool per process: a cache_resource inside the app, a module singleton elsewhere
+    global _manager
+    if "streamlit" in sys.modules:
+        import streamlit as st
+        return st.cache_resource(show_spinner=False)(_new_manager)()
+    with _manager_lock:
+        if _manager is None:
+            _manager = _new_manager()
+        return _manager
+
+def submit_simulation(previous=None, **kwargs) -> Job:
+    # sim_cache.run_sim() in the background, kwargs are its scenario arguments
+    import sim_cache
+    key = json.dumps(kwargs, sort_keys=True, default=str)
+    return get_manager().submit(key, lambda job: sim_cache.run_sim(progress=job.progress, on_block=job.add_block, **kwargs), previous)
@@ -3,103 +3,102 @@
 """
 File: main.py
 Author: Andrew Klavekoske
-Last Updated: 2024-07-22
+Last Updated: 2026-10-19
 
 Description: Physics-based thermal simulation of a solar
 hot water panel and storage tank.
 """
-import matplotlib.pyplot as plt
-import components as comps
+import inputs
+import policies
+import system
 import pandas as pd
 import random
-import streamlit as st
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-
-def run_sim(start='2022-07-01 00:00:00', end='2022-07-03 23:55:00', sim_step='5min', clouds=1, heat_loss=True, pump_control=2, flow_rate_max=0.00063, DEV=False):
+import time
+
+# Output columns in the order they are stored every time-step
+OUTPUT_COLUMNS = [
+    'Panel Temperatures',
+    'Supply Pipe Temperatures',
+    'Tank Temperatures',
+    'Return Pipe Temperatures',
+    'Zone Air Temperatures',
+    'Outside Air Temperatures',
+    'Solar Energy',
+    'Panel Heat Losses',
+    'Supply Pipe Heat Losses',
+    'Tank Heat Losses',
+    'Return Pipe Heat Losses',
+    'Total Heat Losses',
+    'Flow Rates',
+]
+
+class SimulationCancelled(Exception):
+    pass
+
+def _emit_block(sim_output_data, block_start, on_block, keep_series) -> int:
+    # Passes the rows from block_start on to on_block, returns where the next block starts
+    on_block({column: values[block_start:] for column, values in sim_output_data.items()})
+    if not keep_series:
+        for values in sim_output_data.values():
+            values.clear()
+        return 0
+    return len(sim_output_data['Time'])
+
+def run_sim(start='2022-07-01 00:00:00', end='2022-07-03 23:55:00', sim_step='5min', clouds=None, heat_loss=None, pump_control=None, flow_rate_max=None, DEV=False, timings=None,
+            output_path="Outputs/thermal-simulation.parquet", stats=None, keep_series=True, params=None, progress=None,
+            on_block=None, block_steps=2016, output_schema="full", writer=None):
+    # progress(steps done, total steps) is called every 0.5% of the run, returning False from it cancels the run.
+    # on_block(block) is called with every block_steps (a week of 5 minute steps) of new results as columnar
+    # lists {'Time': [...], column: [...]}, so callers can show a long run while it's still going.
+    # output_schema is "full" or "compact" (see schema.py), the output_path extension picks parquet or Feather.
+    # With a writer.ResultWriter the results are written in the background, flush the writer before reading them.
     # -------------------------------------------------- Inputs ------------------------------------------------
-    # System constants
-    flow_rate_initial = 0.00063 # [m^3/s] ~10gpm
-    water_density = 100 # density of water at 4°C [kg/m^3]
-    water_specific_heat = 4184 # specific heat of water at 20°C [J/kg°C]
-    air_density = 0.985 # density of air at 5000ft, 70°F, 29.7 inHg, 47% RH [kg/m^3]
-    air_specific_heat = 1.006 # specific heat of air at 20°C [J/kg°C]
-    air_heat_transfer_coeff_inside = 10 # heat transfer coefficient of air [W/m^2*K]
-    air_heat_transfer_coeff_outside = 50 # heat transfer coefficient of air [W/m^2*K]
-    water_in_pipe_heat_transfer_coeff =  1000 # heat transfer coefficient of water in pipe [W/m^2*K]
-    panel_length = 2 # [m]
-    panel_width = 1 # [m]
-    panel_height = 0.1 # [m]
-    tank_radius = 0.5 # [m]
-    tank_height = 2 # [m]
-    pipe_radius = 0.02 # [m]
-    pipe_length = 2 # [m]
-    sigma = 5.670367e-8 # Stefan-Boltzmann constant [W/m^2*K^4]
-    k_stainless_steal = 17 # Thermal conductivity of stainless steel [W/m*K]
-    k_glass = 1 # Thermal conductivity of glass [W/m*K]
-    k_cast_iron = 80 # Thermal conductivity of cast iron [W/m*K]
-    k_fiberglass = 0.036 # Thermal conductivity of fiberglass [W/m*K]
-
-    # Ambient air initial conditions
-    oa_temp = 26.6667 # [°C] Outside ambient air temperature 80°F
-    zone_temp = 21.111 # [°C] Inside ambient air temperature 70°F
+    # System constants are defined in system.py, params can override any of them and
+    # clouds, heat_loss, pump_control and flow_rate_max override params when they're given
+    params = system.run_params(params, clouds=clouds, heat_loss=heat_loss, pump_control=pump_control, flow_rate_max=flow_rate_max)
+    clouds, heat_loss = params["clouds"], params["heat_loss"]
+    zone_temp = params["zone_temp"] # [°C] Inside ambient air temperature 70°F
+    zone_temp_noise = params["zone_temp_noise"] # [°C]
+    use_mpc = params["pump_control"] == 3 and params["pump_policy"] is None
+    pump_policy = None if use_mpc else policies.compile_policies([params]) # pump_control modes and custom policies
 
     # Initialize Components
-    tank_stainless_steal = comps.Material(k_stainless_steal, zone_temp, 0.03)
-    panel_glass = comps.Material(k_glass, oa_temp, 0.01)
-    cast_iron_pipe = comps.Material(k_cast_iron, oa_temp, 0.005)
-    k_fiberglass_insulation = comps.Material(k_fiberglass, zone_temp, 0.03)
-
-    sun = comps.Sun()
-    pump = comps.Pump(flow_rate_initial)
-
-    outside_air = comps.Fluid("OA", air_density, air_specific_heat, oa_temp, heat_transfer_coefficient=air_heat_transfer_coeff_outside)
-    zone_air = comps.Fluid("ZN", air_density, air_specific_heat, zone_temp, heat_transfer_coefficient=air_heat_transfer_coeff_inside)
-    panel_water = comps.Fluid("Panel water", water_density, water_specific_heat, oa_temp, heat_transfer_coefficient=water_in_pipe_heat_transfer_coeff)
-    supply_hw = comps.Fluid("HWS", water_density, water_specific_heat, oa_temp, heat_transfer_coefficient=water_in_pipe_heat_transfer_coeff)
-    tank_water = comps.Fluid("Tank water", water_density, water_specific_heat, zone_temp, heat_transfer_coefficient=water_in_pipe_heat_transfer_coeff)
-    return_hw = comps.Fluid("HWR", water_density, water_specific_heat, oa_temp, heat_transfer_coefficient=water_in_pipe_heat_transfer_coeff)
-
-    panel = comps.SolarPanel(panel_water, panel_glass, outside_air, panel_length, panel_width, panel_height)
-    supply_pipe = comps.Pipe(supply_hw, cast_iron_pipe, outside_air, pipe_radius, pipe_length, k_fiberglass_insulation)
-    tank = comps.Tank(tank_water, tank_stainless_steal, zone_air, tank_radius, tank_height, k_fiberglass_insulation)
-    return_pipe = comps.Pipe(return_hw, cast_iron_pipe, outside_air, pipe_radius, pipe_length, k_fiberglass_insulation)
-
-    # Put Water in containers
-    panel.fluid.add_container(panel)
-    supply_pipe.fluid.add_container(supply_pipe)
-    tank.fluid.add_container(tank)
-    return_pipe.fluid.add_container(return_pipe)
+    system_components = system.build_system(params)
+    sun = system_components["sun"]
+    pump = system_components["pump"]
+    outside_air = system_components["outside_air"]
+    zone_air = system_components["zone_air"]
+    panel = system_components["panel"]
+    supply_pipe = system_components["supply_pipe"]
+    tank = system_components["tank"]
+    return_pipe = system_components["return_pipe"]
 
     # Lists to store simulation results
-    sim_output_data = {
-        'Time': [],
-        'Panel Temperatures': [],
-        'Supply Pipe Temperatures': [],
-        'Tank Temperatures': [],
-        'Return Pipe Temperatures': [],
-        'Zone Air Temperatures': [],
-        'Outside Air Temperatures': [],
-        'Solar Energy': [],
-        'Panel Heat Losses': [],
-        'Supply Pipe Heat Losses': [],
-        'Tank Heat Losses': [],
-        'Return Pipe Heat Losses': [],
-        'Total Heat Losses': [],
-        'Flow Rates': []
-    }
+    sim_output_data = {'Time': []}
+    sim_output_data.update({column: [] for column in OUTPUT_COLUMNS})
     #load weather_data
     print("Loading weather data...")
-    weather_df = pd.read_parquet('Outputs/weather_data.parquet')
+    weather_df = inputs.load_weather(start=start, end=end)
 
     # Simulation parameters
-    weather_df = weather_df.loc[start:end]
     sim_length = len(weather_df)
     sim_step_seconds = (weather_df.index[1]-weather_df.index[0]).total_seconds() # [s]
+    if use_mpc:
+        import engine
+        import mpc
+        controller = mpc.MPCController(params, sim_step_seconds, *engine.weather_arrays(weather_df),
+                                       weather_df.index.hour.to_numpy(), **(params["mpc"] or {}))
     # ---------------------------------------------- Simulation ------------------------------------------------
     # Simulation loop in seconds
     print(f"Starting simulation at {sim_step} intervals...")
+    if timings is not None:
+        timings["first_step"] = time.perf_counter()
+    progress_every = max(sim_length//200, 1)
+    store_series = keep_series or on_block is not None
+    block_start = 0 # first stored row not yet passed to on_block
     for i in range(sim_length):
+        if progress is not None and i % progress_every == 0 and progress(i, sim_length) is False:
+            raise SimulationCancelled(f"Simulation cancelled after {i} of {sim_length} steps")
         # Update sun energy
         if clouds == 1:
             sun.irradiance = weather_df.iloc[i]['GHI']
@@ -113,15 +112,11 @@ def run_sim(start='2022-07-01 00:00:00', end='2022-07-03 23:55:00', sim_step='5m
         panel.fluid.add_energy(energy_to_panel)
 
         # Pump control
-        if pump_control == 0:
-            pump.flow_rate = 0
-        elif pump_control == 1:
-            pump.flow_rate = flow_rate_max
-        elif pump_control == 2:
-            if supply_pipe.fluid.temperature < tank.fluid.temperature:
-                pump.flow_rate = 0
-            else:
-                pump.flow_rate = flow_rate_max
+        if use_mpc:
+            pump.flow_rate = controller.flow(i, [panel.fluid.temperature, supply_pipe.fluid.temperature,
+                                                 tank.fluid.temperature, return_pipe.fluid.temperature])
+        else:
+            pump.flow_rate = float(pump_policy.flow(supply_pipe.fluid.temperature, tank.fluid.temperature, weather_df.index[i].hour)[0])
 
         # Move and mix the fluids - This updates all fluid temps
         panel.fluid.mix_with(return_pipe.fluid, pump.flow_rate, sim_step_seconds)
@@ -131,7 +126,7 @@ def run_sim(start='2022-07-01 00:00:00', end='2022-07-03 23:55:00', sim_step='5m
       
         # Heat loss
         outside_air.temperature = weather_df.iloc[i]['Temperature']
-        zone_air.temperature = zone_temp + random.uniform(-0.5, 0.5)        
+        zone_air.temperature = zone_temp + random.uniform(-zone_temp_noise, zone_temp_noise)        
         if heat_loss:
             panel_heat_loss = panel.heat_loss(sim_step_seconds)
             supply_pipe_heat_loss = supply_pipe.heat_loss(sim_step_seconds)
@@ -152,150 +147,42 @@ def run_sim(start='2022-07-01 00:00:00', end='2022-07-03 23:55:00', sim_step='5m
         # store temperatures and energies and flows
         heat_transferred_to_air = (panel_heat_loss + supply_pipe_heat_loss +
                                     tank_heat_loss + return_pipe_heat_loss)
-        sim_output_data['Time'].append(weather_df.index[i])
-        sim_output_data['Solar Energy'].append(sun.irradiance)
-        sim_output_data['Panel Temperatures'].append(panel.fluid.temperature)
-        sim_output_data['Supply Pipe Temperatures'].append(supply_pipe.fluid.temperature)
-        sim_output_data['Tank Temperatures'].append(tank.fluid.temperature)
-        sim_output_data['Return Pipe Temperatures'].append(return_pipe.fluid.temperature)
-        sim_output_data['Zone Air Temperatures'].append(zone_air.temperature)
-        sim_output_data['Outside Air Temperatures'].append(outside_air.temperature)
-        sim_output_data['Panel Heat Losses'].append(panel_heat_loss)
-        sim_output_data['Supply Pipe Heat Losses'].append(supply_pipe_heat_loss)
-        sim_output_data['Tank Heat Losses'].append(tank_heat_loss)
-        sim_output_data['Return Pipe Heat Losses'].append(return_pipe_heat_loss)
-        sim_output_data['Total Heat Losses'].append(heat_transferred_to_air)
-        sim_output_data['Flow Rates'].append(pump.flow_rate)
+        step_outputs = [panel.fluid.temperature, supply_pipe.fluid.temperature, tank.fluid.temperature,
+                        return_pipe.fluid.temperature, zone_air.temperature, outside_air.temperature,
+                        sun.irradiance, panel_heat_loss, supply_pipe_heat_loss, tank_heat_loss,
+                        return_pipe_heat_loss, heat_transferred_to_air, pump.flow_rate]
+        if store_series:
+            sim_output_data['Time'].append(weather_df.index[i])
+            for column, value in zip(OUTPUT_COLUMNS, step_outputs):
+                sim_output_data[column].append(value)
+            if on_block is not None and ((i + 1) % block_steps == 0 or i == sim_length - 1):
+                block_start = _emit_block(sim_output_data, block_start, on_block, keep_series)
+        # Online statistics so long runs don't need the raw series
+        if stats is not None:
+            stats.update(step_outputs, weather_df.index[i], energy_to_panel, sim_step_seconds)
     print("Simulation complete!")
+    if progress is not None:
+        progress(sim_length, sim_length)
+    if timings is not None:
+        timings["sim_complete"] = time.perf_counter()
+        if use_mpc:
+            timings["mpc"] = controller.timing_report()
 
     # ------------------------------------------------ Outputs --------------------------------------------------
+    if not keep_series:
+        return None
     sim_df = pd.DataFrame(sim_output_data)
-    x = weather_df.index  # time
-    panel_color = "firebrick"
-    supply_pipe_color = "chocolate"
-    tank_color = "orange"
-    return_pipe_color = "blue"
-    sun_color = "goldenrod"
-    oat_color = "green"
-    zone_air_color = "indigo"
-
-    plt.style.use("Solarize_Light2")
-    fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(18, 14), sharex=True)
-    plt.tight_layout()
-    fig.subplots_adjust(right=0.83, left= 0.05, top=0.97)
-
-    # Weather plot 
-    ax1.set_title("Solar Water Heating Simulation", fontweight='bold')
-    ax1.plot(x, sim_df["Solar Energy"], label="Irradiance", color=sun_color)
-    ax1_twin = ax1.twinx()
-    ax1_twin.plot(x, sim_df["Outside Air Temperatures"], label="Outside Air Temp", color=oat_color, linestyle="--")
-    ax1_twin.plot(x, sim_df["Zone Air Temperatures"], label="Zone Air Temp", color=zone_air_color, linestyle=":")
-    ax1.set_ylabel("Irradiance (W/m^2)", color=sun_color, fontweight='bold')
-    ax1.tick_params(axis="y", labelcolor=sun_color)
-    ax1_twin.set_ylabel("Temperature (°C)", color=oat_color, fontweight='bold')
-    ax1_twin.tick_params(axis="y", labelcolor=oat_color)
-    lines_1, labels_1 = ax1.get_legend_handles_labels()
-    lines_2, labels_2 = ax1_twin.get_legend_handles_labels()
-    ax1.legend(lines_1 + lines_2, labels_1 + labels_2, loc='upper left', bbox_to_anchor=(1.05, 1.02))
-    ax1.grid(True, linestyle='--', alpha=0.7)
-
-    ax1_twin.grid(True, linestyle=':', alpha=0.5)
-
-    # Temperature plot
-    ax2.plot(x, sim_df["Panel Temperatures"], label="Panel Fluid Temp", color=panel_color)
-    ax2.plot(x, sim_df["Supply Pipe Temperatures"], label="Supply Pipe Fluid Temp", color=supply_pipe_color, linestyle=":")
-    ax2.plot(x, sim_df["Tank Temperatures"], label="Tank Fluid Temp", color=tank_color)
-    ax2.plot(x, sim_df["Return Pipe Temperatures"], label="Return Pipe Fluid Temp", color=return_pipe_color, linestyle=":")
-    ax2.set_ylabel("Temperature (°C)", fontweight='bold')
-    ax2.tick_params(axis="y")
-    ax2.legend(loc='upper left', bbox_to_anchor=(1.05, 1.02))
-    ax2_twin = ax2.twinx()
-    ax2_twin.plot(x, sim_df["Flow Rates"], label="Flow Rate", color='purple', alpha=0.5, zorder=0)
-    ax2_twin.set_ylabel("Flow Rate (m^3/s)", color='purple', fontweight='bold')
-    ax2_twin.tick_params(axis="y", labelcolor='purple')
-    ax2.grid(True, linestyle='--', alpha=0.7)
-    ax2_twin.grid(True, linestyle=':', alpha=0.5)
-
-    # Combine legends
-    lines_2, labels_2 = ax2.get_legend_handles_labels()
-    lines_2_twin, labels_2_twin = ax2_twin.get_legend_handles_labels()
-    ax2.legend(lines_2 + lines_2_twin, labels_2 + labels_2_twin, loc='upper left', bbox_to_anchor=(1.05, 1.02))
-    
-    # Heat Loss plot
-    ax3.plot(x, sim_df["Supply Pipe Heat Losses"], label="Pipe Heat Loss", color=supply_pipe_color, linestyle=":")
-    ax3.plot(x, sim_df["Tank Heat Losses"], label="Tank Heat Loss", color=tank_color)
-    ax3.plot(x, sim_df["Return Pipe Heat Losses"], label="Return Pipe Heat Loss", color=return_pipe_color, linestyle=":")
-    ax3_twin = ax3.twinx()
-    ax3_twin.set_ylabel("Panel Heat Loss (J)", color=panel_color, fontweight='bold')
-    ax3_twin.tick_params(axis="y", labelcolor=panel_color)
-    ax3_twin.plot(x, sim_df["Panel Heat Losses"], label="Panel Heat Loss", color=panel_color)
-    ax3.set_ylabel("Heat Loss (J)", fontweight='bold')
-    ax3.tick_params(axis="y")
-    lines_3, labels_3 = ax3.get_legend_handles_labels()
-    lines_4, labels_4 = ax3_twin.get_legend_handles_labels()
-    ax3.legend(lines_3 + lines_4, labels_3 + labels_4, loc='upper left', bbox_to_anchor=(1.05, 1.02))
-    ax3.grid(True, linestyle='--', alpha=0.7)
-    ax3_twin.grid(True, linestyle=':', alpha=0.5)
-
     if DEV:
-        #To show plots in Ubuntu - uncomment if running in DEV on Ubuntu 
-        import matplotlib
-        matplotlib.use("TkAgg") 
-        plt.show()
-    else:
-        plt.savefig("Outputs/thermal-simulation.png")
-        sim_df.to_parquet("Outputs/thermal-simulation.parquet", index=False)
-def sim_output_plot(df):
-    with st.spinner("Plotting results..."):
-        fig = make_subplots(rows=3, cols=1, shared_xaxes=True, vertical_spacing=0.04, specs=[[{"secondary_y": True}], [{"secondary_y": True}], [{"secondary_y": True}]], subplot_titles=("Weather", "Temperatures & Flow", "Heat Losses"))
-
-        # Weather plot
-        fig.add_trace(go.Scatter(x=df['Time'], y=df['Solar Energy'], name="Irradiance", line=dict(color="goldenrod")), row=1, col=1, secondary_y=False)
-        fig.add_trace(go.Scatter(x=df['Time'], y=df['Outside Air Temperatures'], name="Outside Air Temp", line=dict(color="green", dash="dash")), row=1, col=1, secondary_y=True)
-        fig.add_trace(go.Scatter(x=df['Time'], y=df['Zone Air Temperatures'], name="Zone Air Temp", line=dict(color="indigo", dash="dot")), row=1, col=1, secondary_y=True)
-
-        # Temperature plot
-        fig.add_trace(go.Scatter(x=df['Time'], y=df['Panel Temperatures'], name="Panel Fluid Temp", line=dict(color="firebrick")), row=2, col=1, secondary_y=False)
-        fig.add_trace(go.Scatter(x=df['Time'], y=df['Supply Pipe Temperatures'], name="Supply Pipe Fluid Temp", line=dict(color="chocolate", dash="dot")), row=2, col=1, secondary_y=False)
-        fig.add_trace(go.Scatter(x=df['Time'], y=df['Tank Temperatures'], name="Tank Fluid Temp", line=dict(color="orange")), row=2, col=1, secondary_y=False)
-        fig.add_trace(go.Scatter(x=df['Time'], y=df['Return Pipe Temperatures'], name="Return Pipe Fluid Temp", line=dict(color="blue", dash="dot")), row=2, col=1, secondary_y=False)
-        fig.add_trace(go.Scatter(x=df['Time'], y=df['Flow Rates'], name="Flow Rate", line=dict(color="purple"), opacity=0.5), row=2, col=1, secondary_y=True)
-    
-        # Heat Loss plot
-        fig.add_trace(go.Scatter(x=df['Time'], y=df['Supply Pipe Heat Losses'], name="Pipe Heat Loss", line=dict(color="chocolate", dash="dot")), row=3, col=1, secondary_y=False)
-        fig.add_trace(go.Scatter(x=df['Time'], y=df['Tank Heat Losses'], name="Tank Heat Loss", line=dict(color="orange")), row=3, col=1, secondary_y=False)
-        fig.add_trace(go.Scatter(x=df['Time'], y=df['Return Pipe Heat Losses'], name="Return Pipe Heat Loss", line=dict(color="blue", dash="dot")), row=3, col=1, secondary_y=False)
-        fig.add_trace(go.Scatter(x=df['Time'], y=df['Panel Heat Losses'], name="Panel Heat Loss", line=dict(color="firebrick")), row=3, col=1, secondary_y=True)
-        
-        # Update y-axes labels
-        fig.update_yaxes(title_text="Irradiance (W/m²)", secondary_y=False, row=1, col=1, title_font=dict(color="goldenrod"), tickfont=dict(color="goldenrod"))
-        fig.update_yaxes(title_text="Temperature (°C)", secondary_y=True, row=1, col=1)
-        fig.update_yaxes(title_text="Temperature (°C)", secondary_y=False, row=2, col=1)
-        fig.update_yaxes(title_text="Flow Rate (m³/s)", secondary_y=True, row=2, col=1, title_font=dict(color="purple"), tickfont=dict(color="purple"))
-        fig.update_yaxes(title_text="Heat Loss (J)", secondary_y=False, row=3, col=1)
-        fig.update_yaxes(title_text="Panel Heat Loss (J)", secondary_y=True, row=3, col=1, title_font=dict(color="firebrick"), tickfont=dict(color="firebrick"))        
-        
-        # Create separate legend groups
-        for i in range(1, 4):
-            for trace in fig.select_traces(row=i):
-                trace.update(legendgroup=f"group{i}")
-
-        # Position legends
-        fig.update_layout(
-            height=1000,
-            width=1200,
-            legend=dict(
-                orientation="v",
-                yanchor="top",
-                y=1,
-                xanchor="left",
-                x=1.01,
-                traceorder="grouped"
-            ),
-            legend_tracegroupgap=200,
-            hovermode="x unified"
-        )
-        return fig
+        # Plotting is only done on request, batch runs never import matplotlib
+        import plotting
+        plotting.show_sim_figure(sim_df)
+    elif output_path is not None and writer is not None:
+        writer.write_results(sim_df, output_path, output_schema)
+    elif output_path is not None:
+        import schema
+        schema.write_results(sim_df, output_path, output_schema)
+    return sim_df
 
 if __name__ == "__main__":
-    run_sim()
+    import cli
+    cli.main()
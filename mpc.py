@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+File: mpc.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Model predictive pump control (pump_control = 3). At every decision
+interval the current temperatures are rolled forward over a weather forecast
+horizon under a set of candidate flow schedules, and the schedule that stores
+the most energy in the tank net of pump energy is picked. Only its first
+interval is applied before planning again (receding horizon).
+- Candidate schedules run the pump at a few speed levels over every window of
+  the horizon, plus random on/off schedules
+- All candidates are rolled out together in one batch engine built once per
+  controller; each decision only loads the live temperatures into it
+- Pump electric power follows the affinity laws, pump_power*speed^3
+- Every decision is timed so it can be checked against the control interval
+"""
+import time
+import numpy as np
+import engine
+
+SETTINGS = {
+    "horizon_hours": 12, # forecast horizon of every rollout
+    "interval_minutes": 60, # time between decisions, the pump speed is held in between
+    "levels": [0.5, 1.0], # pump speeds (fraction of flow_rate_max) of the window schedules
+    "n_random": 64, # extra random on/off schedules
+    "pump_energy_weight": 1.0, # J of stored heat one J of pump electricity is worth
+    "seed": 0,
+}
+
+def candidate_schedules(blocks, levels, n_random, rng) -> np.ndarray:
+    # (candidates, blocks) pump speeds, every [start, end) window at every level, all off and random on/off schedules
+    schedules = [np.zeros(blocks)]
+    for level in levels:
+        for start in range(blocks):
+            for end in range(start + 1, blocks + 1):
+                schedule = np.zeros(blocks)
+                schedule[start:end] = level
+                schedules.append(schedule)
+    schedules.extend(rng.integers(0, 2, size=(n_random, blocks))*max(levels))
+    return np.unique(np.array(schedules), axis=0)
+
+class MPCController:
+    def __init__(self, params, step_seconds, ghi, clear_ghi, oa_temp, hours, **settings):
+        # Weather arrays are the forecast, in run_sim it is the weather itself (a perfect forecast)
+        unknown = set(settings) - set(SETTINGS)
+        if unknown:
+            raise KeyError(f"Unknown MPC settings: {sorted(unknown)}")
+        self.settings = dict(SETTINGS, **settings)
+        self.step_seconds = step_seconds
+        self.ghi, self.clear_ghi, self.oa_temp, self.hours = ghi, clear_ghi, oa_temp, hours
+        self.steps_per_block = max(int(round(self.settings["interval_minutes"]*60/step_seconds)), 1)
+        self.blocks = max(int(round(self.settings["horizon_hours"]*60/self.settings["interval_minutes"])), 1)
+        rng = np.random.default_rng(self.settings["seed"])
+        self.schedules = candidate_schedules(self.blocks, self.settings["levels"], self.settings["n_random"], rng)
+
+        # Rollout engine, the flows are given so the scenarios' own pump control is never used
+        rollout_params = dict(params, pump_control=1, pump_policy=None, mpc=None, zone_temp_noise=0.0)
+        self.engine = engine.BatchEngine([rollout_params]*len(self.schedules), step_seconds)
+        self.flow_rate_max = params["flow_rate_max"]
+        self.tank_heat_capacity = self.engine.coeffs["heat_capacity"][2, 0] # [J/°C]
+        self.pump_power = params["pump_power"]
+        self.speed = 0.0
+        self.plan = None # speeds of the chosen schedule
+        self.decision_seconds = [] # wall time of every decision
+
+    def decide(self, i, temperatures) -> np.ndarray:
+        # temperatures are taken after step i's solar gain (run_sim adds it before pump control), so the
+        # rollout's first step doesn't add it again
+        start = time.perf_counter()
+        self.engine.set_temperatures(temperatures)
+        steps = min(self.blocks*self.steps_per_block, len(self.ghi) - i)
+        zone_temp = self.engine.coeffs["zone_temp"]
+        pump_seconds = np.zeros(len(self.schedules))
+        for k in range(steps):
+            speed = self.schedules[:, k // self.steps_per_block]
+            ghi, clear_ghi = (self.ghi[i + k], self.clear_ghi[i + k]) if k else (0.0, 0.0)
+            self.engine.step(ghi, clear_ghi, self.oa_temp[i + k], zone_temp, speed*self.flow_rate_max)
+            pump_seconds += speed**3*self.step_seconds
+        stored = self.tank_heat_capacity*(self.engine.temperatures[2] - temperatures[2])
+        value = stored - self.settings["pump_energy_weight"]*self.pump_power*pump_seconds
+        self.plan = self.schedules[np.argmax(value)]
+        self.decision_seconds.append(time.perf_counter() - start)
+        return self.plan
+
+    def flow(self, i, temperatures) -> float:
+        # Flow rate for step i from the live (panel, supply pipe, tank, return pipe) temperatures
+        if i % self.steps_per_block == 0:
+            self.speed = float(self.decide(i, np.asarray(temperatures, dtype=float))[0])
+        return self.speed*self.flow_rate_max
+
+    def timing_report(self, budget_seconds=None) -> dict:
+        # Decisions have to finish within the control interval to run in real time
+        budget = self.settings["interval_minutes"]*60 if budget_seconds is None else budget_seconds
+        seconds = np.array(self.decision_seconds)
+        if len(seconds) == 0:
+            return {"decisions": 0}
+        return {
+            "decisions": len(seconds),
+            "candidates": len(self.schedules),
+            "mean [s]": float(seconds.mean()),
+            "p95 [s]": float(np.percentile(seconds, 95)),
+            "max [s]": float(seconds.max()),
+            "budget [s]": float(budget),
+            "over budget": int((seconds > budget).sum()),
+        }
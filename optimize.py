@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+"""
+File: optimize.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Multi-objective search over the variable pump settings
+(flow_rate_max and the on/off temperature difference pump_delta). Traces the
+Pareto front between tank temperature (maximized) and pump runtime (minimized)
+with an NSGA-II style genetic algorithm.
+- Every generation is simulated as one batch engine run, split into chunks
+  that run on parallel workers
+- Every candidate gets its own zone noise seed from its settings, so its
+  objectives don't depend on how the generation was chunked or on n_jobs
+- Evaluations are cached on disk by model hash, weather, seed and settings so
+  repeat runs and duplicate candidates are never simulated twice
+- The search stops early once the front's hypervolume stops improving
+"""
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import engine
+
+OPTIMIZER_DIR = "Outputs/optimizer"
+BOUNDS = {
+    "flow_rate_max": (0.0001, 0.0019), # [m^3/s]
+    "pump_delta": (0.0, 10.0), # [°C]
+}
+TANK_METRICS = ["mean", "final"]
+
+def weather_key(weather_df: pd.DataFrame) -> str:
+    data = weather_df[["GHI", "Clearsky GHI", "Temperature"]].to_numpy(dtype=float)
+    return hashlib.sha256(data.tobytes() + weather_df.index.asi8.tobytes()).hexdigest()[:16]
+
+class EvaluationCache:
+    def __init__(self, path=None):
+        self.path = path
+        self.values = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.values = json.load(f)
+
+    @staticmethod
+    def key(settings: dict) -> str:
+        return json.dumps({name: round(float(value), 10) for name, value in sorted(settings.items())})
+
+    def get(self, settings: dict):
+        return self.values.get(self.key(settings))
+
+    def set(self, settings: dict, objectives: dict):
+        self.values[self.key(settings)] = objectives
+
+    def save(self):
+        if self.path is not None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(self.values, f)
+
+def cache_path(weather_df, base_params=None, seed=0) -> str:
+    # Cached objectives depend on the zone noise, so on the seed too
+    params_key = hashlib.sha256(json.dumps([base_params or {}, seed], sort_keys=True).encode()).hexdigest()[:8]
+    return os.path.join(OPTIMIZER_DIR, f"evaluations-{engine.model_hash()}-{weather_key(weather_df)}-{params_key}.json")
+
+def scenario_seed(settings: dict, seed=0) -> int:
+    # Noise seed of one candidate, its objectives don't depend on the chunk or worker it ran in
+    return int(hashlib.sha256(f"{seed}:{EvaluationCache.key(settings)}".encode()).hexdigest()[:8], 16)
+
+def _evaluate_chunk(weather_df, scenarios, seeds):
+    sim = engine.BatchEngine(scenarios, (weather_df.index[1] - weather_df.index[0]).total_seconds(), scenario_seeds=seeds)
+    result = sim.run(weather_df, record=["Tank Temperatures", "Flow Rates"], dtype=np.float32)
+    tank = result.data["Tank Temperatures"]
+    pump_hours = (result.data["Flow Rates"] > 0).sum(axis=0)*sim.step_seconds/3600
+    return [{"mean": float(tank[:, k].mean()), "final": float(tank[-1, k]), "pump_hours": float(pump_hours[k])}
+            for k in range(len(scenarios))]
+
+def evaluate(weather_df, settings, base_params=None, cache=None, n_jobs=-1, seed=0) -> list:
+    # Only uncached candidates are simulated, split into one batch per worker
+    from joblib import Parallel, delayed, effective_n_jobs
+
+    results = [cache.get(s) if cache is not None else None for s in settings]
+    missing = [k for k, result in enumerate(results) if result is None]
+    if missing:
+        scenarios = [dict(base_params or {}, pump_control=2, **settings[k]) for k in missing]
+        workers = min(effective_n_jobs(n_jobs), len(scenarios))
+        chunks = [chunk for chunk in np.array_split(np.arange(len(scenarios)), workers) if len(chunk)]
+        seeds = [scenario_seed(settings[k], seed) for k in missing]
+        evaluated = Parallel(n_jobs=workers)(delayed(_evaluate_chunk)(weather_df, [scenarios[j] for j in chunk],
+                                                                      [seeds[j] for j in chunk])
+                                             for chunk in chunks)
+        for chunk, chunk_results in zip(chunks, evaluated):
+            for j, result in zip(chunk, chunk_results):
+                results[missing[j]] = result
+                if cache is not None:
+                    cache.set(settings[missing[j]], result)
+    return results
+
+# ----------------------------- NSGA-II --------------------------------------
+def non_dominated_fronts(F: np.ndarray) -> list:
+    # F is (candidates, objectives), all objectives minimized
+    dominates = np.all(F[:, None] <= F[None, :], axis=2) & np.any(F[:, None] < F[None, :], axis=2)
+    dominated_count = dominates.sum(axis=0)
+    fronts = []
+    current = np.flatnonzero(dominated_count == 0)
+    while len(current):
+        fronts.append(current)
+        dominated_count = dominated_count - dominates[current].sum(axis=0)
+        dominated_count[np.concatenate(fronts)] = -1
+        current = np.flatnonzero(dominated_count == 0)
+    return fronts
+
+def crowding_distance(F: np.ndarray) -> np.ndarray:
+    distance = np.zeros(len(F))
+    if len(F) <= 2:
+        return np.full(len(F), np.inf)
+    for j in range(F.shape[1]):
+        order = np.argsort(F[:, j])
+        span = F[order[-1], j] - F[order[0], j]
+        distance[order[[0, -1]]] = np.inf
+        if span > 0:
+            distance[order[1:-1]] += (F[order[2:], j] - F[order[:-2], j])/span
+    return distance
+
+def hypervolume(F: np.ndarray, reference: np.ndarray) -> float:
+    # Area dominated by a two objective front, up to the reference point
+    points = F[np.all(F < reference, axis=1)]
+    if len(points) == 0:
+        return 0.0
+    points = points[np.argsort(points[:, 0])]
+    volume, best = 0.0, reference[1]
+    for x, y in points:
+        if y < best:
+            volume += (reference[0] - x)*(best - y)
+            best = y
+    return volume
+
+def _select(F, size):
+    # Best fronts first, ties on the last front broken by crowding distance
+    chosen = []
+    for front in non_dominated_fronts(F):
+        if len(chosen) + len(front) <= size:
+            chosen.extend(front)
+        else:
+            crowding = crowding_distance(F[front])
+            chosen.extend(front[np.argsort(-crowding)[:size - len(chosen)]])
+            break
+    return np.array(chosen)
+
+def _offspring(X, F, size, rng, eta_crossover=15, eta_mutation=20):
+    # Binary tournament, simulated binary crossover and polynomial mutation on [0, 1] variables
+    ranks = np.empty(len(F), dtype=int)
+    for r, front in enumerate(non_dominated_fronts(F)):
+        ranks[front] = r
+    crowding = np.zeros(len(F))
+    for front in non_dominated_fronts(F):
+        crowding[front] = crowding_distance(F[front])
+
+    def tournament():
+        a, b = rng.integers(len(X), size=2)
+        return a if (ranks[a], -crowding[a]) < (ranks[b], -crowding[b]) else b
+
+    children = []
+    while len(children) < size:
+        p1, p2 = X[tournament()], X[tournament()]
+        u = rng.random(X.shape[1])
+        beta = np.where(u <= 0.5, (2*u)**(1/(eta_crossover + 1)), (1/(2*(1 - u)))**(1/(eta_crossover + 1)))
+        for child in (0.5*((1 + beta)*p1 + (1 - beta)*p2), 0.5*((1 - beta)*p1 + (1 + beta)*p2)):
+            mutate = rng.random(X.shape[1]) < 1/X.shape[1]
+            u = rng.random(X.shape[1])
+            delta = np.where(u < 0.5, (2*u)**(1/(eta_mutation + 1)) - 1, 1 - (2*(1 - u))**(1/(eta_mutation + 1)))
+            children.append(np.clip(child + mutate*delta, 0, 1))
+    return np.array(children[:size])
+
+class ParetoResult:
+    def __init__(self, front, evaluated, history):
+        self.front = front # Pareto set sorted by pump runtime
+        self.evaluated = evaluated # every candidate that was simulated or read from the cache
+        self.history = history # hypervolume per generation
+
+def _to_settings(X):
+    names = list(BOUNDS)
+    low = np.array([BOUNDS[name][0] for name in names])
+    high = np.array([BOUNDS[name][1] for name in names])
+    values = low + X*(high - low)
+    return [dict(zip(names, row)) for row in values]
+
+def optimize(weather_df: pd.DataFrame, pop_size=32, generations=10, patience=2, tol=5e-3, tank_metric="mean",
+             base_params=None, n_jobs=-1, seed=0, use_cache=True) -> ParetoResult:
+    if tank_metric not in TANK_METRICS:
+        raise ValueError(f"tank_metric must be one of {TANK_METRICS}")
+    rng = np.random.default_rng(seed)
+    cache = EvaluationCache(cache_path(weather_df, base_params, seed) if use_cache else None)
+
+    def objectives(X):
+        results = evaluate(weather_df, _to_settings(X), base_params, cache, n_jobs, seed)
+        return np.array([[-r[tank_metric], r["pump_hours"]] for r in results]), results
+
+    # Latin hypercube start
+    X = (rng.permuted(np.tile(np.arange(pop_size), (len(BOUNDS), 1)), axis=1).T + rng.random((pop_size, len(BOUNDS))))/pop_size
+    F, results = objectives(X)
+    evaluated = [dict(s, **r) for s, r in zip(_to_settings(X), results)]
+    reference = F.max(axis=0) + 1e-9 + 0.1*np.ptp(F, axis=0) # fixed so the hypervolumes are comparable
+    scale = np.ptp(F, axis=0) + 1e-12
+    history = [hypervolume(F/scale, reference/scale)]
+    stall = 0
+
+    for _ in range(generations - 1):
+        children = _offspring(X, F, pop_size, rng)
+        F_children, results = objectives(children)
+        evaluated += [dict(s, **r) for s, r in zip(_to_settings(children), results)]
+        X, F = np.vstack([X, children]), np.vstack([F, F_children])
+        keep = _select(F, pop_size)
+        X, F = X[keep], F[keep]
+
+        history.append(hypervolume(F/scale, reference/scale))
+        stall = stall + 1 if history[-1] - history[-2] <= tol*max(history[-2], 1e-12) else 0
+        if stall >= patience:
+            break
+    cache.save()
+
+    first = non_dominated_fronts(F)[0]
+    front = pd.DataFrame(_to_settings(X[first]))
+    front[f"tank {tank_metric} [°C]"] = -F[first, 0]
+    front["pump runtime [hrs]"] = F[first, 1]
+    front = front.drop_duplicates().sort_values("pump runtime [hrs]").reset_index(drop=True)
+    return ParetoResult(front, pd.DataFrame(evaluated), history)
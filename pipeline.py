@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""
+File: pipeline.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Training and evaluation pipeline for the Data Science page models.
+- Features (calendar columns and lagged/rolling weather) are built once per
+  result file and stored as a parquet feature store keyed by the file hash
+- Models are evaluated with blocked or rolling-origin cross-validation, leaving
+  a gap between train and test rows so neighbouring time-steps don't leak
+- Folds run in parallel across cores with joblib, together with the model that
+  is refit on every row and saved
+- Fitted models are saved uncompressed with joblib so they can be memory-mapped,
+  metrics go to json and out-of-fold predictions to .npy files that the page
+  reads lazily
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+import results_access
+import rollups
+
+FEATURE_DIR = "Outputs/features"
+MODEL_DIR = "Outputs/models"
+TARGET = "Tank Temperatures"
+WEATHER_COLUMNS = ["Solar Energy", "Outside Air Temperatures"]
+LAG_HOURS = [1, 3, 6, 24]
+ROLLING_HOURS = [6, 24]
+MODELS = ["linear", "random_forest"]
+
+def feature_path(results_path, results_hash) -> str:
+    name = os.path.splitext(os.path.basename(results_path))[0]
+    return os.path.join(FEATURE_DIR, f"{name}.{results_hash}.features.parquet")
+
+def build_features(results_df: pd.DataFrame) -> pd.DataFrame:
+    results_df = results_df.sort_values("Time").reset_index(drop=True)
+    time = pd.to_datetime(results_df["Time"])
+    step = time.iloc[1] - time.iloc[0]
+    steps_per_hour = max(int(pd.Timedelta("1h")/step), 1)
+
+    features = pd.DataFrame({
+        "Time": time,
+        "Month": time.dt.month,
+        "Day": time.dt.day,
+        "Hour": time.dt.hour,
+        "Minute": time.dt.minute,
+    })
+    for column in WEATHER_COLUMNS + ["Zone Air Temperatures"]:
+        features[column] = results_df[column]
+    # Lagged and rolling weather only look backwards in time
+    for column in WEATHER_COLUMNS:
+        for hours in LAG_HOURS:
+            features[f"{column} lag {hours}h"] = results_df[column].shift(hours*steps_per_hour)
+        for hours in ROLLING_HOURS:
+            features[f"{column} mean {hours}h"] = results_df[column].rolling(hours*steps_per_hour).mean()
+    features[TARGET] = results_df[TARGET]
+    return features.dropna().reset_index(drop=True)
+
+def write_features(results_path) -> str:
+    # Runs once per result set, the store is columnar so callers only read the columns they need
+    results_hash = rollups.file_hash(results_path)
+    path = feature_path(results_path, results_hash)
+    if not os.path.exists(path):
+        os.makedirs(FEATURE_DIR, exist_ok=True)
+        results_df = results_access.read_results(results_path, ["Time", *WEATHER_COLUMNS, "Zone Air Temperatures", TARGET])
+        build_features(results_df).to_parquet(path, index=False)
+    return path
+
+def load_features(results_path, columns=None, rows=None) -> pd.DataFrame:
+    # rows limits the read to the first rows, only the row groups holding them are decoded
+    path = write_features(results_path)
+    if rows is None:
+        return pd.read_parquet(path, columns=columns)
+    import pyarrow.parquet as pq
+    batch = next(pq.ParquetFile(path).iter_batches(batch_size=rows, columns=columns), None)
+    return batch.to_pandas() if batch is not None else pd.read_parquet(path, columns=columns)
+
+def feature_columns(features: pd.DataFrame) -> list:
+    return [column for column in features.columns if column not in ("Time", TARGET)]
+
+# ----------------------------- Cross-validation ------------------------------
+def blocked_folds(n_rows, n_folds=5, gap=288):
+    # Contiguous test blocks, training rows within `gap` steps of the block are dropped
+    bounds = np.linspace(0, n_rows, n_folds + 1).astype(int)
+    rows = np.arange(n_rows)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        train = (rows < start - gap) | (rows >= stop + gap)
+        yield rows[train], rows[start:stop]
+
+def rolling_origin_folds(n_rows, n_folds=5, gap=288, min_train=None):
+    # Train on everything before the origin, test on the next block
+    min_train = min_train or n_rows//(n_folds + 1)
+    bounds = np.linspace(min_train, n_rows, n_folds + 1).astype(int)
+    rows = np.arange(n_rows)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        yield rows[:max(start - gap, 0)], rows[start:stop]
+
+FOLDS = {"blocked": blocked_folds, "rolling": rolling_origin_folds}
+
+def make_model(name):
+    if name == "linear":
+        from sklearn.linear_model import LinearRegression
+        return LinearRegression()
+    elif name == "random_forest":
+        from sklearn.ensemble import RandomForestRegressor
+        # Folds already run in parallel so every forest uses a single core
+        return RandomForestRegressor(n_estimators=100, min_samples_leaf=5, max_samples=0.5, n_jobs=1, random_state=42)
+    raise ValueError(f"Unknown model: {name}")
+
+def metrics(actual, predicted) -> dict:
+    residuals = actual - predicted
+    mse = float(np.mean(residuals**2))
+    return {
+        "mse": mse,
+        "rmse": float(np.sqrt(mse)),
+        "mae": float(np.mean(np.abs(residuals))),
+        "r2": float(1 - np.sum(residuals**2)/np.sum((actual - actual.mean())**2)),
+    }
+
+def _fit_fold(name, X, y, train, test):
+    model = make_model(name).fit(X[train], y[train])
+    return model, model.predict(X[test])
+
+def _fit_all(name, X, y):
+    return make_model(name).fit(X, y)
+
+# ----------------------------- Pipeline --------------------------------------
+def model_paths(name) -> dict:
+    root = os.path.join(MODEL_DIR, name)
+    return {
+        "model": f"{root}.joblib",
+        "metrics": f"{root}.metrics.json",
+        "residuals": f"{root}.residuals.npy",
+    }
+
+def evaluate(results_path, name, scheme="blocked", n_folds=5, gap=288, n_jobs=-1) -> dict:
+    from joblib import Parallel, delayed, dump
+
+    features = load_features(results_path)
+    columns = feature_columns(features)
+    X = features[columns].to_numpy(dtype=float)
+    y = features[TARGET].to_numpy(dtype=float)
+    folds = list(FOLDS[scheme](len(y), n_folds, gap))
+
+    # The saved model is refit on every row alongside the folds, the folds only measure how well that generalises
+    fitted = Parallel(n_jobs=n_jobs)([delayed(_fit_fold)(name, X, y, train, test) for train, test in folds] +
+                                     [delayed(_fit_all)(name, X, y)])
+    model = fitted.pop()
+
+    # Out-of-fold rows: [actual, predicted, fold]
+    out_of_fold = np.concatenate([np.column_stack([y[test], predicted, np.full(len(test), k)])
+                                  for k, ((_, test), (_, predicted)) in enumerate(zip(folds, fitted))])
+    summary = {
+        "model": name,
+        "scheme": scheme,
+        "gap": gap,
+        "features": columns,
+        "results_hash": rollups.file_hash(results_path),
+        "folds": [metrics(y[test], predicted) for (_, test), (_, predicted) in zip(folds, fitted)],
+        "overall": metrics(out_of_fold[:, 0], out_of_fold[:, 1]),
+        "model_rows": len(y), # the saved model is fit on all rows, the metrics are out-of-fold estimates for it
+    }
+
+    paths = model_paths(name)
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    dump(model, paths["model"]) # uncompressed so joblib.load(mmap_mode="r") works
+    np.save(paths["residuals"], out_of_fold)
+    with open(paths["metrics"], "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def run_pipeline(results_path, models=MODELS, scheme="blocked", n_folds=5, gap=288, n_jobs=-1) -> dict:
+    return {name: evaluate(results_path, name, scheme, n_folds, gap, n_jobs) for name in models}
+
+# ----------------------------- Readers ---------------------------------------
+def load_metrics(name, results_path=None):
+    # None when the pipeline hasn't been run (or was run on a different result file)
+    path = model_paths(name)["metrics"]
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        summary = json.load(f)
+    if results_path is not None and summary["results_hash"] != rollups.file_hash(results_path):
+        return None
+    return summary
+
+def load_residuals(name) -> np.ndarray:
+    # Memory-mapped, slices are only read from disk when used
+    return np.load(model_paths(name)["residuals"], mmap_mode="r")
+
+def load_model(name):
+    from joblib import load
+    return load(model_paths(name)["model"], mmap_mode="r")
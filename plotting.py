@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+"""
+File: plotting.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Renderers for simulation results. Nothing in here runs as part of
+a simulation, figures are only built when a caller asks for one. matplotlib and
+plotly are imported on first use so batch runs never load them.
+"""
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import downsample
+
+RENDER_CACHE_SIZE = 8 # number of rendered figures kept in memory
+MAX_POINTS = 2000 # point budget for each interactive trace
+WEBGL_THRESHOLD = 1000 # traces with more points than this are drawn with WebGL
+_png_cache = OrderedDict() # results hash -> png bytes
+
+# Colors shared by every renderer
+PANEL_COLOR = "firebrick"
+SUPPLY_PIPE_COLOR = "chocolate"
+TANK_COLOR = "orange"
+RETURN_PIPE_COLOR = "blue"
+SUN_COLOR = "goldenrod"
+OAT_COLOR = "green"
+ZONE_AIR_COLOR = "indigo"
+
+def results_hash(sim_df: pd.DataFrame) -> str:
+    row_hashes = pd.util.hash_pandas_object(sim_df, index=False).values
+    column_names = "|".join(map(str, sim_df.columns)).encode()
+    return hashlib.sha256(column_names + row_hashes.tobytes()).hexdigest()[:16]
+
+def draw_sim_figure(sim_df: pd.DataFrame, fig):
+    x = sim_df["Time"]
+    (ax1, ax2, ax3) = fig.subplots(3, 1, sharex=True)
+    fig.tight_layout()
+    fig.subplots_adjust(right=0.83, left= 0.05, top=0.97)
+
+    # Weather plot
+    ax1.set_title("Solar Water Heating Simulation", fontweight='bold')
+    ax1.plot(x, sim_df["Solar Energy"], label="Irradiance", color=SUN_COLOR)
+    ax1_twin = ax1.twinx()
+    ax1_twin.plot(x, sim_df["Outside Air Temperatures"], label="Outside Air Temp", color=OAT_COLOR, linestyle="--")
+    ax1_twin.plot(x, sim_df["Zone Air Temperatures"], label="Zone Air Temp", color=ZONE_AIR_COLOR, linestyle=":")
+    ax1.set_ylabel("Irradiance (W/m^2)", color=SUN_COLOR, fontweight='bold')
+    ax1.tick_params(axis="y", labelcolor=SUN_COLOR)
+    ax1_twin.set_ylabel("Temperature (°C)", color=OAT_COLOR, fontweight='bold')
+    ax1_twin.tick_params(axis="y", labelcolor=OAT_COLOR)
+    lines_1, labels_1 = ax1.get_legend_handles_labels()
+    lines_2, labels_2 = ax1_twin.get_legend_handles_labels()
+    ax1.legend(lines_1 + lines_2, labels_1 + labels_2, loc='upper left', bbox_to_anchor=(1.05, 1.02))
+    ax1.grid(True, linestyle='--', alpha=0.7)
+    ax1_twin.grid(True, linestyle=':', alpha=0.5)
+
+    # Temperature plot
+    ax2.plot(x, sim_df["Panel Temperatures"], label="Panel Fluid Temp", color=PANEL_COLOR)
+    ax2.plot(x, sim_df["Supply Pipe Temperatures"], label="Supply Pipe Fluid Temp", color=SUPPLY_PIPE_COLOR, linestyle=":")
+    ax2.plot(x, sim_df["Tank Temperatures"], label="Tank Fluid Temp", color=TANK_COLOR)
+    ax2.plot(x, sim_df["Return Pipe Temperatures"], label="Return Pipe Fluid Temp", color=RETURN_PIPE_COLOR, linestyle=":")
+    ax2.set_ylabel("Temperature (°C)", fontweight='bold')
+    ax2.tick_params(axis="y")
+    ax2_twin = ax2.twinx()
+    ax2_twin.plot(x, sim_df["Flow Rates"], label="Flow Rate", color='purple', alpha=0.5, zorder=0)
+    ax2_twin.set_ylabel("Flow Rate (m^3/s)", color='purple', fontweight='bold')
+    ax2_twin.tick_params(axis="y", labelcolor='purple')
+    ax2.grid(True, linestyle='--', alpha=0.7)
+    ax2_twin.grid(True, linestyle=':', alpha=0.5)
+
+    # Combine legends
+    lines_2, labels_2 = ax2.get_legend_handles_labels()
+    lines_2_twin, labels_2_twin = ax2_twin.get_legend_handles_labels()
+    ax2.legend(lines_2 + lines_2_twin, labels_2 + labels_2_twin, loc='upper left', bbox_to_anchor=(1.05, 1.02))
+
+    # Heat Loss plot
+    ax3.plot(x, sim_df["Supply Pipe Heat Losses"], label="Pipe Heat Loss", color=SUPPLY_PIPE_COLOR, linestyle=":")
+    ax3.plot(x, sim_df["Tank Heat Losses"], label="Tank Heat Loss", color=TANK_COLOR)
+    ax3.plot(x, sim_df["Return Pipe Heat Losses"], label="Return Pipe Heat Loss", color=RETURN_PIPE_COLOR, linestyle=":")
+    ax3_twin = ax3.twinx()
+    ax3_twin.set_ylabel("Panel Heat Loss (J)", color=PANEL_COLOR, fontweight='bold')
+    ax3_twin.tick_params(axis="y", labelcolor=PANEL_COLOR)
+    ax3_twin.plot(x, sim_df["Panel Heat Losses"], label="Panel Heat Loss", color=PANEL_COLOR)
+    ax3.set_ylabel("Heat Loss (J)", fontweight='bold')
+    ax3.tick_params(axis="y")
+    lines_3, labels_3 = ax3.get_legend_handles_labels()
+    lines_4, labels_4 = ax3_twin.get_legend_handles_labels()
+    ax3.legend(lines_3 + lines_4, labels_3 + labels_4, loc='upper left', bbox_to_anchor=(1.05, 1.02))
+    ax3.grid(True, linestyle='--', alpha=0.7)
+    ax3_twin.grid(True, linestyle=':', alpha=0.5)
+    return fig
+
+def render_sim_png(sim_df: pd.DataFrame) -> bytes:
+    # Rendered pngs are cached by a hash of the results
+    key = results_hash(sim_df)
+    if key in _png_cache:
+        _png_cache.move_to_end(key)
+        return _png_cache[key]
+
+    # Figures built outside of pyplot are never registered with a figure manager,
+    # so nothing accumulates in long running processes
+    import io
+    import matplotlib.style
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    with matplotlib.style.context("Solarize_Light2"):
+        fig = Figure(figsize=(18, 14))
+        FigureCanvasAgg(fig)
+        try:
+            draw_sim_figure(sim_df, fig)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format="png")
+        finally:
+            fig.clear()
+
+    png = buffer.getvalue()
+    _png_cache[key] = png
+    if len(_png_cache) > RENDER_CACHE_SIZE:
+        _png_cache.popitem(last=False)
+    return png
+
+def save_sim_png(sim_df: pd.DataFrame, path="Outputs/thermal-simulation.png"):
+    with open(path, "wb") as f:
+        f.write(render_sim_png(sim_df))
+    return path
+
+def show_sim_figure(sim_df: pd.DataFrame):
+    #To show plots in Ubuntu - uses the TkAgg backend
+    import matplotlib
+    matplotlib.use("TkAgg")
+    import matplotlib.pyplot as plt
+
+    plt.style.use("Solarize_Light2")
+    fig = plt.figure(figsize=(18, 14))
+    try:
+        draw_sim_figure(sim_df, fig)
+        plt.show()
+    finally:
+        plt.close(fig)
+
+def scatter_trace(x, y, max_points=MAX_POINTS, webgl_threshold=WEBGL_THRESHOLD, method="lttb", **kwargs):
+    # Decimate to the point budget and switch to WebGL for large traces
+    import plotly.graph_objects as go
+
+    keep = downsample.decimate(x, y, max_points, method)
+    x = pd.Series(x).iloc[keep]
+    y = pd.Series(y).iloc[keep]
+    scatter = go.Scattergl if len(keep) > webgl_threshold else go.Scatter
+    return scatter(x=x, y=y, **kwargs)
+
+def sim_output_plot(df, max_points=MAX_POINTS, webgl_threshold=WEBGL_THRESHOLD, x_range=None):
+    # Interactive plotly version of the results used by the Streamlit pages.
+    # The figure only holds decimated traces, df keeps the full resolution data.
+    from plotly.subplots import make_subplots
+
+    if x_range is not None:
+        df = df.loc[df['Time'].between(*x_range)]
+
+    def trace(column, method="lttb", **kwargs):
+        # meta records what the trace shows so StreamingPlot can append to it
+        return scatter_trace(df['Time'], df[column], max_points, webgl_threshold, method, meta=[column, method], **kwargs)
+
+    fig = make_subplots(rows=3, cols=1, shared_xaxes=True, vertical_spacing=0.04, specs=[[{"secondary_y": True}], [{"secondary_y": True}], [{"secondary_y": True}]], subplot_titles=("Weather", "Temperatures & Flow", "Heat Losses"))
+
+    # Weather plot
+    fig.add_trace(trace('Solar Energy', name="Irradiance", line=dict(color="goldenrod")), row=1, col=1, secondary_y=False)
+    fig.add_trace(trace('Outside Air Temperatures', name="Outside Air Temp", line=dict(color="green", dash="dash")), row=1, col=1, secondary_y=True)
+    fig.add_trace(trace('Zone Air Temperatures', "minmax", name="Zone Air Temp", line=dict(color="indigo", dash="dot")), row=1, col=1, secondary_y=True)
+
+    # Temperature plot
+    fig.add_trace(trace('Panel Temperatures', name="Panel Fluid Temp", line=dict(color="firebrick")), row=2, col=1, secondary_y=False)
+    fig.add_trace(trace('Supply Pipe Temperatures', name="Supply Pipe Fluid Temp", line=dict(color="chocolate", dash="dot")), row=2, col=1, secondary_y=False)
+    fig.add_trace(trace('Tank Temperatures', name="Tank Fluid Temp", line=dict(color="orange")), row=2, col=1, secondary_y=False)
+    fig.add_trace(trace('Return Pipe Temperatures', name="Return Pipe Fluid Temp", line=dict(color="blue", dash="dot")), row=2, col=1, secondary_y=False)
+    fig.add_trace(trace('Flow Rates', "minmax", name="Flow Rate", line=dict(color="purple"), opacity=0.5), row=2, col=1, secondary_y=True)
+
+    # Heat Loss plot
+    fig.add_trace(trace('Supply Pipe Heat Losses', name="Pipe Heat Loss", line=dict(color="chocolate", dash="dot")), row=3, col=1, secondary_y=False)
+    fig.add_trace(trace('Tank Heat Losses', name="Tank Heat Loss", line=dict(color="orange")), row=3, col=1, secondary_y=False)
+    fig.add_trace(trace('Return Pipe Heat Losses', name="Return Pipe Heat Loss", line=dict(color="blue", dash="dot")), row=3, col=1, secondary_y=False)
+    fig.add_trace(trace('Panel Heat Losses', name="Panel Heat Loss", line=dict(color="firebrick")), row=3, col=1, secondary_y=True)
+    
+    # Update y-axes labels
+    fig.update_yaxes(title_text="Irradiance (W/m²)", secondary_y=False, row=1, col=1, title_font=dict(color="goldenrod"), tickfont=dict(color="goldenrod"))
+    fig.update_yaxes(title_text="Temperature (°C)", secondary_y=True, row=1, col=1)
+    fig.update_yaxes(title_text="Temperature (°C)", secondary_y=False, row=2, col=1)
+    fig.update_yaxes(title_text="Flow Rate (m³/s)", secondary_y=True, row=2, col=1, title_font=dict(color="purple"), tickfont=dict(color="purple"))
+    fig.update_yaxes(title_text="Heat Loss (J)", secondary_y=False, row=3, col=1)
+    fig.update_yaxes(title_text="Panel Heat Loss (J)", secondary_y=True, row=3, col=1, title_font=dict(color="firebrick"), tickfont=dict(color="firebrick"))        
+    
+    # Create separate legend groups
+    for i in range(1, 4):
+        for trace in fig.select_traces(row=i):
+            trace.update(legendgroup=f"group{i}")
+
+    # Position legends
+    fig.update_layout(
+        height=1000,
+        width=1200,
+        legend=dict(
+            orientation="v",
+            yanchor="top",
+            y=1,
+            xanchor="left",
+            x=1.01,
+            traceorder="grouped"
+        ),
+        legend_tracegroupgap=200,
+        hovermode="x unified"
+    )
+    return fig
+
+class StreamingPlot:
+    # sim_output_plot() of a run that is still going. The figure is built from the first block of results and
+    # every later block is decimated on its own and appended to the traces, so the figure is never rebuilt and
+    # the whole run ends up with about max_points per trace.
+    def __init__(self, start, end, total_steps, max_points=MAX_POINTS, webgl_threshold=WEBGL_THRESHOLD):
+        self.x_range = [pd.Timestamp(start), pd.Timestamp(end)]
+        self.total_steps = total_steps
+        self.max_points = max_points
+        # WebGL is picked for the size the traces will have at the end, not the size of the first block
+        self.webgl_threshold = -1 if min(total_steps, max_points) > webgl_threshold else webgl_threshold
+        self.figure = None
+        self.steps = 0
+
+    def append(self, block):
+        # block is a results dataframe or the columnar dict passed to run_sim's on_block
+        df = pd.DataFrame(block)
+        if len(df) == 0:
+            return self.figure
+        budget = max(int(round(self.max_points*len(df)/self.total_steps)), 3)
+        if self.figure is None:
+            self.figure = sim_output_plot(df, budget, self.webgl_threshold)
+            self.figure.update_xaxes(range=self.x_range)
+        else:
+            time = df['Time'].to_numpy()
+            with self.figure.batch_update():
+                for trace in self.figure.data:
+                    column, method = trace.meta
+                    keep = downsample.decimate(time, df[column], budget, method)
+                    trace.x = np.concatenate([trace.x, time[keep]])
+                    trace.y = np.concatenate([trace.y, df[column].to_numpy()[keep]])
+        self.steps += len(df)
+        return self.figure
+
+    @property
+    def fraction(self) -> float:
+        return self.steps/self.total_steps if self.total_steps else 0.0
+
+def clear_render_cache():
+    _png_cache.clear()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+File: policies.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Pump control policies. A policy is a small json-friendly dict
+(kind + settings) so it can be stored in the system parameters, cached and
+swept like any other parameter. A batch of scenarios is compiled into a
+PolicyTable that evaluates every scenario's policy with a handful of array
+operations per step, only for the kinds present in the batch.
+- off: the pump never runs
+- constant: the pump always runs at flow_rate_max
+- differential: on when the supply pipe is on_delta warmer than the tank, off
+  when the difference drops below off_delta (hysteresis/deadband)
+- proportional: variable speed, gain*(ΔT - off_delta) of flow_rate_max clipped
+  to [min_speed, 1], off below off_delta
+- schedule: on during the listed hours of the day, optionally only when ΔT is at
+  least on_delta
+"""
+import numpy as np
+
+KINDS = ["off", "constant", "differential", "proportional", "schedule"]
+
+def off() -> dict:
+    return {"kind": "off"}
+
+def constant() -> dict:
+    return {"kind": "constant"}
+
+def differential(on_delta=0.0, off_delta=None) -> dict:
+    off_delta = on_delta if off_delta is None else off_delta
+    if off_delta > on_delta:
+        raise ValueError("off_delta can't be larger than on_delta.")
+    return {"kind": "differential", "on_delta": on_delta, "off_delta": off_delta}
+
+def proportional(gain=0.2, off_delta=0.0, min_speed=0.0) -> dict:
+    # gain is the fraction of flow_rate_max per °C of supply over tank temperature
+    return {"kind": "proportional", "gain": gain, "off_delta": off_delta, "min_speed": min_speed}
+
+def schedule(hours, on_delta=None) -> dict:
+    return {"kind": "schedule", "hours": sorted(int(hour) % 24 for hour in hours), "on_delta": on_delta}
+
+def from_params(params: dict) -> dict:
+    # pump_policy wins, otherwise the classic pump_control modes
+    if params.get("pump_policy") is not None:
+        policy = dict(params["pump_policy"])
+        if policy.get("kind") not in KINDS:
+            raise ValueError(f"Unknown pump policy kind: {policy.get('kind')}, expected one of {KINDS}")
+        return policy
+    pump_control = params["pump_control"]
+    if pump_control == 0:
+        return off()
+    elif pump_control == 1:
+        return constant()
+    elif pump_control == 2:
+        return differential(params["pump_delta"])
+    elif pump_control == 3:
+        raise ValueError("pump_control 3 is the model predictive controller in mpc.py, not a pump policy.")
+    raise ValueError(f"pump_control {pump_control} has no pump policy.")
+
+class PolicyTable:
+    def __init__(self, policies, flow_rate_max):
+        self.policies = [dict(policy) for policy in policies]
+        n = len(self.policies)
+        kinds = np.array([KINDS.index(policy["kind"]) for policy in self.policies])
+        self.flow_rate_max = np.broadcast_to(np.asarray(flow_rate_max, dtype=float), (n,)).copy()
+        self.pump_on = np.zeros(n, dtype=bool)
+
+        def setting(name, default=0.0):
+            return np.array([policy.get(name) if policy.get(name) is not None else default for policy in self.policies], dtype=float)
+
+        # Only kinds that are present are evaluated every step
+        self.present = [kind for kind in KINDS if (kinds == KINDS.index(kind)).any()]
+        self.masks = {kind: kinds == KINDS.index(kind) for kind in self.present}
+        self.on_delta = np.where(self.masks.get("schedule", False), setting("on_delta", -np.inf), setting("on_delta"))
+        self.off_delta = setting("off_delta")
+        self.gain = setting("gain")
+        self.min_speed = setting("min_speed")
+        self.hours = np.zeros((24, n), dtype=bool) # allowed hours of the schedule policies
+        for k, policy in enumerate(self.policies):
+            if policy["kind"] == "schedule":
+                self.hours[policy["hours"], k] = True
+        self.constant_speed = self.masks.get("constant", np.zeros(n, dtype=bool)).astype(float)
+
+    def reset(self):
+        self.pump_on[:] = False
+
+    def speed(self, supply, tank, hour=0) -> np.ndarray:
+        # Fraction of flow_rate_max for every scenario, updates the on/off state used by the hysteresis
+        speed = self.constant_speed
+        delta = supply - tank
+        for kind in self.present:
+            if kind == "differential":
+                value = np.where(self.pump_on, delta >= self.off_delta, delta >= self.on_delta)
+            elif kind == "proportional":
+                value = np.where(delta >= self.off_delta, np.clip(self.gain*(delta - self.off_delta), self.min_speed, 1.0), 0.0)
+            elif kind == "schedule":
+                value = self.hours[hour] & (delta >= self.on_delta)
+            else:
+                continue
+            speed = value if len(self.present) == 1 else np.where(self.masks[kind], value, speed)
+        self.pump_on = speed > 0
+        return speed
+
+    def smooth_speed(self, supply, tank, hour=0, smoothing=0.2):
+        # speed() with every on/off switch relaxed into a logistic step `smoothing` °C wide so it has a derivative,
+        # hard switches without smoothing.
+        # Returns the speed, the on fraction (pump runtime) and their slopes d/dΔT, updates the on/off state.
+        def switch(x):
+            if smoothing <= 0:
+                return (x >= 0).astype(float), np.zeros_like(x)
+            z = np.exp(-np.abs(x)/smoothing)
+            on = np.where(x >= 0, 1/(1 + z), z/(1 + z))
+            return on, z/(smoothing*(1 + z)**2)
+
+        delta = supply - tank
+        speed, speed_slope = self.constant_speed.copy(), np.zeros(len(self.policies))
+        on, on_slope = self.constant_speed.copy(), np.zeros(len(self.policies))
+        for kind in self.present:
+            if kind == "differential":
+                value, slope = switch(delta - np.where(self.pump_on, self.off_delta, self.on_delta))
+                running, running_slope = value, slope
+            elif kind == "proportional":
+                running, running_slope = switch(delta - self.off_delta)
+                raw = self.gain*(delta - self.off_delta)
+                level = np.clip(raw, self.min_speed, 1.0)
+                value = running*level
+                slope = running_slope*level + running*np.where((raw > self.min_speed) & (raw < 1.0), self.gain, 0.0)
+            elif kind == "schedule":
+                running, running_slope = switch(delta - self.on_delta)
+                running, running_slope = self.hours[hour]*running, self.hours[hour]*running_slope
+                value, slope = running, running_slope
+            else:
+                continue
+            mask = self.masks[kind]
+            speed, speed_slope = np.where(mask, value, speed), np.where(mask, slope, speed_slope)
+            on, on_slope = np.where(mask, running, on), np.where(mask, running_slope, on_slope)
+        self.pump_on = on >= 0.5
+        return speed, speed_slope, on, on_slope
+
+    def flow(self, supply, tank, hour=0) -> np.ndarray:
+        return self.speed(supply, tank, hour)*self.flow_rate_max
+
+def compile_policies(scenarios) -> PolicyTable:
+    return PolicyTable([from_params(params) for params in scenarios], [params["flow_rate_max"] for params in scenarios])
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+File: results_access.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Shared read access to result files for the report pages. A result
+file is opened once per process as a memory-mapped Arrow table and every read
+takes only the columns and time window it asks for, so page memory and load
+time follow the data shown rather than the file size.
+- Parquet files are converted once into an uncompressed Arrow IPC sidecar next
+  to them (<name>.<key>.columns.arrow), Feather/Arrow files are mapped directly
+- Column and row selections are zero-copy slices of the mapped file, the OS
+  only pages in what is read
+- Handles are keyed by path, size and modification time: inside the app they
+  are a st.cache_resource shared by all pages and sessions, elsewhere a module
+  level cache
+"""
+import glob
+import hashlib
+import json
+import os
+import sys
+import threading
+import numpy as np
+import pandas as pd
+import schema
+
+def file_key(path) -> str:
+    # Changes whenever the file is rewritten, without reading it
+    status = os.stat(path)
+    return hashlib.sha256(f"{os.path.abspath(path)}|{status.st_size}|{status.st_mtime_ns}".encode()).hexdigest()[:16]
+
+def sidecar_path(path, key) -> str:
+    root, _ = os.path.splitext(path)
+    return f"{root}.{key}.columns.arrow"
+
+def write_sidecar(path, key) -> str:
+    # Parquet row groups are streamed into an uncompressed IPC file, older sidecars of the same file are replaced
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    target = sidecar_path(path, key)
+    if os.path.exists(target):
+        return target
+    source = pq.ParquetFile(path)
+    temporary = f"{target}.{os.getpid()}.tmp"
+    with pa.OSFile(temporary, "wb") as sink, pa.ipc.new_file(sink, source.schema_arrow) as writer:
+        for batch in source.iter_batches():
+            writer.write_batch(batch)
+    root, _ = os.path.splitext(path)
+    for stale in glob.glob(f"{glob.escape(root)}.*.columns.arrow"):
+        os.remove(stale)
+    os.replace(temporary, target)
+    return target
+
+class ResultsHandle:
+    def __init__(self, path):
+        import pyarrow as pa
+        self.path = path
+        self.key = file_key(path)
+        mapped = write_sidecar(path, self.key) if schema.file_format(path) == "parquet" else path
+        self.table = pa.ipc.open_file(pa.memory_map(mapped)).read_all() # buffers point into the mapping
+        metadata = (self.table.schema.metadata or {}).get(schema.METADATA_KEY)
+        self.metadata = json.loads(metadata) if metadata else None
+        self._time = None
+        self._lock = threading.Lock()
+
+    @property
+    def columns(self) -> list:
+        time = ["Time"] if self.metadata and self.metadata["time"] else []
+        return time + [name for name in self.table.column_names if not name.startswith("__")]
+
+    def __len__(self):
+        return self.table.num_rows
+
+    @property
+    def time(self) -> np.ndarray:
+        # int64 nanoseconds of every row, read from the Time column or rebuilt from the compact schema metadata
+        with self._lock:
+            if self._time is None:
+                if self.metadata and self.metadata["time"]:
+                    self._time = schema.decode(self.table.select([]), ["Time"])["Time"].to_numpy("datetime64[ns]").view(np.int64)
+                else:
+                    self._time = pd.DatetimeIndex(self.table.column("Time").to_pandas()).as_unit("ns").asi8
+            return self._time
+
+    def rows(self, start=None, end=None):
+        # (first row, row count) of [start, end] for time sorted files, a boolean mask otherwise (e.g. batch tables)
+        if start is None and end is None:
+            return 0, len(self)
+        time = self.time
+        low = pd.Timestamp(start).as_unit("ns").value if start is not None else np.iinfo(np.int64).min
+        high = pd.Timestamp(end).as_unit("ns").value if end is not None else np.iinfo(np.int64).max
+        if len(time) < 2 or np.all(time[1:] >= time[:-1]):
+            first, last = np.searchsorted(time, low, "left"), np.searchsorted(time, high, "right")
+            return int(first), int(last - first)
+        return (time >= low) & (time <= high)
+
+    def read(self, columns=None, start=None, end=None) -> pd.DataFrame:
+        # Only the requested columns and the rows between start and end (inclusive) are touched
+        columns = self.columns if columns is None else list(columns)
+        missing = set(columns) - set(self.columns)
+        if missing:
+            raise KeyError(f"Columns not in {self.path}: {sorted(missing)}")
+        stored = [column for column in columns if column in self.table.column_names]
+        table = self.table.select(stored)
+        rows = self.rows(start, end)
+        if isinstance(rows, tuple):
+            offset, length = rows
+            table = table.slice(offset, length)
+            return schema.decode(table, columns, offset)
+        df = schema.decode(table, columns)
+        return df.loc[rows].reset_index(drop=True)
+
+_handles = {}
+_handles_lock = threading.Lock()
+
+def _new_handle(path, key) -> ResultsHandle:
+    return ResultsHandle(path)
+
+def open_results(path) -> ResultsHandle:
+    # One handle per file version and process: a cache_resource inside the app, a module level cache elsewhere
+    key = file_key(path)
+    if "streamlit" in sys.modules:
+        import streamlit as st
+        return st.cache_resource(show_spinner=False, max_entries=8)(_new_handle)(path, key)
+    with _handles_lock:
+        handle = _handles.get(path)
+        if handle is None or handle.key != key:
+            handle = _handles[path] = ResultsHandle(path)
+        return handle
+
+def read_results(path, columns=None, start=None, end=None) -> pd.DataFrame:
+    return open_results(path).read(columns, start, end)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+File: rollups.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Post-processing stage for simulation result files. Aggregates,
+statistics and regressions used by the Data Analysis page are computed once per
+result set and stored in a small sidecar file keyed by the hash of the result
+file, so the page only reads precomputed tables.
+"""
+import glob
+import hashlib
+import os
+import pickle
+import pandas as pd
+import results_access
+
+SEASONS = {12:'Winter', 1:'Winter', 2:'Winter',
+           3:'Spring', 4:'Spring', 5:'Spring',
+           6:'Summer', 7:'Summer', 8:'Summer',
+           9:'Fall', 10:'Fall', 11:'Fall'}
+REGRESSION_TARGETS = ["Tank Heat Losses", "Supply Pipe Temperatures", "Outside Air Temperatures"]
+
+_hashes = {} # results_access.file_key -> content hash, a file is only read again once it changes
+
+def file_hash(path) -> str:
+    key = results_access.file_key(path)
+    if key not in _hashes:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        _hashes[key] = sha.hexdigest()[:16]
+    return _hashes[key]
+
+def rollup_path(results_path, results_hash) -> str:
+    root, _ = os.path.splitext(results_path)
+    return f"{root}.{results_hash}.rollups.pkl"
+
+def build_rollups(results_df: pd.DataFrame) -> dict:
+    from scipy import stats
+
+    results_df = results_df.copy()
+    results_df['Time'] = pd.to_datetime(results_df['Time'])
+    results_df = results_df.set_index('Time')
+
+    # Aggregates
+    hourly = results_df.resample('h').mean()
+    daily = results_df.resample('D').agg(["min", "mean", "max"])
+    daily.columns = [f"{column} {stat}" for column, stat in daily.columns]
+
+    corr = hourly.corr()
+
+    # Tank temperature statistics
+    tank = hourly["Tank Temperatures"]
+    seasons = hourly.index.month.map(SEASONS)
+    seasonal = tank.groupby(seasons)
+    seasonal_extrema = pd.DataFrame({
+        "max": seasonal.max(),
+        "time of max": seasonal.idxmax(),
+        "min": seasonal.min(),
+        "time of min": seasonal.idxmin(),
+    })
+
+    # Per season linear regressions of each target against tank temperature
+    regressions = []
+    for season, season_df in hourly.groupby(seasons):
+        for target in REGRESSION_TARGETS:
+            fit = stats.linregress(season_df["Tank Temperatures"], season_df[target])
+            regressions.append({
+                "Season": season,
+                "Target": target,
+                "slope": fit.slope,
+                "intercept": fit.intercept,
+                "r_value": fit.rvalue,
+                "p_value": fit.pvalue,
+                "std_err": fit.stderr,
+            })
+
+    hourly = hourly.reset_index()
+    hourly["Season"] = hourly["Time"].dt.month.map(SEASONS)
+    return {
+        "hourly": hourly,
+        "daily": daily.reset_index(),
+        "describe": tank.describe(),
+        "tank_start": tank.iloc[0],
+        "tank_max": tank.max(),
+        "time_of_tank_max": tank.idxmax(),
+        "seasonal_extrema": seasonal_extrema,
+        "corr": corr,
+        "regressions": pd.DataFrame(regressions).set_index(["Season", "Target"]),
+    }
+
+def write_rollups(results_path) -> str:
+    # Runs once per result set, older sidecars for the same result file are replaced
+    results_hash = file_hash(results_path)
+    path = rollup_path(results_path, results_hash)
+    if os.path.exists(path):
+        return path
+    rollups = build_rollups(results_access.read_results(results_path))
+    rollups["results_hash"] = results_hash
+    root, _ = os.path.splitext(results_path)
+    for stale in glob.glob(f"{glob.escape(root)}.*.rollups.pkl"):
+        os.remove(stale)
+    with open(path, "wb") as f:
+        pickle.dump(rollups, f)
+    return path
+
+def load_rollups(results_path) -> dict:
+    with open(write_rollups(results_path), "rb") as f:
+        return pickle.load(f)
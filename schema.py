@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+File: schema.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Storage schema of simulation results. Results are written as zstd
+parquet or Arrow IPC (Feather v2) files, picked by the file extension.
+- "full" keeps every column as it is in memory: float64 values and a Time column
+- "compact" stores floats as float32, pump columns as an int8 code into the
+  run's flow levels (e.g. [0, flow_rate_max]) and a regular Time column as
+  start + step metadata instead of a column
+- Batch engine results are written as one long table with a Scenario column
+- read_results() restores the Time column and flow rates of either schema and
+  memory maps the file, uncompressed Feather files are read without copying
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+
+METADATA_KEY = b"thermal_simulation"
+PUMP_COLUMNS = ["Flow Rates"] # columns that only take a few values per run
+MAX_LEVELS = 127 # most distinct values an int8 pump code can index
+FORMATS = {".parquet": "parquet", ".feather": "feather", ".arrow": "feather", ".ipc": "feather"}
+SCHEMAS = {
+    "full": {"floats": "float64", "pump_codes": False, "time_range": False},
+    "compact": {"floats": "float32", "pump_codes": True, "time_range": True},
+}
+
+def resolve(schema) -> dict:
+    # Name of a schema or a dict of overrides of the full schema, "types" maps columns to their own dtypes
+    if isinstance(schema, str):
+        if schema not in SCHEMAS:
+            raise ValueError(f"Unknown output schema: {schema}, expected one of {list(SCHEMAS)}")
+        schema = SCHEMAS[schema]
+    return dict(SCHEMAS["full"], types={}, **schema)
+
+def file_format(path) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unknown results file extension: {extension}, expected one of {list(FORMATS)}")
+    return FORMATS[extension]
+
+def _time_range(time) -> dict:
+    # start + step of a regular time column, repeated once per scenario in batch tables, None if irregular
+    ns = pd.DatetimeIndex(time).as_unit("ns").asi8
+    if len(ns) < 2:
+        return None
+    restarts = np.flatnonzero(np.diff(ns) <= 0)
+    periods = int(restarts[0]) + 1 if len(restarts) else len(ns)
+    if periods < 2 or len(ns) % periods:
+        return None
+    step = int(ns[1] - ns[0])
+    if not np.array_equal(ns, np.tile(ns[0] + step*np.arange(periods), len(ns)//periods)):
+        return None
+    return {"start": int(ns[0]), "step": step, "periods": periods, "repeat": len(ns)//periods,
+            "tz": str(time.dt.tz) if time.dt.tz is not None else None}
+
+def encode(df: pd.DataFrame, schema="compact"):
+    # Arrow table of the results in the given schema, how to decode it is kept in the schema metadata
+    import pyarrow as pa
+    schema = resolve(schema)
+    if df.index.name == "Time":
+        df = df.reset_index()
+    metadata = {"time": None, "pump": {}}
+    arrays = {}
+    for column in df.columns:
+        values = df[column]
+        if column == "Time" and schema["time_range"]:
+            metadata["time"] = _time_range(values)
+            if metadata["time"] is not None:
+                continue
+        if column in PUMP_COLUMNS and schema["pump_codes"]:
+            levels, codes = np.unique(values.to_numpy(), return_inverse=True)
+            if len(levels) <= MAX_LEVELS:
+                arrays[column] = codes.astype(np.int8)
+                metadata["pump"][column] = levels.tolist()
+                continue
+        dtype = schema["types"].get(column, schema["floats"] if values.dtype.kind == "f" else None)
+        arrays[column] = values.to_numpy(dtype) if dtype else values
+    return pa.table(arrays).replace_schema_metadata({METADATA_KEY: json.dumps(metadata).encode()})
+
+def decode(table, columns=None, offset=0) -> pd.DataFrame:
+    # Results dataframe of an encoded table, tables without schema metadata are converted as they are.
+    # offset is the first stored row in table when it is a slice of the stored table.
+    metadata = (table.schema.metadata or {}).get(METADATA_KEY)
+    # split_blocks lets numeric columns without nulls share the Arrow buffers
+    df = table.to_pandas(split_blocks=True)
+    if metadata is None:
+        return df
+    metadata = json.loads(metadata)
+    for column, levels in metadata["pump"].items():
+        if column in df:
+            df[column] = np.asarray(levels)[df[column].to_numpy()]
+    time = metadata["time"]
+    if time is not None and (columns is None or "Time" in columns):
+        rows = (offset + np.arange(len(table), dtype=np.int64)) % time["periods"]
+        ns = time["start"] + time["step"]*rows
+        df.insert(0, "Time", pd.to_datetime(ns, utc=True).tz_convert(time["tz"]) if time["tz"] else pd.to_datetime(ns))
+    if columns is not None:
+        df = df[[column for column in columns if column in df]]
+    return df
+
+def write_results(df: pd.DataFrame, path, schema="compact", compression=None) -> str:
+    # zstd parquet by default, Feather is written uncompressed so it can be memory mapped without copies
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+    table = encode(df, schema)
+    if file_format(path) == "parquet":
+        pq.write_table(table, path, compression=compression or "zstd")
+    else:
+        feather.write_feather(table, path, compression=compression or "uncompressed")
+    return path
+
+def file_columns(path) -> list:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if file_format(path) == "parquet":
+        return pq.read_schema(path).names
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).schema.names
+
+def read_results(path, columns=None) -> pd.DataFrame:
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+    stored = None if columns is None else [column for column in columns if column in file_columns(path)]
+    if file_format(path) == "parquet":
+        table = pq.read_table(path, columns=stored, memory_map=True)
+    else:
+        table = feather.read_table(path, columns=stored, memory_map=True)
+    return decode(table, columns)
+
+def batch_frame(result) -> pd.DataFrame:
+    # engine.BatchResult as one long table, scenario after scenario
+    steps, scenarios = len(result.time), len(result)
+    df = pd.DataFrame({column: values.T.reshape(-1) for column, values in result.data.items()})
+    df.insert(0, "Scenario", np.repeat(np.arange(scenarios, dtype=np.int32), steps))
+    df.insert(0, "Time", np.tile(result.time.to_numpy(), scenarios))
+    return df
+
+def write_batch(result, path, schema="compact", compression=None) -> str:
+    return write_results(batch_frame(result), path, schema, compression)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+File: sensitivity.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Global sensitivity analysis of the system parameters. Ranks which
+inputs drive the tank temperature and the total heat loss with first-order and
+total Sobol indices.
+- Saltelli design: A and B matrices from a scrambled Sobol sequence plus one
+  A/B mix per parameter, N*(d + 2) model evaluations
+- Evaluations run through the batch engine in chunks on parallel workers and
+  are cached on disk by model hash, weather and design
+- First-order indices use the Saltelli (2010) estimator, total indices Jansen's,
+  both with bootstrap confidence intervals
+"""
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+import engine
+import inputs
+import system
+
+SENSITIVITY_DIR = "Outputs/sensitivity"
+PARAMETERS = [
+    "water_density", "water_specific_heat", "air_density", "air_specific_heat",
+    "air_heat_transfer_coeff_inside", "air_heat_transfer_coeff_outside", "water_in_pipe_heat_transfer_coeff",
+    "k_stainless_steal", "k_glass", "k_cast_iron", "k_fiberglass", "efficiency",
+    "panel_length", "panel_width", "panel_height", "tank_radius", "tank_height", "pipe_radius", "pipe_length",
+    "tank_wall_thickness", "glass_thickness", "pipe_wall_thickness", "insulation_thickness", "flow_rate_max",
+]
+OUTPUTS = ["Mean Tank Temperature", "Final Tank Temperature", "Total Heat Loss"]
+
+def default_bounds(parameters=PARAMETERS, spread=0.25, params=None) -> dict:
+    # Uniform +-spread around the current values
+    params = system.make_params(params)
+    return {name: (params[name]*(1 - spread), params[name]*(1 + spread)) for name in parameters}
+
+def saltelli_design(bounds: dict, n=256, seed=0):
+    # Returns the scaled A, B and AB (d, n, d) matrices
+    from scipy.stats import qmc
+    d = len(bounds)
+    low = np.array([b[0] for b in bounds.values()])
+    high = np.array([b[1] for b in bounds.values()])
+    base = qmc.Sobol(2*d, scramble=True, seed=seed).random(n)
+    A = low + base[:, :d]*(high - low)
+    B = low + base[:, d:]*(high - low)
+    AB = np.repeat(A[None], d, axis=0)
+    for i in range(d):
+        AB[i, :, i] = B[:, i]
+    return A, B, AB
+
+def _evaluate_chunk(weather_df, scenarios, seed, block=2016):
+    # Output metrics without keeping the time-series, the year is run in blocks
+    sim = engine.BatchEngine(scenarios, (weather_df.index[1] - weather_df.index[0]).total_seconds(), seed)
+    ghi, clear_ghi, oa_temp = engine.weather_arrays(weather_df)
+    tank_sum = np.zeros(sim.n)
+    loss_sum = np.zeros(sim.n)
+    for start in range(0, len(weather_df), block):
+        rows = slice(start, start + block)
+        result = sim.run_arrays(weather_df.index[rows], ghi[rows], clear_ghi[rows], oa_temp[rows],
+                                record=["Tank Temperatures", "Total Heat Losses"])
+        tank_sum += result.data["Tank Temperatures"].sum(axis=0)
+        loss_sum += result.data["Total Heat Losses"].sum(axis=0)
+    return np.column_stack([tank_sum/len(weather_df), sim.temperatures[2], loss_sum/1e6]) # [°C, °C, MJ]
+
+def evaluate(weather_df, names, X, params=None, chunk_size=1000, n_jobs=-1, seed=0) -> np.ndarray:
+    from joblib import Parallel, delayed
+    base = system.make_params(params)
+    scenarios = [dict(base, **dict(zip(names, row))) for row in X]
+    outputs = Parallel(n_jobs=n_jobs)(delayed(_evaluate_chunk)(weather_df, scenarios[i:i + chunk_size], seed)
+                                      for i in range(0, len(scenarios), chunk_size))
+    return np.concatenate(outputs)
+
+def sobol_indices(y_A, y_B, y_AB, n_bootstrap=200, confidence=0.95, seed=0):
+    # y_A, y_B (n,) and y_AB (d, n) for one output, standardized first which keeps the first-order estimator stable
+    center, scale = np.mean(np.concatenate([y_A, y_B])), np.std(np.concatenate([y_A, y_B])) or 1.0
+    y_A, y_B, y_AB = (y_A - center)/scale, (y_B - center)/scale, (y_AB - center)/scale
+
+    def estimate(a, b, ab):
+        variance = np.var(np.concatenate([a, b], axis=-1), axis=-1)[..., None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            first = np.mean(b[..., None, :]*(ab - a[..., None, :]), axis=-1)/variance
+            total = 0.5*np.mean((a[..., None, :] - ab)**2, axis=-1)/variance
+        return first, total
+
+    first, total = estimate(y_A, y_B, y_AB)
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(len(y_A), size=(n_bootstrap, len(y_A)))
+    boot_first, boot_total = estimate(y_A[idx], y_B[idx], np.moveaxis(y_AB[:, idx], 0, 1))
+    tails = [(1 - confidence)/2*100, (1 + confidence)/2*100]
+    return pd.DataFrame({
+        "S1": first,
+        "S1 low": np.percentile(boot_first, tails[0], axis=0),
+        "S1 high": np.percentile(boot_first, tails[1], axis=0),
+        "ST": total,
+        "ST low": np.percentile(boot_total, tails[0], axis=0),
+        "ST high": np.percentile(boot_total, tails[1], axis=0),
+    })
+
+def cache_path(weather_df, names, X, params) -> str:
+    import optimize
+    sha = hashlib.sha256(X.tobytes())
+    sha.update(repr((names, sorted(system.make_params(params).items(), key=str))).encode())
+    return os.path.join(SENSITIVITY_DIR, f"{engine.model_hash()}-{optimize.weather_key(weather_df)}-{sha.hexdigest()[:16]}.npy")
+
+def run_sensitivity(start='2022-07-01 00:00:00', end='2022-07-03 23:55:00', n=256, bounds=None, params=None,
+                    n_bootstrap=200, confidence=0.95, chunk_size=1000, n_jobs=-1, seed=0, use_cache=True,
+                    weather_df=None) -> dict:
+    # Zone temperature noise is turned off unless asked for, it only adds variance no parameter explains
+    params = dict({"zone_temp_noise": 0.0}, **(params or {}))
+    if weather_df is None:
+        weather_df = inputs.load_weather(start=start, end=end)
+    bounds = bounds or default_bounds(params=params)
+    names = list(bounds)
+    A, B, AB = saltelli_design(bounds, n, seed)
+    X = np.concatenate([A, B, AB.reshape(-1, len(names))])
+
+    path = cache_path(weather_df, names, X, params)
+    if use_cache and os.path.exists(path):
+        Y = np.load(path)
+    else:
+        Y = evaluate(weather_df, names, X, params, chunk_size, n_jobs, seed)
+        if use_cache:
+            os.makedirs(SENSITIVITY_DIR, exist_ok=True)
+            np.save(path, Y)
+
+    results = {}
+    for j, output in enumerate(OUTPUTS):
+        y = Y[:, j]
+        indices = sobol_indices(y[:n], y[n:2*n], y[2*n:].reshape(len(names), n), n_bootstrap, confidence, seed)
+        indices.index = pd.Index(names, name="Parameter")
+        results[output] = indices.sort_values("ST", ascending=False)
+    return results
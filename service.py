@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+"""
+File: service.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Local HTTP/JSON simulation service for consumers that shouldn't
+import main or share the Outputs folder. Only the standard library http.server
+is used, so it runs on localhost with no external services.
+- POST /simulate with {"start", "end", "params", "record", "every", "seed",
+  "format"} returns the results as parquet (default) or Arrow stream bytes
+- Identical in-flight requests are coalesced onto one result
+- Requests with the same period, columns and recording interval that arrive
+  within batch_window seconds are micro-batched into one batch engine run on a
+  process pool; every scenario gets its own noise seed so its result doesn't
+  depend on what it was batched with
+- Finished results are kept in an LRU cache bounded by size in bytes
+- GET /metrics returns queue depth, cache and coalescing counts, batch sizes
+  and latency percentiles; GET /health is a liveness check
+"""
+import collections
+import io
+import json
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+import engine
+import inputs
+import policies
+import system
+from main import OUTPUT_COLUMNS
+
+FORMATS = {"parquet": "application/vnd.apache.parquet", "arrow": "application/vnd.apache.arrow.stream"}
+REQUEST_DEFAULTS = {
+    "start": "2022-07-01 00:00:00",
+    "end": "2022-07-03 23:55:00",
+    "params": {},
+    "record": OUTPUT_COLUMNS,
+    "every": 1,
+    "seed": 0,
+    "format": "parquet",
+}
+
+def normalize(request: dict) -> dict:
+    # Validated request with every field filled in, raises ValueError/KeyError for bad requests
+    unknown = set(request) - set(REQUEST_DEFAULTS)
+    if unknown:
+        raise KeyError(f"Unknown request fields: {sorted(unknown)}")
+    request = dict(REQUEST_DEFAULTS, **request)
+    request["params"] = {name: value for name, value in system.make_params(request["params"]).items()
+                         if name in request["params"]}
+    policies.from_params(system.make_params(request["params"]))
+    request["record"] = list(request["record"])
+    missing = set(request["record"]) - set(OUTPUT_COLUMNS)
+    if missing:
+        raise KeyError(f"Unknown output columns: {sorted(missing)}")
+    if request["format"] not in FORMATS:
+        raise ValueError(f"format must be one of {list(FORMATS)}")
+    request["every"] = int(request["every"])
+    request["seed"] = int(request["seed"])
+    request["start"], request["end"] = check_period(request["start"], request["end"])
+    return request
+
+def check_period(start, end):
+    # The period must cover at least two weather steps, the step length comes from the first two
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if pd.isna(start) or pd.isna(end):
+        raise ValueError("start and end are required")
+    if start > end:
+        raise ValueError(f"start {start} is after end {end}")
+    index = inputs.load_weather().index
+    if start < index[0] or end > index[-1]:
+        raise ValueError(f"The period {start} to {end} is outside the weather data, {index[0]} to {index[-1]}")
+    rows = index.slice_indexer(start, end)
+    if rows.stop - rows.start < 2:
+        raise ValueError(f"The period {start} to {end} covers less than two simulation steps")
+    return str(start), str(end)
+
+def request_key(request: dict) -> str:
+    return json.dumps(request, sort_keys=True, default=str)
+
+def batch_key(request: dict) -> str:
+    # Requests with the same key can share one batch engine run
+    return json.dumps([request["start"], request["end"], request["record"], request["every"]], default=str)
+
+def _run_batch(start, end, scenarios, seeds, record, every):
+    # Runs in a pool worker, weather is read once per worker process and reused
+    weather_df = inputs.load_weather(start=start, end=end)
+    step_seconds = (weather_df.index[1] - weather_df.index[0]).total_seconds()
+    sim = engine.BatchEngine(scenarios, step_seconds, scenario_seeds=seeds)
+    result = sim.run(weather_df, record, every=every)
+    return result.time, result.data
+
+def to_bytes(df: pd.DataFrame, format="parquet") -> bytes:
+    buffer = io.BytesIO()
+    if format == "parquet":
+        df.to_parquet(buffer, index=False)
+    else:
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.ipc.new_stream(buffer, table.schema) as writer:
+            writer.write_table(table)
+    return buffer.getvalue()
+
+class ResultCache:
+    # LRU of result bytes, bounded by total size
+    def __init__(self, max_bytes=256*2**20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.items:
+                self.size -= len(self.items.pop(key))
+            self.items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= len(evicted)
+
+class SimulationService:
+    def __init__(self, max_workers=2, batch_window=0.02, max_batch=64, cache_bytes=256*2**20, latency_window=1000):
+        self.max_workers = max_workers
+        self.pool = self._new_pool()
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache = ResultCache(cache_bytes)
+        self.lock = threading.Condition()
+        self.pending = [] # (key, request, future) waiting to be batched
+        self.in_flight = {} # request key -> future, for coalescing
+        self.running = 0 # requests in batches on the pool
+        self.latencies = collections.deque(maxlen=latency_window)
+        self.batch_sizes = collections.deque(maxlen=latency_window)
+        self.counts = collections.Counter()
+        self.closed = False
+        self.batcher = threading.Thread(target=self._batch_loop, daemon=True)
+        self.batcher.start()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        import multiprocessing
+        return ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_pool(self, broken):
+        # A worker died: later batches go to a fresh pool, the broken one is shut down
+        with self.lock:
+            if self.pool is not broken or self.closed:
+                return
+            self.pool = self._new_pool()
+            self.counts["pool restarts"] += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def submit(self, request: dict) -> Future:
+        request = normalize(request)
+        key = request_key(request)
+        self._count("requests")
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._count("cache hits")
+            future = Future()
+            future.set_result(cached)
+            return future
+        with self.lock:
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.counts["coalesced"] += 1
+                return future
+            future = Future()
+            future.submitted = time.perf_counter()
+            self.in_flight[key] = future
+            self.pending.append((key, request, future))
+            self.lock.notify()
+        return future
+
+    def _batch_loop(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.closed:
+                    self.lock.wait()
+                if self.closed:
+                    return
+            # Give compatible requests a moment to arrive
+            time.sleep(self.batch_window)
+            with self.lock:
+                pending, self.pending = self.pending, []
+                self.running += len(pending)
+            groups = collections.defaultdict(list)
+            for item in pending:
+                groups[batch_key(item[1])].append(item)
+            for items in groups.values():
+                for i in range(0, len(items), self.max_batch):
+                    batch = items[i:i + self.max_batch]
+                    try:
+                        self._start_batch(batch)
+                    except Exception as error:
+                        # e.g. a broken pool, the batch fails instead of taking the batcher down with it
+                        self._finish_batch(batch, error=error)
+
+    def _start_batch(self, items):
+        first = items[0][1]
+        scenarios = [request["params"] for _, request, _ in items]
+        seeds = [request["seed"] for _, request, _ in items]
+        self._count("batches")
+        self.batch_sizes.append(len(items))
+        pool = self.pool
+        try:
+            job = pool.submit(_run_batch, first["start"], first["end"], scenarios, seeds, first["record"], first["every"])
+        except BrokenProcessPool:
+            self._replace_pool(pool)
+            raise
+        job.add_done_callback(lambda job: self._finish_batch(items, job, pool))
+
+    def _finish_batch(self, items, job=None, pool=None, error=None):
+        # Every request of the batch is resolved, with its result or the error
+        if error is None:
+            try:
+                index, data = job.result()
+            except BrokenProcessPool as broken:
+                self._replace_pool(pool)
+                error = broken
+            except Exception as failed:
+                error = failed
+        for k, (key, request, future) in enumerate(items):
+            try:
+                if error is not None:
+                    raise error
+                df = pd.DataFrame({column: values[:, k] for column, values in data.items()})
+                df.insert(0, "Time", index)
+                value = to_bytes(df, request["format"])
+                self.cache.put(key, value)
+                future.set_result(value)
+            except Exception as failed:
+                future.set_exception(failed)
+                self._count("errors")
+            finally:
+                with self.lock:
+                    self.in_flight.pop(key, None)
+                    self.running -= 1
+                self.latencies.append(time.perf_counter() - future.submitted)
+
+    def metrics(self) -> dict:
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        with self.lock:
+            queue = {"pending": len(self.pending), "running": self.running, "in flight": len(self.in_flight)}
+        return dict(queue, **self.counts,
+                    **{"cache entries": len(self.cache.items), "cache bytes": self.cache.size,
+                       "mean batch size": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+                       "latency p50 [s]": float(np.percentile(latencies, 50)),
+                       "latency p95 [s]": float(np.percentile(latencies, 95)),
+                       "latency p99 [s]": float(np.percentile(latencies, 99))})
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.lock.notify()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+def make_handler(service: SimulationService, timeout=600):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body: bytes, content_type="application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, status, value):
+            self._send(status, json.dumps(value).encode())
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._send_json(200, service.metrics())
+            elif self.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            else:
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/simulate":
+                return self._send_json(404, {"error": f"Unknown path {self.path}"})
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                future = service.submit(request)
+            except (ValueError, KeyError, TypeError) as error:
+                return self._send_json(400, {"error": str(error)})
+            try:
+                body = future.result(timeout)
+            except Exception as error:
+                return self._send_json(500, {"error": str(error)})
+            self._send(200, body, FORMATS[request.get("format", "parquet")])
+
+        def log_message(self, format, *args):
+            pass # metrics are on /metrics, keep the console quiet
+
+    return Handler
+
+def serve(host="127.0.0.1", port=8765, **kwargs):
+    service = SimulationService(**kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"Simulation service on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.close()
+
+def fetch(url="http://127.0.0.1:8765", **request) -> pd.DataFrame:
+    # Client helper: runs a simulation through the service and returns the results dataframe
+    import urllib.request
+    body = json.dumps(request, default=str).encode()
+    with urllib.request.urlopen(urllib.request.Request(f"{url}/simulate", body, {"Content-Type": "application/json"})) as response:
+        data = response.read()
+    if request.get("format", "parquet") == "arrow":
+        import pyarrow as pa
+        return pa.ipc.open_stream(data).read_all().to_pandas()
+    return pd.read_parquet(io.BytesIO(data))
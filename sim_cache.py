@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+File: sim_cache.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Process-wide simulation result manager for the Streamlit app. All
+sessions share one cache, so when several users open the dashboard the default
+scenarios are simulated once.
+- Single-flight: concurrent identical requests subscribe to the one run in
+  progress instead of starting their own, every subscriber gets its progress
+  and result blocks (the blocks so far are replayed to late subscribers)
+- A subscriber that cancels only detaches, the run stops once every subscriber
+  has cancelled
+- Results are held in memory in an LRU bounded by entries and bytes, runs never
+  write to the shared Outputs files
+- Keys include the model hash, so results are recomputed when the physics change
+- Thread-safe across Streamlit script threads; inside the app the manager is a
+  st.cache_resource, elsewhere a module level singleton
+"""
+import collections
+import json
+import sys
+import threading
+from concurrent.futures import Future
+from main import SimulationCancelled
+
+class _Flight:
+    # One run in progress and the callers subscribed to it
+    def __init__(self):
+        self.future = Future()
+        self.lock = threading.Lock()
+        self.subscribers = [] # _Subscriber
+        self.blocks = [] # blocks so far, replayed to late subscribers
+        self.last_progress = None
+        self.closed = False # set once every subscriber cancelled, no one can subscribe after that
+
+    def subscribe(self, subscriber) -> bool:
+        with self.lock:
+            if self.closed:
+                return False
+            if self.last_progress is not None:
+                subscriber.progress(*self.last_progress)
+            for block in self.blocks:
+                subscriber.on_block(block)
+            self.subscribers.append(subscriber)
+            return True
+
+    def progress(self, done, total) -> bool:
+        # Progress callback of the run, returns False once every subscriber has cancelled
+        with self.lock:
+            self.last_progress = (done, total)
+            self.subscribers = [subscriber for subscriber in self.subscribers if subscriber.progress(done, total)]
+            self.closed = not self.subscribers
+            return not self.closed
+
+    def add_block(self, block):
+        with self.lock:
+            self.blocks.append(block)
+            for subscriber in self.subscribers:
+                subscriber.on_block(block)
+
+class _Subscriber:
+    def __init__(self, progress=None, on_block=None):
+        self._progress = progress
+        self._on_block = on_block
+        self.detached = threading.Event()
+
+    def progress(self, done, total) -> bool:
+        # False once the caller cancelled, or its callback failed, then it's dropped from the run
+        if self._progress is None or self.detached.is_set():
+            return not self.detached.is_set()
+        try:
+            keep = self._progress(done, total) is not False
+        except Exception:
+            keep = False
+        if not keep:
+            self.detached.set()
+        return keep
+
+    def on_block(self, block):
+        if self._on_block is not None and not self.detached.is_set():
+            try:
+                self._on_block(block)
+            except Exception:
+                self.detached.set()
+
+class SimulationCache:
+    def __init__(self, max_entries=32, max_bytes=512*2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.results = collections.OrderedDict() # key -> (value, bytes)
+        self.size = 0
+        self.in_flight = {} # key -> _Flight of the run in progress
+        self.counts = collections.Counter()
+
+    def get(self, key, compute, progress=None, on_block=None):
+        # compute(progress, on_block) runs once per key at a time on its own thread, every caller subscribes to it.
+        # A caller's progress returning False detaches it with SimulationCancelled, the run goes on for the others.
+        subscriber = _Subscriber(progress, on_block)
+        while True:
+            with self.lock:
+                if key in self.results:
+                    self.results.move_to_end(key)
+                    self.counts["hits"] += 1
+                    return self.results[key][0]
+                flight = self.in_flight.get(key)
+                start = flight is None or flight.closed
+                if start:
+                    flight = self.in_flight[key] = _Flight()
+                    self.counts["misses"] += 1
+                else:
+                    self.counts["waits"] += 1
+                # Subscribing under the cache lock, a run can't start emitting before its first subscriber is in
+                subscribed = flight.subscribe(subscriber)
+            if subscribed:
+                break
+        if start:
+            threading.Thread(target=self._run, args=(key, flight, compute), name="simulation-flight", daemon=True).start()
+
+        while True:
+            try:
+                return flight.future.result(timeout=0.2)
+            except TimeoutError:
+                pass
+            except SimulationCancelled:
+                if subscriber.detached.is_set():
+                    raise
+                # Closed by the others' cancels as this caller joined, it still wants the result
+                return self.get(key, compute, progress, on_block)
+            if subscriber.detached.is_set():
+                raise SimulationCancelled("Caller cancelled, the run goes on for its other subscribers")
+
+    def _run(self, key, flight, compute):
+        try:
+            value = compute(flight.progress, flight.add_block)
+        except BaseException as error:
+            with self.lock:
+                if self.in_flight.get(key) is flight:
+                    del self.in_flight[key]
+            flight.future.set_exception(error)
+            return
+        self._store(key, value, flight)
+        flight.future.set_result(value)
+
+    def _store(self, key, value, flight=None):
+        size = _nbytes(value)
+        with self.lock:
+            if self.in_flight.get(key) is flight:
+                del self.in_flight[key]
+            if size > self.max_bytes:
+                return
+            self.results[key] = (value, size)
+            self.size += size
+            while len(self.results) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted) = self.results.popitem(last=False)
+                self.size -= evicted
+                self.counts["evictions"] += 1
+
+    def run_sim(self, start='2022-07-01 00:00:00', end='2022-07-03 23:55:00', sim_step='5min', clouds=None, heat_loss=None,
+                pump_control=None, flow_rate_max=None, params=None, progress=None, on_block=None):
+        # Results dataframe of main.run_sim(), shared between sessions so callers mustn't modify it.
+        # progress and on_block follow the run whether this caller started it or joined another caller's.
+        import engine
+        import main
+        import system
+        params = system.run_params(params, clouds=clouds, heat_loss=heat_loss, pump_control=pump_control, flow_rate_max=flow_rate_max)
+        key = json.dumps(["run_sim", engine.model_hash(), str(start), str(end), sim_step, params], sort_keys=True, default=str)
+        return self.get(key, lambda progress, on_block: main.run_sim(start=start, end=end, sim_step=sim_step,
+                                                                     output_path=None, params=params,
+                                                                     progress=progress, on_block=on_block),
+                        progress, on_block)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counts, entries=len(self.results), bytes=self.size, running=len(self.in_flight))
+
+def _nbytes(value) -> int:
+    if hasattr(value, "memory_usage"):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    return sys.getsizeof(value)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def _new_cache() -> SimulationCache:
+    return SimulationCache()
+
+def get_cache() -> SimulationCache:
+    # One manager per process: a cache_resource inside the app, a module singleton elsewhere
+    global _cache
+    if "streamlit" in sys.modules:
+        import streamlit as st
+        return st.cache_resource(show_spinner=False)(_new_cache)()
+    with _cache_lock:
+        if _cache is None:
+            _cache = _new_cache()
+        return _cache
+
+def run_sim(**kwargs):
+    return get_cache().run_sim(**kwargs)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+File: system.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Default parameters of the solar hot water system and a builder that
+turns a set of parameters into model components. Both the step by step
+simulation in main.py and the batch engine build their systems here so they
+always simulate the same physics.
+"""
+import components as comps
+
+DEFAULTS = {
+    # Operation
+    "clouds": 1, # 1 = GHI, -1 = Clearsky GHI, 0 = no sun
+    "heat_loss": True,
+    "pump_control": 2, # 0 = no pump, 1 = constant pump, 2 = variable pump, 3 = model predictive control
+    "flow_rate_max": 0.00063, # [m^3/s] ~10gpm
+    "pump_delta": 0.0, # [°C] the variable pump runs when the supply pipe is at least this much warmer than the tank
+    "pump_policy": None, # policy dict from policies.py, overrides pump_control when set
+    "pump_power": 120, # [W] electric power of the pump at flow_rate_max
+    "mpc": None, # settings of the model predictive controller used by pump_control 3, see mpc.py
+
+    # Physical properties
+    "water_density": 100, # density of water at 4°C [kg/m^3]
+    "water_specific_heat": 4184, # specific heat of water at 20°C [J/kg°C]
+    "air_density": 0.985, # density of air at 5000ft, 70°F, 29.7 inHg, 47% RH [kg/m^3]
+    "air_specific_heat": 1.006, # specific heat of air at 20°C [J/kg°C]
+    "air_heat_transfer_coeff_inside": 10, # heat transfer coefficient of air [W/m^2*K]
+    "air_heat_transfer_coeff_outside": 50, # heat transfer coefficient of air [W/m^2*K]
+    "water_in_pipe_heat_transfer_coeff": 1000, # heat transfer coefficient of water in pipe [W/m^2*K]
+    "k_stainless_steal": 17, # Thermal conductivity of stainless steel [W/m*K]
+    "k_glass": 1, # Thermal conductivity of glass [W/m*K]
+    "k_cast_iron": 80, # Thermal conductivity of cast iron [W/m*K]
+    "k_fiberglass": 0.036, # Thermal conductivity of fiberglass [W/m*K]
+    "efficiency": 0.8, # % of light energy converted to heat energy in the panel water
+
+    # Geometry
+    "panel_length": 2, # [m]
+    "panel_width": 1, # [m]
+    "panel_height": 0.1, # [m]
+    "tank_radius": 0.5, # [m]
+    "tank_height": 2, # [m]
+    "pipe_radius": 0.02, # [m]
+    "pipe_length": 2, # [m]
+    "tank_wall_thickness": 0.03, # [m]
+    "glass_thickness": 0.01, # [m]
+    "pipe_wall_thickness": 0.005, # [m]
+    "insulation_thickness": 0.03, # [m]
+
+    # Ambient air initial conditions
+    "oa_temp": 26.6667, # [°C] Outside ambient air temperature 80°F
+    "zone_temp": 21.111, # [°C] Inside ambient air temperature 70°F
+    "zone_temp_noise": 0.5, # [°C] random deviation of the inside temperature every time-step
+}
+
+def make_params(params=None, **overrides) -> dict:
+    merged = dict(DEFAULTS)
+    for source in (params or {}), overrides:
+        unknown = set(source) - set(DEFAULTS)
+        if unknown:
+            raise KeyError(f"Unknown system parameters: {sorted(unknown)}")
+        merged.update(source)
+    return merged
+
+def run_params(params=None, **keywords) -> dict:
+    # Keyword arguments of run_sim style functions (clouds, heat_loss, ...) override params only when they're given
+    return make_params(params, **{key: value for key, value in keywords.items() if value is not None})
+
+def build_system(params: dict) -> dict:
+    # Materials
+    tank_stainless_steal = comps.Material(params["k_stainless_steal"], params["zone_temp"], params["tank_wall_thickness"])
+    panel_glass = comps.Material(params["k_glass"], params["oa_temp"], params["glass_thickness"])
+    cast_iron_pipe = comps.Material(params["k_cast_iron"], params["oa_temp"], params["pipe_wall_thickness"])
+    k_fiberglass_insulation = comps.Material(params["k_fiberglass"], params["zone_temp"], params["insulation_thickness"])
+
+    sun = comps.Sun()
+    pump = comps.Pump(params["flow_rate_max"])
+
+    # Fluids
+    water = (params["water_density"], params["water_specific_heat"])
+    water_h = params["water_in_pipe_heat_transfer_coeff"]
+    outside_air = comps.Fluid("OA", params["air_density"], params["air_specific_heat"], params["oa_temp"], heat_transfer_coefficient=params["air_heat_transfer_coeff_outside"])
+    zone_air = comps.Fluid("ZN", params["air_density"], params["air_specific_heat"], params["zone_temp"], heat_transfer_coefficient=params["air_heat_transfer_coeff_inside"])
+    panel_water = comps.Fluid("Panel water", *water, params["oa_temp"], heat_transfer_coefficient=water_h)
+    supply_hw = comps.Fluid("HWS", *water, params["oa_temp"], heat_transfer_coefficient=water_h)
+    tank_water = comps.Fluid("Tank water", *water, params["zone_temp"], heat_transfer_coefficient=water_h)
+    return_hw = comps.Fluid("HWR", *water, params["oa_temp"], heat_transfer_coefficient=water_h)
+
+    # Containers
+    panel = comps.SolarPanel(panel_water, panel_glass, outside_air, params["panel_length"], params["panel_width"], params["panel_height"])
+    panel.efficiency = params["efficiency"]
+    supply_pipe = comps.Pipe(supply_hw, cast_iron_pipe, outside_air, params["pipe_radius"], params["pipe_length"], k_fiberglass_insulation)
+    tank = comps.Tank(tank_water, tank_stainless_steal, zone_air, params["tank_radius"], params["tank_height"], k_fiberglass_insulation)
+    return_pipe = comps.Pipe(return_hw, cast_iron_pipe, outside_air, params["pipe_radius"], params["pipe_length"], k_fiberglass_insulation)
+
+    # Put Water in containers
+    panel.fluid.add_container(panel)
+    supply_pipe.fluid.add_container(supply_pipe)
+    tank.fluid.add_container(tank)
+    return_pipe.fluid.add_container(return_pipe)
+
+    return {
+        "sun": sun,
+        "pump": pump,
+        "outside_air": outside_air,
+        "zone_air": zone_air,
+        "panel": panel,
+        "supply_pipe": supply_pipe,
+        "tank": tank,
+        "return_pipe": return_pipe,
+    }
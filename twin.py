@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+File: twin.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Online digital twin. The system is built once and advanced one
+weather tick at a time, so a live installation can be shadowed in real time
+from a stream instead of a saved weather file.
+- step(tick) does a fixed amount of work per tick: no dataframes, no file reads
+- A tick is a dict (or json line, or csv row) with the time, GHI, Clearsky GHI
+  and outside air Temperature and optionally measured temperatures, e.g.
+  "Tank Temperatures"
+- Measured temperatures nudge the model state toward the measurement
+  (Newtonian relaxation): T += nudging*(measured - T)
+- Ticks that aren't step_seconds apart are simulated with the step factors of
+  their own spacing
+- Sources: replay() of a weather dataframe, tail_csv() of a growing csv file
+  and socket_lines() of json lines over TCP
+"""
+import json
+import time
+import numpy as np
+import pandas as pd
+import engine
+from main import OUTPUT_COLUMNS
+
+class DigitalTwin:
+    def __init__(self, params=None, step_seconds=300.0, nudging=0.5, seed=None):
+        self.engine = engine.BatchEngine([params or {}], step_seconds, seed)
+        self.params = self.engine.scenarios[0]
+        self.step_seconds = step_seconds
+        self.nudging = nudging
+        self._factors = {step_seconds: engine.step_factors(self.engine.coeffs, step_seconds)}
+        self.time = None
+        self.ticks = 0
+        self.innovations = {} # column -> last measured - predicted
+
+    def _set_step(self, seconds):
+        if seconds not in self._factors:
+            self._factors[seconds] = engine.step_factors(self.engine.coeffs, seconds)
+        for name, value in self._factors[seconds].items():
+            setattr(self.engine, f"_{name}", value)
+        self.engine.step_seconds = seconds
+
+    def step(self, tick: dict) -> dict:
+        now = pd.Timestamp(tick["Time"])
+        seconds = self.step_seconds if self.time is None else (now - self.time).total_seconds()
+        if seconds <= 0:
+            raise ValueError(f"Tick at {now} is not after the previous tick at {self.time}")
+        if seconds != self.engine.step_seconds:
+            self._set_step(seconds)
+        ghi = float(tick["GHI"])
+        clear_ghi = float(tick.get("Clearsky GHI", ghi))
+        outputs = self.engine.step(ghi, clear_ghi, float(tick["Temperature"]), hour=now.hour)[:, 0]
+
+        # Nudge the state toward whatever was measured this tick
+        for row, column in enumerate(engine.TEMPERATURE_COLUMNS):
+            measured = tick.get(column)
+            if measured is None or measured == "" or np.isnan(float(measured)):
+                continue
+            innovation = float(measured) - self.engine.temperatures[row, 0]
+            self.innovations[column] = innovation
+            self.engine.temperatures[row, 0] += self.nudging*innovation
+            outputs[row] = self.engine.temperatures[row, 0]
+
+        self.time = now
+        self.ticks += 1
+        result = dict(zip(OUTPUT_COLUMNS, outputs.tolist()))
+        result["Time"] = now
+        return result
+
+    def run(self, ticks):
+        # Generator of the outputs of every tick, ticks can be an endless stream
+        for tick in ticks:
+            yield self.step(tick)
+
+    def state(self) -> dict:
+        return dict(zip(engine.TEMPERATURE_COLUMNS, self.engine.temperatures[:, 0].tolist()), Time=self.time)
+
+# ----------------------------- Tick sources --------------------------------------
+def replay(weather_df: pd.DataFrame, measured=None, realtime=False):
+    # Ticks of a saved weather file, with measured temperatures joined on time if given
+    if measured is not None:
+        weather_df = weather_df.join(measured, how="left")
+    columns = list(weather_df.columns)
+    step_seconds = (weather_df.index[1] - weather_df.index[0]).total_seconds() if len(weather_df) > 1 else 0
+    for row in weather_df.itertuples(name=None):
+        tick = dict(zip(columns, row[1:]))
+        tick["Time"] = row[0]
+        yield tick
+        if realtime:
+            time.sleep(step_seconds)
+
+def tail_csv(path, follow=True, poll_seconds=1.0):
+    # Rows of a csv file as dicts, waits for new rows at the end of the file like `tail -f`.
+    # The time is the Time column or else the first column.
+    with open(path) as f:
+        header = f.readline().strip().split(",")
+        if "Time" not in header:
+            header[0] = "Time"
+        partial = ""
+        while True:
+            line = f.readline()
+            if not line:
+                if not follow:
+                    return
+                time.sleep(poll_seconds)
+                continue
+            partial += line
+            if not partial.endswith("\n"):
+                continue # the writer hasn't finished the row yet
+            values = partial.strip().split(",")
+            partial = ""
+            if len(values) == len(header):
+                yield {name: value if name == "Time" else (float(value) if value else None) for name, value in zip(header, values)}
+
+def socket_lines(host="localhost", port=9999):
+    # json ticks, one per line, from a TCP stream
+    import socket
+    with socket.create_connection((host, port)) as connection:
+        for line in connection.makefile("r"):
+            if line.strip():
+                yield json.loads(line)
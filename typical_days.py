@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+File: typical_days.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Representative-day compression of a weather year for fast annual
+estimates. The days of a weather file are clustered into K typical days and
+only those are simulated, each weighted by the number of days it stands for.
+- Days are compared on their hourly GHI and outside air Temperature profiles,
+  both standardized, and clustered with k-medoids so every typical day is a
+  real day of the file
+- Clusterings are cached per weather file content, period, K and seed under
+  Outputs/typical_days/
+- All typical days of all scenarios run side by side in one batch engine.
+  Each typical day is preceded by a warm-up over the real days before it, so
+  it starts from the tank state it had in the full run. Without a warm-up the
+  days are chained instead (each starts where the typical day of its previous
+  calendar day ended) and iterated with damping; chains can cycle without
+  settling, which the run reports as not converged
+- Annual solar gain, heat loss, pump hours and the tank temperature
+  distribution are rebuilt from the weighted days; compare() reports their
+  error and the speedup against a full run
+"""
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import engine
+import inputs
+import rollups
+import system
+
+CACHE_DIR = "Outputs/typical_days"
+PROFILE_COLUMNS = ["GHI", "Temperature"]
+TANK_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+METRICS = ["Solar Energy In [MJ]", "Total Heat Loss [MJ]", "Pump Hours", "Mean Tank Temperature"] + \
+          [f"Tank Temperature P{round(q*100)}" for q in TANK_QUANTILES]
+
+class TypicalDays:
+    def __init__(self, days, medoids, labels, cost):
+        self.days = days # DatetimeIndex of every complete day of the period
+        self.medoids = np.asarray(medoids) # day index of each typical day, in calendar order
+        self.labels = np.asarray(labels) # typical day of every day
+        self.cost = cost # sum of distances of the days to their typical day
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        return self.days[self.medoids]
+
+    @property
+    def weights(self) -> np.ndarray:
+        # Number of days each typical day stands for
+        return np.bincount(self.labels, minlength=len(self.medoids))
+
+def complete_days(weather_df: pd.DataFrame):
+    # (days, steps per day) of the days that have every time-step
+    step = weather_df.index[1] - weather_df.index[0]
+    steps_per_day = int(pd.Timedelta("1D")/step)
+    counts = weather_df.groupby(weather_df.index.normalize()).size()
+    return pd.DatetimeIndex(counts.index[counts == steps_per_day]), steps_per_day
+
+def day_features(weather_df: pd.DataFrame, days) -> np.ndarray:
+    # (days, 24*len(PROFILE_COLUMNS)) hourly profiles, every column standardized over the whole period
+    hourly = weather_df[PROFILE_COLUMNS].resample("h").mean()
+    hourly = (hourly - hourly.mean())/hourly.std().replace(0, 1)
+    hourly = hourly[hourly.index.normalize().isin(days)]
+    return hourly.to_numpy().reshape(len(days), 24, len(PROFILE_COLUMNS)).transpose(0, 2, 1).reshape(len(days), -1)
+
+def kmedoids(X, k, n_init=8, max_iter=100, seed=0):
+    # Alternating k-medoids with k-medoids++ starts, returns (medoids, labels, cost) of the best start
+    distances = np.sqrt(((X[:, None, :] - X[None, :, :])**2).sum(axis=2))
+    n = len(X)
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    best = None
+    for _ in range(n_init):
+        medoids = [int(rng.integers(n))]
+        for _ in range(k - 1):
+            nearest = distances[:, medoids].min(axis=1)**2
+            medoids.append(int(rng.choice(n, p=nearest/nearest.sum())) if nearest.sum() > 0 else int(rng.integers(n)))
+        medoids = np.array(medoids)
+        for _ in range(max_iter):
+            labels = np.argmin(distances[:, medoids], axis=1)
+            # Each cluster's new medoid is the member closest to all other members
+            updated = np.array([np.flatnonzero(labels == c)[np.argmin(distances[np.ix_(labels == c, labels == c)].sum(axis=1))]
+                                if (labels == c).any() else medoids[c] for c in range(k)])
+            if np.array_equal(updated, medoids):
+                break
+            medoids = updated
+        labels = np.argmin(distances[:, medoids], axis=1)
+        cost = float(distances[np.arange(n), medoids[labels]].sum())
+        if best is None or cost < best[2]:
+            best = (medoids, labels, cost)
+    # Typical days are kept in calendar order
+    medoids, labels, cost = best
+    order = np.argsort(medoids)
+    return medoids[order], np.argsort(order)[labels], cost
+
+def cache_path(weather_path, start, end, k, seed) -> str:
+    period = hashlib.sha256(f"{start}|{end}".encode()).hexdigest()[:8]
+    return os.path.join(CACHE_DIR, f"{rollups.file_hash(weather_path)}-{period}-k{k}-s{seed}.json")
+
+def cluster_days(k, weather_path=inputs.WEATHER_PATH, start=None, end=None, seed=0, n_init=8) -> TypicalDays:
+    # Clusterings only depend on the weather, so they are computed once per weather file and K
+    weather_df = inputs.load_weather(weather_path, start=start, end=end)
+    days, _ = complete_days(weather_df)
+    path = cache_path(weather_path, start, end, k, seed)
+    if os.path.exists(path):
+        with open(path) as f:
+            cached = json.load(f)
+        return TypicalDays(days, cached["medoids"], cached["labels"], cached["cost"])
+    medoids, labels, cost = kmedoids(day_features(weather_df, days), k, n_init, seed=seed)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"medoids": medoids.tolist(), "labels": labels.tolist(), "cost": cost,
+                   "dates": [str(day.date()) for day in days[medoids]]}, f)
+    return TypicalDays(days, medoids, labels, cost)
+
+def weighted_quantiles(values, weights, quantiles) -> np.ndarray:
+    order = np.argsort(values)
+    cumulative = np.cumsum(weights[order])
+    return np.interp(np.asarray(quantiles)*cumulative[-1], cumulative - weights[order]/2, values[order])
+
+def _metrics(solar, losses, pump_seconds, tank, weights) -> dict:
+    # Annual metrics of one scenario from per day totals and (steps, days) tank temperatures, days weighted
+    step_weights = np.broadcast_to(weights, tank.shape).reshape(-1).astype(float)
+    tank = tank.reshape(-1)
+    metrics = {
+        "Solar Energy In [MJ]": float(weights @ solar)/1e6,
+        "Total Heat Loss [MJ]": float(weights @ losses)/1e6,
+        "Pump Hours": float(weights @ pump_seconds)/3600,
+        "Mean Tank Temperature": float(np.average(tank, weights=step_weights)),
+    }
+    for q, value in zip(TANK_QUANTILES, weighted_quantiles(tank, step_weights, TANK_QUANTILES)):
+        metrics[f"Tank Temperature P{round(q*100)}"] = float(value)
+    return metrics
+
+def _run_days(sim, ghi, clear_ghi, oa_temp, hours, active, steps_per_day):
+    # Steps through (steps, columns) weather, columns hold their start state while inactive (before their warm-up).
+    # Returns the solar gain, heat loss, pump seconds and (steps, columns) tank temperatures of the last day.
+    held = sim.temperatures.copy()
+    gain_per_irradiance = sim.step_seconds*sim.coeffs["solar_gain"]
+    solar, losses, pump_seconds = np.zeros(sim.n), np.zeros(sim.n), np.zeros(sim.n)
+    tank = np.empty((steps_per_day, sim.n))
+    last_day = len(ghi) - steps_per_day
+    for i in range(len(ghi)):
+        outputs = sim.step(ghi[i], clear_ghi[i], oa_temp[i], hour=hours[i])
+        if active is not None and not active[i].all():
+            idle = ~active[i]
+            sim.temperatures[:, idle] = held[:, idle]
+            sim.policy.pump_on[idle] = False
+        if i >= last_day:
+            solar += outputs[6]*gain_per_irradiance
+            losses += outputs[11]
+            pump_seconds += (outputs[12] > 0)*sim.step_seconds
+            tank[i - last_day] = outputs[2]
+    return solar, losses, pump_seconds, tank
+
+def simulate_typical_days(typical: TypicalDays, weather_df: pd.DataFrame, scenarios, warm_up_days=7, max_iterations=20,
+                          tolerance=0.05, damping=0.5, seed=None):
+    # (metrics dataframe with one row per scenario, run info: passes, converged and simulated days per scenario)
+    # warm_up_days > 0: every typical day runs after the warm_up_days real days before it, starting from the
+    #   initial state (like the full run does at the start of the period), one pass.
+    # warm_up_days=0: every typical day starts where the typical day of the calendar day before it ended. The start
+    #   states are iterated, keeping `damping` of the old state every pass, until they change less than tolerance
+    #   [°C]; converged is False if they didn't within max_iterations, the chain of typical days can cycle.
+    if isinstance(scenarios, dict):
+        scenarios = [scenarios]
+    _, steps_per_day = complete_days(weather_df)
+    step_seconds = 86400/steps_per_day
+    k, n_scenarios = len(typical.medoids), len(scenarios)
+    arrays = engine.weather_arrays(weather_df)
+    day_rows = {day: rows for day, rows in pd.Series(np.arange(len(weather_df))).groupby(weather_df.index.normalize())}
+    hours = weather_df.index[day_rows[typical.dates[0]].to_numpy()].hour.to_numpy()
+
+    # Column s*k + d is typical day d of scenario s
+    sim = engine.BatchEngine([params for params in scenarios for _ in range(k)], step_seconds, seed)
+    if warm_up_days > 0:
+        # Right aligned windows of the typical day and the complete days before it
+        windows = [typical.days[max(m - warm_up_days, 0):m + 1] for m in typical.medoids]
+        length = max(len(window) for window in windows)*steps_per_day
+        weather = [np.zeros((length, k)) for _ in arrays]
+        active = np.zeros((length, k), dtype=bool)
+        for d, window in enumerate(windows):
+            rows = np.concatenate([day_rows[day].to_numpy() for day in window])
+            for values, column in zip(arrays, weather):
+                column[length - len(rows):, d] = values[rows]
+            active[length - len(rows):, d] = True
+        ghi, clear_ghi, oa_temp = (np.tile(values, n_scenarios) for values in weather)
+        solar, losses, pump_seconds, tank = _run_days(sim, ghi, clear_ghi, oa_temp, np.tile(hours, length//steps_per_day),
+                                                      np.tile(active, n_scenarios), steps_per_day)
+        info = {"passes": 1, "converged": True, "simulated days": sum(len(window) for window in windows)}
+    else:
+        rows = np.concatenate([day_rows[day].to_numpy() for day in typical.dates])
+        ghi, clear_ghi, oa_temp = (np.tile(values[rows].reshape(k, steps_per_day).T, n_scenarios) for values in arrays)
+        initial = sim.coeffs["initial_temperature"].copy()
+        # Typical day of the calendar day before each typical day, -1 for the first day of the period
+        day_index = {day: i for i, day in enumerate(typical.days)}
+        previous = np.array([typical.labels[day_index[day - pd.Timedelta("1D")]] if day - pd.Timedelta("1D") in day_index else -1
+                             for day in typical.dates])
+        columns = np.arange(k*n_scenarios)
+        previous = np.tile(previous, n_scenarios)
+        previous_columns = np.where(previous >= 0, columns - columns % k + previous, -1)
+
+        start_state = initial.copy()
+        noise_seed = np.random.default_rng(seed).integers(2**32)
+        converged = False
+        for iteration in range(1, max_iterations + 1):
+            # Same zone noise every pass so only the start states change between them
+            sim.reset()
+            sim.reseed(noise_seed)
+            sim.set_temperatures(start_state)
+            solar, losses, pump_seconds, tank = _run_days(sim, ghi, clear_ghi, oa_temp, hours, None, steps_per_day)
+            # Every day starts where the typical day of its previous calendar day ended
+            updated = np.where(previous_columns >= 0, sim.temperatures[:, previous_columns], initial)
+            converged = np.abs(updated - start_state).max() < tolerance
+            if converged:
+                break
+            start_state = damping*start_state + (1 - damping)*updated
+        info = {"passes": iteration, "converged": bool(converged), "simulated days": iteration*k}
+
+    weights = typical.weights
+    metrics = [_metrics(solar[s*k:(s + 1)*k], losses[s*k:(s + 1)*k], pump_seconds[s*k:(s + 1)*k], tank[:, s*k:(s + 1)*k], weights)
+               for s in range(n_scenarios)]
+    return pd.DataFrame(metrics, columns=METRICS), info
+
+def simulate_full(weather_df: pd.DataFrame, scenarios, seed=None) -> pd.DataFrame:
+    # Same metrics from a full run over every complete day, the reference for compare()
+    if isinstance(scenarios, dict):
+        scenarios = [scenarios]
+    days, steps_per_day = complete_days(weather_df)
+    weather_df = weather_df[weather_df.index.normalize().isin(days)]
+    step_seconds = 86400/steps_per_day
+    result = engine.simulate(weather_df, scenarios, record=["Tank Temperatures", "Solar Energy", "Total Heat Losses", "Flow Rates"],
+                             seed=seed)
+    sim_coeffs = engine.system_coefficients([system.make_params(params) for params in scenarios])
+    metrics = []
+    for s in range(len(scenarios)):
+        data = {column: values[:, s] for column, values in result.data.items()}
+        metrics.append(_metrics(np.array([data["Solar Energy"].sum()*step_seconds*sim_coeffs["solar_gain"][s]]),
+                                np.array([data["Total Heat Losses"].sum()]),
+                                np.array([(data["Flow Rates"] > 0).sum()*step_seconds]),
+                                data["Tank Temperatures"][:, None], np.ones(1)))
+    return pd.DataFrame(metrics, columns=METRICS)
+
+def compare(k, scenarios=None, weather_path=inputs.WEATHER_PATH, start=None, end=None, seed=0, warm_up_days=7) -> dict:
+    # Error of the typical day estimate against a full run, and what it saves
+    scenarios = scenarios or [{}]
+    weather_df = inputs.load_weather(weather_path, start=start, end=end)
+    timer = time.perf_counter()
+    typical = cluster_days(k, weather_path, start, end, seed)
+    clustered = time.perf_counter()
+    estimate, info = simulate_typical_days(typical, weather_df, scenarios, warm_up_days, seed=seed)
+    estimated = time.perf_counter()
+    full = simulate_full(weather_df, scenarios, seed=seed)
+    finished = time.perf_counter()
+
+    error = estimate - full
+    relative = error/full.abs().where(full.abs() > 0)
+    report = pd.concat({"full": full.T, "typical days": estimate.T, "error": error.T, "relative error": relative.T}, axis=1)
+    return {
+        "report": report,
+        "typical days": typical,
+        "passes": info["passes"],
+        "converged": info["converged"],
+        "simulated days": info["simulated days"],
+        "days": len(typical.days),
+        "cluster [s]": clustered - timer,
+        "typical days [s]": estimated - clustered,
+        "full run [s]": finished - estimated,
+        "speedup": (finished - estimated)/max(estimated - clustered, 1e-9),
+    }
+
+def error_curve(ks, scenarios=None, weather_path=inputs.WEATHER_PATH, start=None, end=None, seed=0, warm_up_days=7) -> pd.DataFrame:
+    # Largest relative error of every metric and the speedup for each K, to pick K
+    rows = {}
+    for k in ks:
+        result = compare(k, scenarios, weather_path, start, end, seed, warm_up_days)
+        relative = result["report"].xs("relative error", axis=1, level=0).abs().max(axis=1)
+        rows[k] = dict(relative, **{"speedup": result["speedup"], "simulated days": result["simulated days"],
+                                    "converged": result["converged"]})
+    curve = pd.DataFrame(rows).T
+    curve.index.name = "K"
+    return curve
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+File: writer.py
+Author: Andrew Klavekoske
+Last Updated: 2026-10-19
+
+Description: Background output writer, so a run returns while its results are
+still being written and long runs overlap simulation with I/O.
+- Writes are queued to one writer thread; the queue is bounded, so a producer
+  faster than the disk waits instead of holding every block in memory
+- Files are written to a temporary name, fsynced and renamed into place, a
+  reader never sees a partial file
+- flush() returns once everything queued so far is on disk and raises the first
+  write error; writers still open at exit are flushed
+- stats() reports files, rows and bytes written, write throughput and the
+  backlog (queued writes, the largest backlog and time producers waited)
+"""
+import atexit
+import os
+import queue
+import sys
+import threading
+import time
+import weakref
+import pandas as pd
+import schema
+
+_open_writers = weakref.WeakSet()
+
+class ResultWriter:
+    def __init__(self, max_queue=8):
+        self.queue = queue.Queue(max_queue)
+        self.lock = threading.Lock()
+        self.counts = {"files": 0, "rows": 0, "bytes": 0}
+        self.write_seconds = 0.0 # time the writer thread spent writing
+        self.wait_seconds = 0.0 # time producers waited on a full queue
+        self.max_backlog = 0
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._loop, name="result-writer", daemon=True)
+        self.thread.start()
+        _open_writers.add(self)
+
+    def submit(self, function, path, *args):
+        # function(temporary path, *args) writes one file, it's renamed to path once it's on disk
+        if self.closed:
+            raise RuntimeError("ResultWriter is closed")
+        start = time.perf_counter()
+        self.queue.put((function, path, args))
+        with self.lock:
+            self.wait_seconds += time.perf_counter() - start
+            self.max_backlog = max(self.max_backlog, self.queue.qsize())
+
+    def write_results(self, block, path, output_schema="full", compression=None):
+        # block is a results dataframe or a columnar dict from run_sim's on_block, encoded on the writer thread
+        self.submit(_write_results, path, block, output_schema, compression)
+
+    def write_batch(self, result, path, output_schema="compact", compression=None):
+        self.submit(_write_results, path, schema.batch_frame(result), output_schema, compression)
+
+    def write_png(self, sim_df, path):
+        import plotting
+        self.submit(_write_bytes, path, plotting.render_sim_png, sim_df)
+
+    def _loop(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                function, path, args = item
+                if self.error is None:
+                    start = time.perf_counter()
+                    rows = _durable_write(function, path, *args)
+                    with self.lock:
+                        self.write_seconds += time.perf_counter() - start
+                        self.counts["files"] += 1
+                        self.counts["rows"] += rows
+                        self.counts["bytes"] += os.path.getsize(path)
+            except Exception as error:
+                self.error = error # later writes are skipped, flush() raises it
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        # Blocks until every queued write is on disk
+        self.queue.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+            _open_writers.discard(self)
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            seconds = self.write_seconds
+            return dict(self.counts, **{
+                "write [s]": seconds,
+                "MB/s": self.counts["bytes"]/2**20/seconds if seconds else 0.0,
+                "rows/s": self.counts["rows"]/seconds if seconds else 0.0,
+                "backlog": self.queue.qsize(),
+                "max backlog": self.max_backlog,
+                "producer wait [s]": self.wait_seconds,
+            })
+
+def _durable_write(function, path, *args) -> int:
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    root, extension = os.path.splitext(path)
+    temporary = f"{root}.{os.getpid()}.{threading.get_ident()}.tmp{extension}"
+    try:
+        rows = function(temporary, *args)
+        with open(temporary, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return rows or 0
+
+def _write_results(path, block, output_schema, compression) -> int:
+    df = block if isinstance(block, pd.DataFrame) else pd.DataFrame(block)
+    schema.write_results(df, path, output_schema, compression)
+    return len(df)
+
+def _write_bytes(path, render, *args) -> int:
+    with open(path, "wb") as f:
+        f.write(render(*args))
+    return 0
+
+def partition_path(directory, index, extension=".parquet") -> str:
+    return os.path.join(directory, f"part-{index:05d}{extension}")
+
+@atexit.register
+def _flush_open_writers():
+    # Writes queued by a run are on disk before the process ends
+    for writer in list(_open_writers):
+        try:
+            writer.close()
+        except Exception as error:
+            print(f"Result writer failed: {error}", file=sys.stderr)